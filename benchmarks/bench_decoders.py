@@ -0,0 +1,82 @@
+"""
+Benchmark de backends QR/barcode.
+
+Mide la latencia por página (zona QR + zona barcode) de cada backend
+de `decoders` sobre los mismos recortes y verifica que todos lean lo
+mismo que zbarimg.
+
+Uso:
+    python benchmarks/bench_decoders.py factura.pdf [--pages 20] [--repeat 3]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from decoders import DECODERS  # noqa: E402
+from extract_qr_and_barcode import crop_qr_zone, crop_barcode_zone  # noqa: E402
+from image_converter import iter_pdf_images  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pdf")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # Solo se conservan los recortes que lee el decodificador
+    pages = []
+    for image in iter_pdf_images(args.pdf):
+        pages.append((crop_qr_zone(image), crop_barcode_zone(image)))
+        if len(pages) >= args.pages:
+            break
+
+    backends = []
+    for name, cls in DECODERS.items():
+        decoder = cls()
+        if decoder.available():
+            backends.append(decoder)
+        else:
+            print(f"- {name}: no disponible, se omite")
+
+    if not backends:
+        print("Ningún backend disponible")
+        return 1
+
+    results = {}
+    for decoder in backends:
+        # Calentamiento (carga de librerías, detectores, etc.)
+        decoder.decode(pages[0][0])
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            outputs = [
+                (decoder.decode(qr), decoder.decode(barcode))
+                for qr, barcode in pages
+            ]
+        elapsed = time.perf_counter() - start
+
+        ms_per_page = elapsed * 1000 / (len(pages) * args.repeat)
+        results[decoder.name] = (ms_per_page, outputs)
+
+    baseline = results.get("zbarimg")
+
+    print(f"\nPáginas: {len(pages)}  repeticiones: {args.repeat}\n")
+    print(f"{'backend':<10} {'ms/página':>10} {'speedup':>9} {'coincide':>9}")
+    for name, (ms, outputs) in results.items():
+        speedup = f"{baseline[0] / ms:.1f}x" if baseline else "-"
+        same = (
+            sum(a == b for a, b in zip(outputs, baseline[1]))
+            if baseline else None
+        )
+        same_text = f"{same}/{len(pages)}" if same is not None else "-"
+        print(f"{name:<10} {ms:>10.1f} {speedup:>9} {same_text:>9}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
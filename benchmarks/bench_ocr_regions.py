@@ -0,0 +1,199 @@
+"""
+Benchmark de OCR por recortes contra OCR multi-zona.
+
+Para cada página lee las mismas zonas de las dos formas y compara la
+latencia y lo extraído:
+- pasada 1: pie (número de página) + encabezado + No.FAC
+  ("crops": un OCR por zona; "multi": uno con las zonas apiladas)
+- pasada 2: franjas TOP + BOTTOM
+
+Las llamadas a Tesseract por página se cuentan envolviendo las
+funciones de `ocr_engine` que usa cada modo.
+
+Es el peor caso de la cascada (página sin QR/barcode ni atajo del
+encabezado). La caché de resultados se desactiva.
+
+Uso:
+    python benchmarks/bench_ocr_regions.py facturas.pdf [--pages 20] [--repeat 2]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+os.environ["SCANNER_CACHE"] = "0"
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from extract_codes import (  # noqa: E402
+    HEADER_ZONE, NO_FAC_ZONE, OCR_CONFIG, OCR_LANG, codes_from_header, normalize_ocr,
+)
+from image_converter import iter_pages  # noqa: E402
+from invoice_text_parser import (  # noqa: E402
+    extract_invoice_number_from_text, extract_ref_int_from_text,
+)
+import multi_roi_ocr  # noqa: E402
+from multi_roi_ocr import ocr_regions  # noqa: E402
+from ocr_engine import engine_version, image_to_data, image_to_string, warm_up  # noqa: E402
+from page_context import PageContext  # noqa: E402
+from pdf_processor import (  # noqa: E402
+    BOTTOM_ZONE, PAGE_NUMBER_ZONE, TOP_ZONE, extract_page_number,
+)
+
+
+class OcrCalls:
+    """
+    Cuenta las llamadas a Tesseract mientras está activo: envuelve las
+    funciones de `ocr_engine` tal como las importó cada módulo.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._patched = [
+            (sys.modules[__name__], "image_to_data"),
+            (sys.modules[__name__], "image_to_string"),
+            (multi_roi_ocr, "image_to_lines"),
+        ]
+        self._originals = []
+
+    def _wrap(self, function):
+        def counted(*args, **kwargs):
+            self.count += 1
+            return function(*args, **kwargs)
+        return counted
+
+    def __enter__(self):
+        for module, name in self._patched:
+            original = getattr(module, name)
+            self._originals.append((module, name, original))
+            setattr(module, name, self._wrap(original))
+        return self
+
+    def __exit__(self, *exc):
+        for module, name, original in self._originals:
+            setattr(module, name, original)
+        self._originals.clear()
+        return False
+
+
+def _regions(context: PageContext):
+    # Mismo preprocesamiento que el flujo: escala de grises o binarizada
+    first = [
+        ("page", context.binarized(PAGE_NUMBER_ZONE)),
+        ("header", context.gray_image(HEADER_ZONE)),
+        ("no_fac", context.gray_image(NO_FAC_ZONE)),
+    ]
+    second = [
+        ("top", context.binarized(TOP_ZONE)),
+        ("bottom", context.binarized(BOTTOM_ZONE)),
+    ]
+    return first, second
+
+
+def _extract(texts) -> dict:
+    header_text, header_words = texts["header"]
+    codes = codes_from_header(
+        normalize_ocr(header_text), header_words, lambda: normalize_ocr(texts["no_fac"][0])
+    )
+    return {
+        "page": extract_page_number(texts["page"][0]),
+        "no_header": codes["no_header"],
+        "ref_int": codes["ref_int"],
+        "no_fac": codes["no_fac"],
+        "ref_int_top": extract_ref_int_from_text(texts["top"][0]),
+        "invoice_bottom": extract_invoice_number_from_text(texts["bottom"][0]),
+    }
+
+
+def read_crops(first, second) -> dict:
+    texts = {}
+    for name, image in first + second:
+        if name == "header":
+            texts[name] = image_to_data(image, lang=OCR_LANG, config=OCR_CONFIG)
+        else:
+            texts[name] = (image_to_string(image, lang=OCR_LANG, config=OCR_CONFIG), [])
+    return texts
+
+
+def read_multi(first, second) -> dict:
+    return {
+        **ocr_regions(first, lang=OCR_LANG, config=OCR_CONFIG),
+        **ocr_regions(second, lang=OCR_LANG, config=OCR_CONFIG),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pdf", type=Path)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--output", type=Path, default=None, help="archivo JSON de resultados")
+    args = parser.parse_args()
+
+    # Importe aquí: make_invoices necesita las dependencias de benchmarks/
+    from make_invoices import truth_path
+
+    truth_file = truth_path(args.pdf)
+    truth = (
+        json.loads(truth_file.read_text(encoding="utf-8"))["pages"]
+        if truth_file.exists() else None
+    )
+
+    pages = []
+    for image in iter_pages(str(args.pdf)):
+        pages.append(_regions(PageContext(image)))
+        if len(pages) >= args.pages:
+            break
+
+    print(f"Motor: {engine_version()}  páginas: {len(pages)}  repeticiones: {args.repeat}")
+    warm_up()
+
+    results = {}
+    for mode, read in (("crops", read_crops), ("multi", read_multi)):
+        read(*pages[0])  # calentamiento
+
+        with OcrCalls() as calls:
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                extracted = [_extract(read(first, second)) for first, second in pages]
+            elapsed = time.perf_counter() - started
+
+        hits = None
+        if truth is not None:
+            hits = sum(
+                expected["code"] in (values["no_header"], values["ref_int"], values["no_fac"])
+                and values["page"] == expected["page"]
+                for values, expected in zip(extracted, truth)
+            )
+        results[mode] = {
+            "ms_per_page": round(elapsed * 1000 / (len(pages) * args.repeat), 1),
+            "calls_per_page": round(calls.count / (len(pages) * args.repeat), 2),
+            "hits": hits,
+            "extracted": extracted,
+        }
+
+    same = sum(
+        a == b for a, b in zip(results["crops"]["extracted"], results["multi"]["extracted"])
+    )
+    print(f"\n{'modo':<8} {'llamadas':>9} {'ms/pág':>9} {'aciertos':>9}")
+    for mode, r in results.items():
+        hits = f"{r['hits']}/{len(pages)}" if r["hits"] is not None else "-"
+        print(f"{mode:<8} {r['calls_per_page']:>9} {r['ms_per_page']:>9.1f} {hits:>9}")
+    speedup = results["crops"]["ms_per_page"] / max(results["multi"]["ms_per_page"], 1e-9)
+    print(f"\nmulti vs. crops: {speedup:.2f}x; mismas lecturas en {same}/{len(pages)} páginas")
+
+    for n, (a, b) in enumerate(zip(results["crops"]["extracted"], results["multi"]["extracted"]), 1):
+        if a != b:
+            diff = {key: (a[key], b[key]) for key in a if a[key] != b[key]}
+            print(f"  • página {n}: {diff}")
+
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nResultados guardados en: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
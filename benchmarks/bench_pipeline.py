@@ -0,0 +1,318 @@
+"""
+Benchmark por etapa del flujo de escaneo.
+
+Mide, página por página y en el orden de `detect_page`, el tiempo de:
+render (`iter_pages`), `extract_qr_and_barcode`, `extract_codes`,
+`extract_page_number_from_image` y `save_pdf`. Reporta páginas/s,
+ms/página y la memoria residente máxima (RSS) de cada etapa, y guarda
+los resultados en JSON para comparar ejecuciones.
+
+Si el PDF tiene su <nombre>.truth.json (ver make_invoices.py) también
+cuenta los aciertos de cada detector.
+
+La caché de resultados se desactiva (salvo --cache): si no, la segunda
+ejecución mediría lecturas de la caché y no a los detectores.
+
+Uso:
+    python benchmarks/bench_pipeline.py facturas.pdf [--pages 50] [--output resultados.json]
+    python benchmarks/bench_pipeline.py --generate 20 [--compare anterior.json]
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BENCH_DIR / "results"
+
+sys.path.insert(0, str(BENCH_DIR.parents[0] / "src"))
+
+
+STAGES = ("render", "qr_barcode", "codes", "page_number", "save_pdf")
+
+
+# ==================================================
+# Memoria residente
+# ==================================================
+def _rss_reader() -> Optional[Callable[[], int]]:
+    """
+    RSS actual en bytes: /proc en Linux, psutil si está instalado.
+    """
+    statm = Path("/proc/self/statm")
+    if statm.exists():
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        return lambda: int(statm.read_text().split()[1]) * page_size
+    try:
+        import psutil
+    except ImportError:
+        return None
+    process = psutil.Process()
+    return lambda: process.memory_info().rss
+
+
+class RssMonitor:
+    """
+    Muestrea la RSS cada `interval` segundos en un hilo y guarda el
+    máximo por etapa (la que esté marcada en `stage` en ese momento).
+    No incluye la memoria de los subprocesos (pdftoppm, zbarimg).
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self._read = _rss_reader()
+        self._interval = interval
+        self._stop = threading.Event()
+        self.stage: Optional[str] = None
+        self.peaks: Dict[str, int] = defaultdict(int)
+
+    @property
+    def available(self) -> bool:
+        return self._read is not None
+
+    def _sample(self) -> None:
+        if self.stage is not None:
+            self.peaks[self.stage] = max(self.peaks[self.stage], self._read())
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            self._sample()
+
+    def __enter__(self):
+        if self.available:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.available:
+            self._stop.set()
+            self._thread.join()
+
+    def measure(self, stage: str, timings: Dict, fn: Callable, *args):
+        """
+        Ejecuta `fn(*args)` dentro de la etapa; un error se cuenta y no
+        corta el benchmark (p. ej. sin Tesseract instalado).
+        """
+        self.stage = stage
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        except Exception as e:
+            timings[stage]["errors"] += 1
+            timings[stage]["last_error"] = f"{type(e).__name__}: {e}"
+            return None
+        finally:
+            timings[stage]["seconds"] += time.perf_counter() - started
+            timings[stage]["calls"] += 1
+            if self.available:
+                self._sample()
+            self.stage = None
+
+
+# ==================================================
+# Benchmark
+# ==================================================
+def run(pdf_path: Path, max_pages: Optional[int] = None) -> Dict:
+    # Importes aquí: la configuración (SCANNER_CACHE...) ya quedó fijada
+    from extract_codes import extract_codes
+    from extract_qr_and_barcode import extract_qr_and_barcode
+    from image_converter import iter_pages
+    from make_invoices import truth_path
+    from page_context import as_context
+    from pdf_processor import PageRecord, extract_page_number_from_image
+    from utils.file_utils import prepare_for_output, save_pdf
+
+    truth_file = truth_path(pdf_path)
+    truth = (
+        json.loads(truth_file.read_text(encoding="utf-8"))["pages"]
+        if truth_file.exists() else None
+    )
+
+    timings = {
+        stage: {"seconds": 0.0, "calls": 0, "errors": 0, "last_error": None}
+        for stage in STAGES
+    }
+    hits = defaultdict(int)
+    kept = []
+
+    with RssMonitor() as monitor:
+        pages = iter(iter_pages(str(pdf_path)))
+        idx = 0
+        while max_pages is None or idx < max_pages:
+            # El render es perezoso: se mide lo que tarda cada página en salir
+            image = monitor.measure("render", timings, next, pages, None)
+            if image is None:
+                timings["render"]["calls"] -= 1
+                break
+            idx += 1
+
+            # Un solo contexto por página, como en `detect_page`
+            context = as_context(image)
+            decoded = monitor.measure("qr_barcode", timings, extract_qr_and_barcode, context)
+            codes = monitor.measure("codes", timings, extract_codes, context)
+            page_number = monitor.measure(
+                "page_number", timings, extract_page_number_from_image, context
+            )
+            kept.append((idx, page_number, prepare_for_output(idx, image)))
+
+            if truth is not None and idx <= len(truth):
+                expected = truth[idx - 1]
+                numfac_qr, numfac_barcode = decoded or (None, None)
+                hits["qr"] += numfac_qr == expected["code"]
+                hits["barcode"] += numfac_barcode == expected["code"]
+                hits["codes"] += bool(codes) and expected["code"] in (
+                    codes.get("accepted"), codes.get("ref_int"), codes.get("no_fac")
+                )
+                hits["page_number"] += page_number == expected["page"]
+
+        # Escritura: una factura por código esperado (o todo en un PDF)
+        documents = defaultdict(list)
+        for idx, page_number, page in kept:
+            code = truth[idx - 1]["code"] if truth and idx <= len(truth) else "bench"
+            documents[code].append(PageRecord(idx, page_number or idx, code, None, page))
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            for code, entries in documents.items():
+                monitor.measure(
+                    "save_pdf", timings, save_pdf, entries, Path(output_dir) / f"{code}.pdf"
+                )
+        save_pages = len(kept)
+
+    total_pages = idx
+    stages = {}
+    for stage, t in timings.items():
+        pages_in_stage = save_pages if stage == "save_pdf" else t["calls"]
+        stages[stage] = {
+            "seconds": round(t["seconds"], 4),
+            "calls": t["calls"],
+            "pages": pages_in_stage,
+            "pages_per_sec": round(pages_in_stage / t["seconds"], 2) if t["seconds"] else None,
+            "ms_per_page": round(t["seconds"] * 1000 / pages_in_stage, 2) if pages_in_stage else None,
+            "peak_rss_mb": (
+                round(monitor.peaks[stage] / 2**20, 1) if stage in monitor.peaks else None
+            ),
+            "errors": t["errors"],
+            "last_error": t["last_error"],
+        }
+
+    total_seconds = sum(t["seconds"] for t in timings.values())
+    result = {
+        "pdf": str(pdf_path),
+        "pages": total_pages,
+        "stages": stages,
+        "total": {
+            "seconds": round(total_seconds, 4),
+            "pages_per_sec": round(total_pages / total_seconds, 2) if total_seconds else None,
+            "peak_rss_mb": (
+                round(max(monitor.peaks.values()) / 2**20, 1) if monitor.peaks else None
+            ),
+        },
+    }
+    if truth is not None:
+        result["accuracy"] = {
+            name: f"{hits[name]}/{total_pages}"
+            for name in ("qr", "barcode", "codes", "page_number")
+        }
+    return result
+
+
+def environment() -> Dict:
+    import settings
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            name: getattr(settings, name)
+            for name in (
+                "RENDER_DPI", "RENDER_CHUNK_SIZE", "RENDER_MODE", "DIRECT_IMAGES",
+                "DECODER_BACKEND", "OCR_ENGINES", "OCR_MIN_CONFIDENCE", "OCR_MODE",
+                "CACHE_ENABLED", "LOCATE_CODES", "OUTPUT_MODE", "OUTPUT_DPI",
+            )
+        },
+    }
+
+
+# ==================================================
+# Salida
+# ==================================================
+def print_results(results: Dict, previous: Optional[Dict] = None) -> None:
+    print(f"\nPDF: {results['pdf']}  páginas: {results['pages']}\n")
+    header = f"{'etapa':<12} {'s':>8} {'págs/s':>8} {'ms/pág':>8} {'RSS MB':>8} {'errores':>8}"
+    if previous:
+        header += f" {'vs. anterior':>13}"
+    print(header)
+
+    for stage, s in results["stages"].items():
+        line = (
+            f"{stage:<12} {s['seconds']:>8.2f} {s['pages_per_sec'] or 0:>8.1f} "
+            f"{s['ms_per_page'] or 0:>8.1f} {s['peak_rss_mb'] or 0:>8.1f} {s['errors']:>8}"
+        )
+        before = previous["stages"].get(stage) if previous else None
+        if before and before["seconds"] and s["seconds"]:
+            line += f" {before['seconds'] / s['seconds']:>12.2f}x"
+        print(line)
+
+    total = results["total"]
+    print(
+        f"\nTotal: {total['seconds']:.2f} s, {total['pages_per_sec'] or 0:.1f} págs/s, "
+        f"RSS máx. {total['peak_rss_mb'] or 0:.1f} MB"
+    )
+    if "accuracy" in results:
+        print("Aciertos: " + ", ".join(f"{k} {v}" for k, v in results["accuracy"].items()))
+    for stage, s in results["stages"].items():
+        if s["last_error"]:
+            print(f"  • {stage}: {s['last_error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pdf", nargs="?", type=Path)
+    parser.add_argument(
+        "--generate", type=int, metavar="FACTURAS",
+        help="genera un PDF sintético con make_invoices.py y lo mide",
+    )
+    parser.add_argument("--pages", type=int, default=None, help="máximo de páginas")
+    parser.add_argument("--output", type=Path, default=None, help="archivo JSON de resultados")
+    parser.add_argument("--compare", type=Path, default=None, help="resultados anteriores")
+    parser.add_argument("--cache", action="store_true", help="no desactivar la caché")
+    args = parser.parse_args()
+
+    if args.pdf is None and not args.generate:
+        parser.error("indique un PDF o --generate N")
+
+    if not args.cache:
+        os.environ["SCANNER_CACHE"] = "0"
+
+    pdf_path = args.pdf
+    if args.generate:
+        from make_invoices import make_invoices_pdf
+
+        pdf_path = pdf_path or RESULTS_DIR / f"synthetic_{args.generate}.pdf"
+        make_invoices_pdf(pdf_path, invoices=args.generate)
+
+    results = {"environment": environment(), **run(pdf_path, args.pages)}
+
+    previous = None
+    if args.compare is not None:
+        previous = json.loads(args.compare.read_text(encoding="utf-8"))
+    print_results(results, previous)
+
+    output = args.output or RESULTS_DIR / f"bench_{datetime.now():%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\nResultados guardados en: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+Generador de PDFs sintéticos de facturas para los benchmarks.
+
+Cada página es una imagen escaneada (JPEG a 300 DPI, tamaño carta) con
+los elementos que leen los detectores, en las zonas exactas del código:
+- QR estilo DIAN con "NumFac:" (QR_ZONE)
+- Code128 con el número de factura y "No.FAC:" (BARCODE_ZONE / NO_FAC_ZONE)
+- "No. XXX-YYYYYY" y "Ref.Int. ..." en el encabezado (HEADER_ZONE)
+- "Pág. N de M" al pie (PAGE_NUMBER_ZONE)
+
+Junto al PDF se guarda <nombre>.truth.json con el código y el número de
+página esperados de cada página, para medir aciertos.
+
+Uso:
+    python benchmarks/make_invoices.py facturas.pdf [--invoices 20] [--max-pages 3] [--seed 1]
+"""
+import argparse
+import json
+import random
+import sys
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List
+
+import barcode
+import pikepdf
+import qrcode
+from barcode.writer import ImageWriter
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from extract_codes import HEADER_ZONE, NO_FAC_ZONE  # noqa: E402
+from extract_qr_and_barcode import BARCODE_ZONE, QR_ZONE  # noqa: E402
+from pdf_processor import PAGE_NUMBER_ZONE  # noqa: E402
+
+DPI = 300
+PAGE_SIZE = (int(8.5 * DPI), int(11 * DPI))  # carta
+
+
+def _font(size: int) -> ImageFont.ImageFont:
+    for name in ("DejaVuSans.ttf", "arial.ttf"):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size)
+
+
+def _box(zone) -> tuple:
+    w, h = PAGE_SIZE
+    x0, y0, x1, y1 = zone
+    return (int(w * x0), int(h * y0), int(w * x1), int(h * y1))
+
+
+def invoice_code(n: int, prefix: str = "990") -> Dict[str, str]:
+    """
+    El mismo número en todas sus formas: el "No. 990-000123" del
+    encabezado se normaliza (guion → 0) al código 9900000123.
+    """
+    serial = f"{n:06d}"
+    return {"code": f"{prefix}0{serial}", "no_header": f"{prefix}-{serial}"}
+
+
+# ==================================================
+# Elementos de la página
+# ==================================================
+def _qr_image(code: str, rng: random.Random, side: int) -> Image.Image:
+    cufe = "".join(rng.choice("0123456789abcdef") for _ in range(96))
+    payload = "\n".join([
+        f"NumFac: {code}",
+        "FecFac: 2024-03-01",
+        "NitFac: 900123456",
+        "DocAdq: 800987654",
+        f"ValFac: {rng.randint(100_000, 9_000_000)}.00",
+        f"CUFE: {cufe}",
+    ])
+    qr = qrcode.QRCode(border=4)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    # Módulos de un número entero de píxeles (sin reescalar)
+    qr.box_size = side // (qr.modules_count + 2 * qr.border)
+    return qr.make_image(fill_color="black", back_color="white").get_image().convert("L")
+
+
+def _barcode_image(code: str) -> Image.Image:
+    writer_options = {
+        "module_width": 0.33,
+        "module_height": 9,
+        "dpi": DPI,
+        "quiet_zone": 2,
+        "write_text": False,
+    }
+    return barcode.get("code128", code, writer=ImageWriter()).render(writer_options).convert("L")
+
+
+def render_page(code: Dict[str, str], page: int, of: int, rng: random.Random) -> Image.Image:
+    image = Image.new("L", PAGE_SIZE, 255)
+    draw = ImageDraw.Draw(image)
+    text = _font(40)
+    small = _font(28)
+
+    # Encabezado: No. y Ref.Int.
+    hx0, hy0, _, _ = _box(HEADER_ZONE)
+    draw.text((hx0 + 30, hy0 + 20), f"No. {code['no_header']}", font=text, fill=0)
+    draw.text((hx0 + 30, hy0 + 100), f"Ref.Int. {code['code']}", font=text, fill=0)
+
+    # Cuerpo: algo de texto para que no sea una página vacía
+    draw.text((150, 200), "FACTURA ELECTRÓNICA DE VENTA", font=_font(56), fill=0)
+    for row in range(18):
+        y = 700 + row * 90
+        draw.text((150, y), f"{rng.randint(1000, 9999)}  Artículo de prueba {row + 1}", font=small, fill=0)
+        draw.text((1900, y), f"$ {rng.randint(1_000, 900_000):,}", font=small, fill=0)
+
+    # QR (zona QR, sin invadir la del barcode)
+    qx0, qy0, _, _ = _box(QR_ZONE)
+    bx0, by0, bx1, by1 = _box(BARCODE_ZONE)
+    qr = _qr_image(code["code"], rng, side=min(bx0 - qx0 - 40, 560))
+    image.paste(qr, (qx0 + 20, qy0 + 40))
+
+    # Code128 + No.FAC (misma franja)
+    bar = _barcode_image(code["code"])
+    bar.thumbnail((bx1 - bx0 - 60, (by1 - by0) // 2))
+    image.paste(bar, (bx0 + 30, by0 + 20))
+    nx0, _, _, ny1 = _box(NO_FAC_ZONE)
+    draw.text((nx0 + 30, ny1 - 70), f"No.FAC: {code['code']}", font=text, fill=0)
+
+    # Pie: Pág. N de M
+    px0, py0, _, _ = _box(PAGE_NUMBER_ZONE)
+    draw.text((px0 + 60, py0 + 140), f"Pág. {page} de {of}", font=text, fill=0)
+
+    return image
+
+
+# ==================================================
+# PDF
+# ==================================================
+def make_invoices_pdf(
+    output: Path,
+    invoices: int = 20,
+    max_pages: int = 3,
+    seed: int = 1,
+    quality: int = 80,
+) -> Dict:
+    """
+    Genera el PDF (una imagen JPEG por página, como un escáner) y su
+    archivo .truth.json. Devuelve el contenido de ese archivo.
+    """
+    rng = random.Random(seed)
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    truth_pages: List[Dict] = []
+    truth_invoices: List[Dict] = []
+
+    with pikepdf.new() as pdf:
+        for n in range(1, invoices + 1):
+            code = invoice_code(n)
+            pages = rng.randint(1, max_pages)
+            indices = []
+
+            for page in range(1, pages + 1):
+                # Página por página: nunca hay más de una imagen en memoria
+                buffer = BytesIO()
+                render_page(code, page, pages, rng).save(
+                    buffer, format="PDF", resolution=DPI, quality=quality
+                )
+                with pikepdf.open(BytesIO(buffer.getvalue())) as single:
+                    pdf.pages.append(single.pages[0])
+
+                index = len(truth_pages) + 1
+                indices.append(index)
+                truth_pages.append({
+                    "index": index, "code": code["code"], "page": page, "of": pages,
+                })
+
+            truth_invoices.append({"code": code["code"], "pages": indices})
+
+        pdf.save(output)
+
+    truth = {"pdf": output.name, "dpi": DPI, "invoices": truth_invoices, "pages": truth_pages}
+    truth_path(output).write_text(json.dumps(truth, indent=2), encoding="utf-8")
+    return truth
+
+
+def truth_path(pdf_path: Path) -> Path:
+    return Path(pdf_path).with_suffix(".truth.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output", type=Path)
+    parser.add_argument("--invoices", type=int, default=20)
+    parser.add_argument("--max-pages", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--quality", type=int, default=80, help="calidad JPEG de las páginas")
+    args = parser.parse_args()
+
+    truth = make_invoices_pdf(
+        args.output, args.invoices, args.max_pages, args.seed, args.quality
+    )
+    print(
+        f"{args.output}: {len(truth['invoices'])} facturas, "
+        f"{len(truth['pages'])} páginas (verdad en {truth_path(args.output).name})"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,7 @@
 # -*- mode: python ; coding: utf-8 -*-
 
+from PyInstaller.utils.hooks import collect_dynamic_libs
+
 block_cipher = None
 
 a = Analysis(
@@ -9,12 +11,15 @@ a = Analysis(
         ('runtime/tesseract/tesseract.exe', 'runtime/tesseract'),
         ('runtime/poppler/Library/bin', 'runtime/poppler/Library/bin'),
         ('runtime/zbar/bin/*', 'runtime/zbar/bin')
-    ],
+    ]
+    # libzbar-64.dll y libiconv.dll vienen dentro del paquete pyzbar, que
+    # las busca junto a su propio módulo
+    + collect_dynamic_libs('tesserocr') + collect_dynamic_libs('pyzbar'),
     datas=[
         ('runtime/tesseract/tessdata', 'runtime/tesseract/tessdata'),
         ('src/assets', 'src/assets'),
     ],
-    hiddenimports=[],
+    hiddenimports=['tesserocr', 'pyzbar.pyzbar'],
     hookspath=[],
     runtime_hooks=[],
     excludes=[],
@@ -0,0 +1,287 @@
+import os
+import base64
+import tempfile
+import xml.etree.ElementTree as ET
+from loguru import logger
+from PIL import Image
+from typing import Dict, List, Optional, Sequence
+
+from settings import DECODER_BACKEND
+from utils.cancellation import run_tool
+from utils.runtime import no_window_kwargs, zbarimg_exe
+
+# =========================
+# PATH RESOLVER
+# =========================
+# zbarimg incluido en runtime/ o, en Linux, el del sistema
+ZBAR_EXE = os.path.abspath(zbarimg_exe())
+
+
+def _split_lines(texts: List[str]) -> List[str]:
+    """
+    Misma salida que `zbarimg --raw`: una línea por renglón, sin vacíos.
+    """
+    lines = []
+    for text in texts:
+        lines.extend(line.strip() for line in text.splitlines() if line.strip())
+    return lines
+
+# =========================
+# ZBAR RUNNER
+# =========================
+def run_zbar(image_path: str) -> List[str]:
+    image_path = os.path.abspath(image_path)
+    result = run_tool(
+        [ZBAR_EXE, "--raw", image_path],
+        text=True,
+        **no_window_kwargs(),
+    )
+    if not result.stdout.strip():
+        return []
+    return [line.strip() for line in result.stdout.splitlines() if line.strip()]
+
+
+# Límite defensivo para la línea de comandos (Windows admite ~32K)
+_MAX_CMDLINE = 24000
+
+
+def run_zbar_batch(image_paths: Sequence[str]) -> Dict[str, List[str]]:
+    """
+    Decodifica muchos archivos con una sola ejecución de zbarimg.
+
+    Usa `--xml`, que separa los símbolos por archivo (`<source href=...>`),
+    y devuelve {ruta absoluta: líneas} con el mismo formato que `run_zbar`.
+    Solo se lanza otro proceso si la lista no cabe en una línea de comandos.
+    """
+    paths = [os.path.abspath(p) for p in image_paths]
+    results: Dict[str, List[str]] = {path: [] for path in paths}
+
+    start = 0
+    while start < len(paths):
+        end, length = start, 0
+        while end < len(paths) and (end == start or length + len(paths[end]) < _MAX_CMDLINE):
+            length += len(paths[end]) + 3
+            end += 1
+
+        result = run_tool(
+            [ZBAR_EXE, "--xml", "-q", *paths[start:end]],
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            **no_window_kwargs(),
+        )
+        for path, texts in _parse_zbar_xml(result.stdout).items():
+            results.setdefault(os.path.abspath(path), []).extend(_split_lines(texts))
+
+        start = end
+
+    return results
+
+
+def _parse_zbar_xml(output: str) -> Dict[str, List[str]]:
+    if not output.strip():
+        return {}
+
+    root = ET.fromstring(output)
+    decoded: Dict[str, List[str]] = {}
+
+    # Las etiquetas vienen con namespace; se compara solo el nombre local
+    for source in root.iter():
+        if not source.tag.endswith("source"):
+            continue
+
+        texts = decoded.setdefault(source.get("href", ""), [])
+        for data in source.iter():
+            if not data.tag.endswith("data") or data.text is None:
+                continue
+            if data.get("format") == "base64":
+                texts.append(
+                    base64.b64decode(data.text).decode("utf-8", errors="replace")
+                )
+            else:
+                texts.append(data.text)
+
+    return decoded
+
+# =========================
+# BACKENDS
+# =========================
+class BaseDecoder:
+    name = ""
+
+    # True si decode_many es más eficiente que llamar decode por recorte
+    batch = False
+
+    def available(self) -> bool:
+        raise NotImplementedError
+
+    def decode(self, image: Image.Image) -> List[str]:
+        raise NotImplementedError
+
+    def decode_many(self, images: Sequence[Image.Image]) -> List[List[str]]:
+        return [self.decode(image) for image in images]
+
+
+class ZbarSubprocessDecoder(BaseDecoder):
+    """
+    Backend original: PNG temporal + un proceso zbarimg por recorte.
+    Se mantiene como respaldo cuando no hay decodificador en memoria.
+
+    `decode_many` escribe todos los recortes de un lote y los lee con
+    una sola ejecución de zbarimg (ver `run_zbar_batch`).
+    """
+    name = "zbarimg"
+    batch = True
+
+    def available(self) -> bool:
+        return os.path.exists(ZBAR_EXE)
+
+    def decode(self, image: Image.Image) -> List[str]:
+        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
+            temp_path = os.path.abspath(tmp.name)
+            image.save(temp_path)
+        try:
+            return run_zbar(temp_path)
+        finally:
+            os.remove(temp_path)
+
+    def decode_many(self, images: Sequence[Image.Image]) -> List[List[str]]:
+        if not images:
+            return []
+
+        with tempfile.TemporaryDirectory(prefix="zbar_") as tmp_dir:
+            paths = []
+            for n, image in enumerate(images):
+                path = os.path.join(tmp_dir, f"{n:05d}.png")
+                # Compresión mínima: el PNG solo vive hasta que zbarimg lo lee
+                image.save(path, compress_level=1)
+                paths.append(path)
+
+            decoded = run_zbar_batch(paths)
+
+        return [decoded.get(os.path.abspath(path), []) for path in paths]
+
+
+class PyzbarDecoder(BaseDecoder):
+    """
+    libzbar en el mismo proceso (pyzbar/ctypes): mismo motor que
+    zbarimg, sin archivos temporales ni procesos hijos.
+    """
+    name = "pyzbar"
+
+    def __init__(self):
+        self._decode = None
+
+    def available(self) -> bool:
+        try:
+            from pyzbar.pyzbar import decode
+        except Exception:
+            # ImportError o libzbar ausente en el sistema
+            return False
+        self._decode = decode
+        return True
+
+    def decode(self, image: Image.Image) -> List[str]:
+        symbols = self._decode(image)
+        return _split_lines(
+            [s.data.decode("utf-8", errors="replace") for s in symbols]
+        )
+
+
+class OpenCVDecoder(BaseDecoder):
+    """
+    Detector QR de OpenCV, en memoria.
+
+    Ojo: según la compilación, `cv2.barcode` lee solo EAN/UPC y no el
+    Code128 de la franja No.FAC. Por eso, si pyzbar está disponible, los
+    códigos de barras se leen con él; si no, se usa `cv2.barcode` y las
+    páginas que no lea terminan en la cascada OCR.
+    """
+    name = "opencv"
+
+    def __init__(self):
+        self._qr = None
+        self._barcode = None
+        self._pyzbar = PyzbarDecoder()
+
+    def available(self) -> bool:
+        try:
+            import cv2
+        except ImportError:
+            return False
+
+        self._qr = cv2.QRCodeDetector()
+        if not self._pyzbar.available():
+            if not hasattr(cv2, "barcode"):
+                return False
+            logger.warning(
+                "Decodificador opencv sin pyzbar: los Code128/Code39 dependen "
+                "de la compilación de OpenCV (pueden no leerse)"
+            )
+            self._pyzbar = None
+            self._barcode = cv2.barcode.BarcodeDetector()
+        return True
+
+    def decode(self, image: Image.Image) -> List[str]:
+        import numpy as np
+
+        gray = np.asarray(image.convert("L"))
+        texts = []
+
+        # El índice 1 es `decoded_info` en todas las versiones de OpenCV
+        ok, decoded, *_ = self._qr.detectAndDecodeMulti(gray)
+        if ok:
+            texts.extend(t for t in decoded if t)
+
+        if not texts:
+            if self._pyzbar is not None:
+                return self._pyzbar.decode(image)
+            ok, decoded, *_ = self._barcode.detectAndDecodeMulti(gray)
+            if ok:
+                texts.extend(t for t in decoded if t)
+
+        return _split_lines(texts)
+
+
+DECODERS = {
+    "pyzbar": PyzbarDecoder,
+    "opencv": OpenCVDecoder,
+    "zbarimg": ZbarSubprocessDecoder,
+}
+
+# Orden de preferencia en modo "auto": libzbar en memoria primero;
+# zbarimg por subproceso antes que OpenCV porque este, sin pyzbar, puede
+# no leer Code128
+AUTO_ORDER = ("pyzbar", "zbarimg", "opencv")
+
+_decoders: Dict[str, BaseDecoder] = {}
+
+
+def get_decoder(name: Optional[str] = None) -> BaseDecoder:
+    """
+    Devuelve el backend indicado (o el de SCANNER_DECODER).
+    Con "auto" elige el primero disponible según AUTO_ORDER.
+    La instancia se reutiliza durante toda la vida del proceso.
+    """
+    name = (name or DECODER_BACKEND).lower()
+
+    if name in _decoders:
+        return _decoders[name]
+
+    if name == "auto":
+        candidates = AUTO_ORDER
+    elif name in DECODERS:
+        candidates = (name,)
+    else:
+        raise ValueError(f"Decodificador desconocido: {name}")
+
+    for candidate in candidates:
+        decoder = DECODERS[candidate]()
+        if decoder.available():
+            logger.debug(f"Decodificador QR/barcode: {decoder.name}")
+            _decoders[name] = decoder
+            return decoder
+
+    raise RuntimeError(
+        f"Ningún decodificador QR/barcode disponible ({', '.join(candidates)})"
+    )
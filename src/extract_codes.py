@@ -1,13 +1,21 @@
 import re
-import cv2
-import numpy as np
 from PIL import Image
-import pytesseract
-from typing import Optional, Dict
+from typing import Callable, Optional, Dict, List, Sequence, Tuple
+
+from multi_roi_ocr import Region, ocr_regions
+from ocr_engine import image_to_string, image_to_data, engine_version
+from page_context import as_context
+from utils.metrics import timed_call
+from utils.result_cache import cached
+from settings import OCR_MIN_CONFIDENCE
 
 OCR_LANG = "eng"
 OCR_CONFIG = "--psm 6"
 
+# Zonas (fracciones de la página)
+HEADER_ZONE = (0.70, 0.06, 0.98, 0.13)
+NO_FAC_ZONE = (0.25, 0.85, 0.50, 0.93)
+
 # =========================
 # REGEX SIMPLES Y ROBUSTOS
 # =========================
@@ -51,77 +59,199 @@ def normalize_no_header(no_header: Optional[str]) -> Optional[str]:
         return None
     return no_header.replace("-", "0")
 
-def preprocess(img: Image.Image) -> Image.Image:
-    gray = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2GRAY)
-    return Image.fromarray(gray)
+def ocr(img: Image.Image, stage: str = "ocr") -> str:
+    text = cached(
+        "ocr",
+        img,
+        f"{engine_version()}|{OCR_LANG}|{OCR_CONFIG}",
+        lambda: timed_call(
+            stage,
+            image_to_string,
+            img,
+            lang=OCR_LANG,
+            config=OCR_CONFIG
+        ),
+    )
+    return normalize_ocr(text)
 
-def ocr(img: Image.Image) -> str:
-    return normalize_ocr(
-        pytesseract.image_to_string(
+def ocr_with_confidence(
+    img: Image.Image, stage: str = "ocr"
+) -> Tuple[str, List[Tuple[str, float]]]:
+    """
+    Como `ocr`, pero además devuelve la confianza de cada palabra.
+    """
+    text, words = cached(
+        "ocr_data",
+        img,
+        f"{engine_version()}|{OCR_LANG}|{OCR_CONFIG}",
+        lambda: timed_call(
+            stage,
+            image_to_data,
             img,
             lang=OCR_LANG,
             config=OCR_CONFIG
-        )
+        ),
     )
+    return normalize_ocr(text), [(word, conf) for word, conf in words]
+
+def code_confidence(raw_code: str, words: List[Tuple[str, float]]) -> float:
+    """
+    Confianza mínima de las palabras OCR que forman el código
+    (0 si no se encuentran).
+    """
+    digits = re.sub(r"\D", "", raw_code)
+    confidences = []
+    for word, conf in words:
+        word_digits = re.sub(r"\D", "", word)
+        if len(word_digits) >= 3 and word_digits in digits:
+            confidences.append(conf)
+    return min(confidences) if confidences else 0.0
+
+# =========================
+# ATAJOS (sin recorte No.FAC)
+# =========================
+# La votación de `split_by_barcode` es Counter([no_header, ref_int, no_fac])
+# sobre los valores no vacíos: en empate gana el primero.
+# - "header": el encabezado trae un solo código (o ambos iguales); ese
+#   código gana la votación sea cual sea no_fac, así que no se lee.
+# - "confidence": trae no_header y ref_int distintos; la votación da
+#   no_header salvo que no_fac confirme ref_int. Con no_header leído con
+#   confianza alta se acepta sin leer no_fac.
+# - "vote": hace falta no_fac y se vota.
+def _header_shortcut(
+    no_header: Optional[str],
+    ref_int: Optional[str],
+    no_header_confidence: float,
+    min_confidence: float,
+) -> Tuple[Optional[str], Optional[str]]:
+    if no_header and ref_int and no_header != ref_int:
+        if no_header_confidence >= min_confidence:
+            return no_header, "confidence"
+        return None, None
+    if no_header or ref_int:
+        return no_header or ref_int, "header"
+    return None, None
 
 # =========================
 # EXTRACCIÓN PRINCIPAL
 # =========================
-def extract_codes(image: Image.Image) -> Dict[str, Optional[str]]:
+def extract_codes(
+    image,
+    min_confidence: float = OCR_MIN_CONFIDENCE,
+) -> Dict[str, Optional[str]]:
     """
-    Extrae los códigos: no_header, ref_int, no_fac de una imagen de factura.
+    Extrae los códigos: no_header, ref_int, no_fac de una imagen de factura
+    (o del `PageContext` de la página).
+
+    Si el encabezado ya decide el código (ver atajos), no se hace OCR del
+    recorte No.FAC: `accepted` trae el código y `shortcut` el atajo usado
+    ("header" / "confidence"); si no, `shortcut` es "vote".
     """
-    w, h = image.size
+    context = as_context(image)
 
     # =========================
     # CROP HEADER (No. + Ref.Int.)
     # =========================
-    header_no_box = (
-        int(w * 0.70),
-        int(h * 0.06),
-        int(w * 0.98),
-        int(h * 0.13),
+    header_text, header_words = ocr_with_confidence(
+        context.gray_image(HEADER_ZONE), stage="ocr:HEADER"
     )
-    header_crop = image.crop(header_no_box)
-    header_text = ocr(preprocess(header_crop))
 
-    # =========================
-    # CROP NO. FAC
-    # =========================
-    no_fac_box = (
-        int(w * 0.25),
-        int(h * 0.85),
-        int(w * 0.50),
-        int(h * 0.93),
+    # (casi la misma franja que el barcode: misma escala de grises)
+    return codes_from_header(
+        header_text,
+        header_words,
+        lambda: ocr(context.gray_image(NO_FAC_ZONE), stage="ocr:NOFAC"),
+        min_confidence,
     )
-    no_fac_crop = image.crop(no_fac_box)
-    no_fac_text = ocr(preprocess(no_fac_crop))
 
+
+def codes_from_header(
+    header_text: str,
+    header_words: List[Tuple[str, float]],
+    read_no_fac: Callable[[], str],
+    min_confidence: float = OCR_MIN_CONFIDENCE,
+) -> Dict[str, Optional[str]]:
+    """
+    Regex + atajos sobre el texto ya leído del encabezado. `read_no_fac`
+    entrega el texto del recorte No.FAC y solo se llama si hace falta.
+    """
     # =========================
     # EXTRACCIÓN POR REGEX
     # =========================
     no_header = None
     ref_int = None
     no_fac = None
+    no_header_confidence = 0.0
 
     m = NO_HEADER_REGEX.search(header_text)
     if m:
         no_header = normalize_no_header(m.group(1))
+        no_header_confidence = code_confidence(m.group(1), header_words)
 
     m = REF_INT_REGEX.search(header_text)
     if m:
         ref_int = m.group(1)
 
-    m = NO_FAC_REGEX.search(no_fac_text)
-    if m:
-        no_fac = m.group(1)
+    accepted, shortcut = _header_shortcut(
+        no_header, ref_int, no_header_confidence, min_confidence
+    )
+
+    if shortcut is None:
+        # =========================
+        # CROP NO. FAC
+        # =========================
+        m = NO_FAC_REGEX.search(read_no_fac())
+        if m:
+            no_fac = m.group(1)
+
+        shortcut = "vote"
 
     return {
         "no_header": no_header,
         "ref_int": ref_int,
         "no_fac": no_fac,
+        "accepted": accepted,
+        "shortcut": shortcut,
     }
 
+
+def extract_codes_multi(
+    image,
+    extra_regions: Sequence[Region] = (),
+    min_confidence: float = OCR_MIN_CONFIDENCE,
+) -> Tuple[Dict[str, Optional[str]], Dict[str, str]]:
+    """
+    Igual que `extract_codes`, pero encabezado, No.FAC y `extra_regions`
+    (p. ej. el pie con el número de página) se leen con una sola pasada
+    de Tesseract (`multi_roi_ocr`). No.FAC se lee siempre, aunque un
+    atajo luego lo descarte: el código es el mismo que con recortes,
+    pero `shortcut` vuelve en None (no se omitió ningún recorte).
+
+    Devuelve (códigos, {nombre: texto} de `extra_regions`).
+    """
+    context = as_context(image)
+    texts = ocr_regions(
+        [
+            ("header", context.gray_image(HEADER_ZONE)),
+            ("no_fac", context.gray_image(NO_FAC_ZONE)),
+            *extra_regions,
+        ],
+        lang=OCR_LANG,
+        config=OCR_CONFIG,
+    )
+
+    header_text, header_words = texts.pop("header")
+    no_fac_text, _ = texts.pop("no_fac")
+    codes = codes_from_header(
+        normalize_ocr(header_text),
+        header_words,
+        lambda: normalize_ocr(no_fac_text),
+        min_confidence,
+    )
+    codes["shortcut"] = None
+    return codes, {name: text for name, (text, _) in texts.items()}
+
+
 # =========================
 # OPCIONAL: Helper para PDFs
 # =========================
@@ -1,64 +1,33 @@
-import subprocess
-import sys
-import os
 import re
-import tempfile
 from PIL import Image
 from typing import Optional, Tuple, List
 
-# =========================
-# PATH RESOLVER
-# =========================
-def resource_path(relative: str) -> str:
-    if getattr(sys, "frozen", False):
-        base_path = getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__)))
-        return os.path.join(base_path, relative)
-    return os.path.abspath(relative)
-
-ZBAR_EXE = resource_path("runtime/zbar/bin/zbarimg.exe")
+from decoders import get_decoder
+from image_converter import PdfPage
+from page_context import PageContext, as_context
+from utils.code_locator import locate_code_regions
+from utils.metrics import timed_call
+from utils.result_cache import cached, lookup, store
 
 # =========================
 # REGEX PARA QR
 # =========================
 NUMFAC_REGEX = re.compile(r"NumFac\s*:\s*([0-9\-]+)", re.IGNORECASE)
 
-# =========================
-# ZBAR RUNNER
-# =========================
-def run_zbar(image_path: str) -> List[str]:
-    image_path = os.path.abspath(image_path)
-    result = subprocess.run(
-        [ZBAR_EXE, "--raw", image_path],
-        capture_output=True,
-        text=True,
-        creationflags=subprocess.CREATE_NO_WINDOW,
-    )
-    if not result.stdout.strip():
-        return []
-    return [line.strip() for line in result.stdout.splitlines() if line.strip()]
-
 # =========================
 # CROP DEFINITIVOS
 # =========================
-def crop_qr_zone(image: Image.Image) -> Image.Image:
-    w, h = image.size
-    box = (
-        int(w * 0.05),
-        int(h * 0.8),
-        int(w * 0.3),
-        int(h * 0.98),
-    )
-    return image.crop(box).convert("RGB")
-
-def crop_barcode_zone(image: Image.Image) -> Image.Image:
-    w, h = image.size
-    box = (
-        int(w * 0.25),
-        int(h * 0.85),
-        int(w * 0.56),
-        int(h * 0.93),
-    )
-    return image.crop(box).convert("RGB")
+QR_ZONE = (0.05, 0.8, 0.3, 0.98)
+BARCODE_ZONE = (0.25, 0.85, 0.56, 0.93)
+PAGE_ZONE = (0.0, 0.0, 1.0, 1.0)
+
+# Los recortes se entregan en escala de grises: zbar y OpenCV leen
+# luminancia, así que la conversión se hace una sola vez por página
+def crop_qr_zone(image) -> Image.Image:
+    return as_context(image).gray_image(QR_ZONE)
+
+def crop_barcode_zone(image) -> Image.Image:
+    return as_context(image).gray_image(BARCODE_ZONE)
 
 # =========================
 # EXTRAER NUMFAC DEL QR
@@ -74,24 +43,119 @@ def extract_numfac_from_lines(lines: List[str]) -> Optional[str]:
 # =========================
 # FUNCION PRINCIPAL
 # =========================
-def extract_qr_and_barcode(image: Image.Image) -> Tuple[Optional[str], Optional[str]]:
+def extract_qr_and_barcode(
+    image,
+    decoder=None,
+) -> Tuple[Optional[str], Optional[str]]:
     """
     Retorna una tupla: (numfac_qr, numfac_barcode)
+
+    Los recortes se decodifican en memoria con el backend de
+    `decoders.get_decoder()` (zbarimg por subproceso como respaldo).
+    `image` puede ser una imagen o el `PageContext` de la página.
     """
+    decoder = decoder or get_decoder()
+    image = as_context(image)
+
     # Procesamos QR
-    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
-        temp_path = os.path.abspath(tmp.name)
-        crop_qr_zone(image).save(temp_path)
-    qr_lines = run_zbar(temp_path)
-    os.remove(temp_path)
+    qr_crop = crop_qr_zone(image)
+    qr_lines = cached(
+        "zbar", qr_crop, decoder.name, lambda: timed_call("zbar", decoder.decode, qr_crop)
+    )
     numfac_qr = extract_numfac_from_lines(qr_lines) if qr_lines else None
 
     # Procesamos Barcode
-    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
-        temp_path = os.path.abspath(tmp.name)
-        crop_barcode_zone(image).save(temp_path)
-    barcode_lines = run_zbar(temp_path)
-    os.remove(temp_path)
+    barcode_crop = crop_barcode_zone(image)
+    barcode_lines = cached(
+        "zbar", barcode_crop, decoder.name,
+        lambda: timed_call("zbar", decoder.decode, barcode_crop),
+    )
     numfac_barcode = barcode_lines[0] if barcode_lines else None
 
     return numfac_qr, numfac_barcode
+
+
+# =========================
+# RESPALDO: CÓDIGOS LOCALIZADOS
+# =========================
+def extract_located_codes(
+    image,
+    decoder=None,
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Igual que `extract_qr_and_barcode`, pero en vez de las zonas fijas
+    decodifica las regiones que `locate_code_regions` encuentra en la
+    página (QR o barcode corridos, otro formato de factura...).
+    Se detiene en la primera región que da un código.
+
+    En modo ROI no hay página completa y no se busca nada.
+    """
+    context = as_context(image)
+    if isinstance(context.image, PdfPage):
+        return None, None
+
+    decoder = decoder or get_decoder()
+    w, h = context.size
+    regions = timed_call("locate", locate_code_regions, context.gray(PAGE_ZONE))
+
+    for kind, (x0, y0, x1, y1) in regions:
+        crop = context.gray_image((x0 / w, y0 / h, x1 / w, y1 / h))
+        lines = cached(
+            "zbar", crop, decoder.name, lambda: timed_call("zbar", decoder.decode, crop)
+        )
+        if not lines:
+            continue
+
+        numfac_qr = extract_numfac_from_lines(lines)
+        if numfac_qr:
+            return numfac_qr, None
+        if kind == "barcode":
+            return None, lines[0]
+
+    return None, None
+
+
+def extract_qr_and_barcode_batch(
+    images: List[PageContext],
+    decoder=None,
+) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    Igual que `extract_qr_and_barcode` pero para un lote de páginas:
+    todos los recortes (zona QR y zona barcode de cada página) se
+    decodifican en una sola llamada a `decoder.decode_many` y las
+    lecturas se devuelven por página, en el mismo orden.
+    Conviene pasar los `PageContext` que luego usará `detect_page`.
+    """
+    decoder = decoder or get_decoder()
+
+    crops = []
+    for image in images:
+        context = as_context(image)
+        crops.append(crop_qr_zone(context))
+        crops.append(crop_barcode_zone(context))
+
+    # Solo se decodifican los recortes que no están en caché
+    lines = [None] * len(crops)
+    missing = []
+    for n, crop in enumerate(crops):
+        found, value = lookup("zbar", crop, decoder.name)
+        if found:
+            lines[n] = value
+        else:
+            missing.append(n)
+
+    if missing:
+        decoded = timed_call(
+            "zbar_batch", decoder.decode_many, [crops[n] for n in missing]
+        )
+        for n, value in zip(missing, decoded):
+            lines[n] = value
+            store("zbar", crops[n], decoder.name, value)
+
+    results = []
+    for qr_lines, barcode_lines in zip(lines[0::2], lines[1::2]):
+        numfac_qr = extract_numfac_from_lines(qr_lines) if qr_lines else None
+        numfac_barcode = barcode_lines[0] if barcode_lines else None
+        results.append((numfac_qr, numfac_barcode))
+
+    return results
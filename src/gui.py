@@ -1,8 +1,10 @@
 import sys
+import multiprocessing
 
 # Fase 2: Importar TODO
 from PySide6.QtWidgets import QApplication
 from ui.main_window import MainWindow
+from ocr_engine import check_engine
 
 # Fase 3: Ahora sí, ocultar consolas
 from utils.runtime import hide_subprocess_consoles
@@ -10,6 +12,7 @@ hide_subprocess_consoles()
 
 
 def main():
+    check_engine()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
@@ -17,4 +20,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # Necesario para el pool de procesos en el .exe (PyInstaller)
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
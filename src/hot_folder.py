@@ -0,0 +1,467 @@
+import argparse
+import json
+import multiprocessing
+import shutil
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from logger import logger
+from decoders import get_decoder
+from image_converter import close_documents
+from ocr_engine import check_engine, warm_up
+from pipeline import analyze_pdf, failed_row, write_pdf_outputs
+from settings import (
+    DETECTION_WORKERS,
+    INCREMENTAL_OUTPUT,
+    WATCH_POLL_SECONDS,
+    WATCH_STABLE_SECONDS,
+)
+from utils.file_utils import InvoiceWriter
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog es opcional: sin él solo se sondea la carpeta
+    FileSystemEventHandler = object
+    Observer = None
+
+# Intentos para mover un original (en Windows puede seguir abierto un momento)
+MOVE_RETRIES = 5
+MOVE_RETRY_SECONDS = 1.0
+
+# Si aun así no se pudo, se reintenta en las revisiones siguientes con
+# espera creciente (30 s, 1 min, 2 min... hasta 30 min)
+STUCK_RETRY_SECONDS = 30.0
+STUCK_RETRY_MAX_SECONDS = 1800.0
+
+# Espera máxima a que todos los procesos de detección suelten un PDF
+RELEASE_TIMEOUT_SECONDS = 60.0
+
+# Un PDF estable sin %%EOF al final se procesa igual pasado este múltiplo
+# de WATCH_STABLE_SECONDS (terminará en la carpeta de fallidos si está roto)
+EOF_GRACE_FACTOR = 10
+
+
+# ==================================================
+# Motores precargados
+# ==================================================
+# Barrera compartida por los procesos del pool (ver `_release_worker`)
+_barrier = None
+
+
+def _warm_worker(barrier=None) -> None:
+    # Initializer del pool: OCR y decodificador listos antes del primer PDF
+    global _barrier
+
+    _barrier = barrier
+    warm_up()
+    get_decoder()
+
+
+def _ping() -> None:
+    pass
+
+
+def _release_worker(pdf_path: str) -> None:
+    close_documents(pdf_path)
+    # Se envía una tarea por proceso: cada una espera a las demás, así
+    # ningún proceso toma dos y todos cierran el documento
+    _barrier.wait(RELEASE_TIMEOUT_SECONDS)
+
+
+# ==================================================
+# Detección de archivos completos
+# ==================================================
+def _has_pdf_trailer(path: Path) -> bool:
+    """
+    El escáner escribe el PDF de corrido: mientras no aparece %%EOF al
+    final el archivo sigue incompleto.
+    """
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, 2)
+            f.seek(max(0, f.tell() - 1024))
+            return b"%%EOF" in f.read()
+    except OSError:
+        return False
+
+
+class _WakeHandler(FileSystemEventHandler):
+    def __init__(self, wake: threading.Event):
+        super().__init__()
+        self._wake = wake
+
+    def on_any_event(self, event):
+        if not event.is_directory:
+            self._wake.set()
+
+
+class _Stuck(NamedTuple):
+    # Original ya procesado que no se pudo mover a `target`
+    target: Path
+    row: Dict
+    attempts: int
+    next_try: float
+
+
+# ==================================================
+# Servicio
+# ==================================================
+class HotFolder:
+    """
+    Vigila `input_dir` y procesa cada PDF que llega con el mismo flujo
+    que el lote (`analyze_pdf` + `write_pdf_outputs`), usando un pool de
+    detección que se crea una sola vez con los motores ya cargados.
+
+    Los originales se mueven a `done_dir` o `failed_dir`, cada uno con su
+    reporte (<nombre>.json). Si un original no se puede mover (abierto
+    por otro programa), su reporte queda en `failed_dir` como
+    <nombre>.move_error.json y el movimiento se reintenta en las
+    revisiones siguientes, sin volver a procesarlo. Las facturas nunca
+    pisan archivos que ya están en `output_dir`.
+    """
+
+    def __init__(
+        self,
+        input_dir: Path,
+        output_dir: Path,
+        done_dir: Optional[Path] = None,
+        failed_dir: Optional[Path] = None,
+        workers: int = DETECTION_WORKERS,
+        poll_seconds: float = WATCH_POLL_SECONDS,
+        stable_seconds: float = WATCH_STABLE_SECONDS,
+    ):
+        self.input_dir = Path(input_dir)
+        self.output_dir = Path(output_dir)
+        self.done_dir = Path(done_dir) if done_dir else self.input_dir / "done"
+        self.failed_dir = Path(failed_dir) if failed_dir else self.input_dir / "failed"
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.stable_seconds = stable_seconds
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._barrier = None
+        self._counters: Dict[str, int] = defaultdict(int)
+        # ruta -> (tamaño, mtime, desde cuándo no cambia)
+        self._seen: Dict[Path, Tuple[int, float, float]] = {}
+        # Originales que no se pudieron mover: no se reprocesan, se
+        # reintenta solo el movimiento
+        self._stuck: Dict[Path, _Stuck] = {}
+        self._wake = threading.Event()
+        self.stop_event = threading.Event()
+
+    # ----------------------------------------------
+    def run(self) -> None:
+        """
+        Bucle principal; termina con Ctrl+C o `stop()`.
+        """
+        for folder in (self.input_dir, self.output_dir, self.done_dir, self.failed_dir):
+            folder.mkdir(parents=True, exist_ok=True)
+
+        self._start_engines()
+        observer = self._start_observer()
+
+        logger.info(f"👀 Vigilando {self.input_dir} (salida: {self.output_dir})")
+        try:
+            while not self.stop_event.is_set():
+                self._retry_stuck()
+                for path in self._ready_files():
+                    if self.stop_event.is_set():
+                        break
+                    self._process(path)
+
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+        except KeyboardInterrupt:
+            logger.info("Servicio detenido por el usuario")
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        self._wake.set()
+
+    # ----------------------------------------------
+    def _start_engines(self) -> None:
+        started = time.perf_counter()
+        check_engine()
+        _warm_worker()
+
+        if self.workers > 1:
+            self._barrier = multiprocessing.Barrier(self.workers)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_warm_worker,
+                initargs=(self._barrier,),
+            )
+            # Arranca todos los procesos ahora y no con el primer PDF
+            for future in [self._executor.submit(_ping) for _ in range(self.workers)]:
+                future.result()
+
+        logger.info(
+            f"Motores listos en {time.perf_counter() - started:.1f} s "
+            f"({self.workers} procesos de detección)"
+        )
+
+    def _restart_engines(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._start_engines()
+
+    def _start_observer(self):
+        if Observer is None:
+            logger.info("watchdog no instalado: se sondea la carpeta")
+            return None
+        try:
+            observer = Observer()
+            observer.schedule(_WakeHandler(self._wake), str(self.input_dir))
+            observer.start()
+            return observer
+        except Exception as e:
+            # P. ej. carpetas de red sin notificaciones: queda el sondeo
+            logger.warning(f"Sin eventos del sistema de archivos ({e}); se sondea la carpeta")
+            return None
+
+    # ----------------------------------------------
+    def _ready_files(self) -> List[Path]:
+        """
+        PDFs de la carpeta de entrada cuyo tamaño no cambió durante
+        `stable_seconds` y que ya terminan en %%EOF.
+        """
+        now = time.monotonic()
+        ready = []
+        current = set()
+
+        for path in sorted(self.input_dir.iterdir()):
+            if path.suffix.lower() != ".pdf" or path.name.startswith((".", "~")):
+                continue
+            if path in self._stuck:
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue  # se movió o borró entre el listado y el stat
+            if not path.is_file():
+                continue
+
+            current.add(path)
+            size, mtime, since = self._seen.get(path, (-1, -1.0, now))
+            if (stat.st_size, stat.st_mtime) != (size, mtime):
+                self._seen[path] = (stat.st_size, stat.st_mtime, now)
+                continue
+
+            quiet = now - since
+            if stat.st_size == 0 or quiet < self.stable_seconds:
+                continue
+            if _has_pdf_trailer(path) or quiet >= self.stable_seconds * EOF_GRACE_FACTOR:
+                ready.append(path)
+
+        # Olvida los archivos que ya no están
+        for path in list(self._seen):
+            if path not in current:
+                del self._seen[path]
+        return ready
+
+    # ----------------------------------------------
+    def _process(self, path: Path) -> None:
+        started = time.perf_counter()
+        logger.info(f"📥 Nuevo PDF: {path.name}")
+
+        try:
+            try:
+                row = self._analyze(path)
+            except BrokenProcessPool as e:
+                # Murió un proceso de detección (memoria, fallo de
+                # tesserocr/zbar): sin un pool nuevo todos los PDF
+                # siguientes irían a failed/
+                logger.error(
+                    f"Pool de detección roto procesando {path.name} ({e}); "
+                    f"se reinicia y se reintenta"
+                )
+                self._restart_engines()
+                row = self._analyze(path)
+            # Con facturas sin escribir el original queda para revisarlo
+            target = self.failed_dir if row["write_errors"] else self.done_dir
+            logger.info(
+                f"✅ {path.name}: {row['invoices_count']} facturas en "
+                f"{time.perf_counter() - started:.1f} s"
+            )
+        except Exception as e:
+            logger.exception(f"❌ Error procesando {path.name}")
+            row = failed_row(path, str(e))
+            target = self.failed_dir
+
+        self._release(path)
+        self._seen.pop(path, None)
+        self._archive(path, target, row, attempts=0)
+
+    def _analyze(self, path: Path) -> Dict:
+        counters = dict(self._counters)
+        writer = None
+        if INCREMENTAL_OUTPUT:
+            writer = InvoiceWriter(self.output_dir, self._counters, keep_existing=True)
+        try:
+            analysis = analyze_pdf(
+                path, executor=self._executor, workers=self.workers, writer=writer
+            )
+        except BrokenProcessPool:
+            # El reintento vuelve a escribir todas las facturas: se borran
+            # las que ya se habían escrito y sus nombres quedan libres
+            if writer is not None:
+                for document in writer.close():
+                    (self.output_dir / document.filename).unlink(missing_ok=True)
+            self._counters.clear()
+            self._counters.update(counters)
+            raise
+        return write_pdf_outputs(
+            analysis, self.output_dir, self._counters, keep_existing=True
+        )
+
+    def _archive(self, path: Path, target: Path, row: Dict, attempts: int) -> None:
+        # Mueve el original con su reporte; si no se puede, deja el
+        # reporte en failed_dir y agenda otro intento
+        try:
+            moved = self._move(path, target, retries=MOVE_RETRIES if attempts == 0 else 1)
+        except OSError as e:
+            attempts += 1
+            delay = min(STUCK_RETRY_SECONDS * 2 ** (attempts - 1), STUCK_RETRY_MAX_SECONDS)
+            logger.error(
+                f"No se pudo mover {path.name} a {target} ({e}); "
+                f"se reintenta en {delay:.0f} s"
+            )
+            self._stuck[path] = _Stuck(target, row, attempts, time.monotonic() + delay)
+            next_retry = datetime.fromtimestamp(time.time() + delay)
+            self._write_report(self._stuck_report(path), {
+                **row,
+                "source": str(path),
+                "move_error": str(e),
+                "move_target": str(target),
+                "move_attempts": attempts,
+                "next_retry": next_retry.isoformat(timespec="seconds"),
+            })
+            return
+
+        self._stuck.pop(path, None)
+        self._stuck_report(path).unlink(missing_ok=True)
+        self._write_report(moved.with_suffix(".json"), {
+            **row, "pdf": str(moved), "source": str(path),
+        })
+
+    def _retry_stuck(self) -> None:
+        now = time.monotonic()
+        for path, stuck in list(self._stuck.items()):
+            if stuck.next_try > now:
+                continue
+            if not path.exists():
+                # Lo movió o borró alguien más
+                logger.warning(f"{path.name} ya no está en la entrada; se deja de reintentar")
+                del self._stuck[path]
+                continue
+            self._archive(path, stuck.target, stuck.row, stuck.attempts)
+
+    def _stuck_report(self, path: Path) -> Path:
+        return self.failed_dir / f"{path.stem}.move_error.json"
+
+    def _write_report(self, report_path: Path, row: Dict) -> None:
+        report_path.write_text(
+            json.dumps(row, ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+
+    def _release(self, path: Path) -> None:
+        # Cierra los documentos PyMuPDF abiertos sobre el original (aquí
+        # y en los procesos de detección) antes de moverlo
+        close_documents(str(path))
+        if self._executor is not None:
+            try:
+                futures = [
+                    self._executor.submit(_release_worker, str(path))
+                    for _ in range(self.workers)
+                ]
+                for future in futures:
+                    future.result()
+            except Exception as e:
+                # Un proceso no llegó a la barrera (o el pool está roto):
+                # se intenta mover igual
+                logger.warning(f"No todos los procesos soltaron {path.name}: {e}")
+                self._barrier.reset()
+
+    def _move(self, path: Path, folder: Path, retries: int = MOVE_RETRIES) -> Path:
+        destination = folder / path.name
+        if destination.exists():
+            stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            destination = folder / f"{path.stem}_{stamp}{path.suffix}"
+
+        for attempt in range(1, retries + 1):
+            try:
+                return Path(shutil.move(str(path), str(destination)))
+            except OSError:
+                if attempt == retries:
+                    raise
+                time.sleep(MOVE_RETRY_SECONDS)
+
+
+# ==================================================
+# Línea de comandos
+# ==================================================
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="scanner-watch",
+        description="Procesa los PDFs que llegan a una carpeta (modo servicio).",
+    )
+    parser.add_argument("input_dir", type=Path, help="carpeta donde dejan los escaneos")
+    parser.add_argument(
+        "-o", "--output-dir", type=Path, default=Path("output"),
+        help="carpeta de salida de las facturas (por defecto: output)",
+    )
+    parser.add_argument(
+        "--done-dir", type=Path, default=None,
+        help="originales procesados (por defecto: <entrada>/done)",
+    )
+    parser.add_argument(
+        "--failed-dir", type=Path, default=None,
+        help="originales con error (por defecto: <entrada>/failed)",
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=DETECTION_WORKERS,
+        help="procesos de detección, precargados (SCANNER_WORKERS)",
+    )
+    parser.add_argument(
+        "--poll", type=float, default=WATCH_POLL_SECONDS,
+        help="segundos entre revisiones de la carpeta (SCANNER_WATCH_POLL)",
+    )
+    parser.add_argument(
+        "--stable", type=float, default=WATCH_STABLE_SECONDS,
+        help="segundos sin cambios para dar un PDF por completo (SCANNER_WATCH_STABLE)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    HotFolder(
+        args.input_dir,
+        args.output_dir,
+        done_dir=args.done_dir,
+        failed_dir=args.failed_dir,
+        workers=args.workers,
+        poll_seconds=args.poll,
+        stable_seconds=args.stable,
+    ).run()
+
+
+if __name__ == "__main__":
+    # Necesario para el pool de procesos en el .exe (PyInstaller)
+    multiprocessing.freeze_support()
+    main()
@@ -1,60 +1,652 @@
-from pdf2image import convert_from_path
-from pdf2image.exceptions import PDFInfoNotInstalledError, PDFPageCountError
+from pdf2image.parsers import parse_buffer_to_ppm
+from collections import OrderedDict
+from io import BytesIO
 from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional, Sequence, Tuple
 from loguru import logger
-import sys
+from PIL import Image
+import math
+import pikepdf
+import re
 import os
+import threading
 
-from utils.runtime import poppler_bin
+from settings import RENDER_DPI, RENDER_CHUNK_SIZE, RENDER_MODE, DIRECT_IMAGES, DPI_LADDER
+from utils.cancellation import CancelToken, checked, run_tool
+from utils.runtime import poppler_bin, no_window_kwargs
 
+# PyMuPDF es opcional: si está, las regiones se rasterizan en el mismo
+# proceso; si no, con pdftoppm -x/-y/-W/-H
+try:
+    import pymupdf as fitz
+except ImportError:
+    try:
+        import fitz
+    except ImportError:
+        fitz = None
 
-def pdf_to_images(pdf_path: str, dpi: int = 300):
-    logger.info(f"Convirtiendo PDF a imágenes: {pdf_path}")
 
+def _poppler_path() -> Path:
     poppler_path = poppler_bin()
 
     if not poppler_path.exists():
         raise RuntimeError(
             f"Poppler no encontrado en {poppler_path}"
         )
+    return poppler_path
+
+
+# Poppler se llama con `run_tool` (cancelable) y `no_window_kwargs` (sin
+# consola en Windows), sin tocar `subprocess` de forma global
+def _pdftoppm(
+    pdf_path: str,
+    dpi: int,
+    first_page: Optional[int] = None,
+    last_page: Optional[int] = None,
+) -> List[Image.Image]:
+    args = [str(_poppler_path() / "pdftoppm"), "-r", str(dpi)]
+    if first_page is not None:
+        args += ["-f", str(first_page)]
+    if last_page is not None:
+        args += ["-l", str(last_page)]
+    result = run_tool(args + [pdf_path], **no_window_kwargs())
+
+    if result.returncode != 0 or not result.stdout:
+        raise RuntimeError(
+            f"pdftoppm falló en {pdf_path}: "
+            f"{result.stderr.decode(errors='replace').strip()}"
+        )
+    return parse_buffer_to_ppm(result.stdout)
+
+
+def get_page_count(pdf_path: str) -> int:
+    """
+    Cantidad de páginas: con pikepdf (no hace falta poppler) y, si no
+    puede abrir el PDF, con pdfinfo.
+    """
+    source = _open_scan_source(pdf_path)
+    if source is not None:
+        with source:
+            return len(source.pages)
+    return _pdfinfo_page_count(pdf_path)
+
+
+def _pdfinfo_page_count(pdf_path: str) -> int:
+    result = run_tool(
+        [str(_poppler_path() / "pdfinfo"), pdf_path],
+        text=True,
+        errors="replace",
+        **no_window_kwargs(),
+    )
+
+    m = re.search(r"^Pages:\s+(\d+)", result.stdout, re.MULTILINE)
+    if m is None:
+        raise RuntimeError(
+            f"No se pudo leer la cantidad de páginas de {pdf_path}: "
+            f"{result.stderr.strip()}"
+        )
+    return int(m.group(1))
+
+
+def iter_pdf_images(
+    pdf_path: str,
+    dpi: int = RENDER_DPI,
+    chunk_size: int = RENDER_CHUNK_SIZE,
+    direct: bool = DIRECT_IMAGES,
+) -> Iterator[Image.Image]:
+    """
+    Renderiza el PDF en bloques de `chunk_size` páginas (first_page/last_page)
+    y entrega las páginas una a una. El siguiente bloque solo se renderiza
+    cuando el consumidor terminó con el anterior, así la memoria pico depende
+    de `chunk_size` y no del largo del documento.
+
+    Con `direct`, las páginas que son una sola imagen escaneada se toman
+    directamente del PDF (ver `extract_scan_image`); poppler solo
+    renderiza las demás.
+    """
+    chunk_size = max(1, chunk_size)
+    source = _open_scan_source(pdf_path) if direct else None
+    # Con el PDF ya abierto por pikepdf no hace falta pdfinfo
+    total_pages = len(source.pages) if source is not None else get_page_count(pdf_path)
+
+    logger.info(
+        f"Renderizando PDF en bloques de {chunk_size} páginas: "
+        f"{pdf_path} ({total_pages} páginas)"
+    )
+
+    extracted = 0
+
+    try:
+        for first_page in range(1, total_pages + 1, chunk_size):
+            last_page = min(first_page + chunk_size - 1, total_pages)
+
+            chunk = [
+                extract_scan_image(source, n, dpi) if source is not None else None
+                for n in range(first_page, last_page + 1)
+            ]
+            extracted += sum(image is not None for image in chunk)
+
+            missing = [
+                n for n, image in zip(range(first_page, last_page + 1), chunk)
+                if image is None
+            ]
+            for start, end in _runs(missing):
+                rendered = _pdftoppm(pdf_path, dpi, start, end)
+                for n, image in zip(range(start, end + 1), rendered):
+                    chunk[n - first_page] = image
+
+            logger.debug(f"Bloque renderizado: páginas {first_page}-{last_page}")
+
+            # Se sueltan las referencias a medida que se entregan
+            # para que cada página se libere apenas el consumidor la descarta
+            chunk.reverse()
+            while chunk:
+                yield chunk.pop()
+    finally:
+        if source is not None:
+            source.close()
+
+    if direct:
+        logger.info(
+            f"Imágenes escaneadas extraídas directamente: {extracted} de "
+            f"{total_pages} páginas (el resto con poppler)"
+        )
+
+
+def render_page(
+    pdf_path: str, index: int, dpi: int, direct: bool = DIRECT_IMAGES
+) -> Image.Image:
+    """
+    Una sola página (1-based) a `dpi`: la imagen escaneada embebida si
+    se puede (ver `extract_scan_image`), si no con poppler.
+    """
+    source = _open_scan_source(pdf_path) if direct else None
+    if source is not None:
+        try:
+            image = extract_scan_image(source, index, dpi)
+        finally:
+            source.close()
+        if image is not None:
+            return image
 
-    # En Windows, configurar variable de entorno para ocultar consolas
-    # de subprocesos hijos
-    old_startupinfo = None
-    if sys.platform == 'win32':
-        # Esto funciona a nivel de sistema operativo
-        import subprocess
-        
-        # Crear STARTUPINFO para ocultar ventanas
-        if hasattr(subprocess, 'STARTUPINFO'):
-            old_startupinfo = getattr(subprocess, '_default_startupinfo', None)
-            
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            startupinfo.wShowWindow = subprocess.SW_HIDE
-            
-            # Monkey patch temporal solo para esta función
-            _original_popen_init = subprocess.Popen.__init__
-            
-            def _popen_init_hidden(self, *args, **kwargs):
-                if 'startupinfo' not in kwargs:
-                    kwargs['startupinfo'] = startupinfo
-                if 'creationflags' not in kwargs:
-                    kwargs['creationflags'] = 0
-                kwargs['creationflags'] |= subprocess.CREATE_NO_WINDOW
-                return _original_popen_init(self, *args, **kwargs)
-            
-            subprocess.Popen.__init__ = _popen_init_hidden
+    return _pdftoppm(pdf_path, dpi, index, index)[0]
 
+
+class PageRef(NamedTuple):
+    """
+    Referencia a una página (1-based) de un PDF, para volver a obtenerla
+    a otra resolución desde cualquier proceso.
+    """
+    pdf_path: str
+    index: int
+
+    def render(self, dpi: int) -> Image.Image:
+        return render_page(self.pdf_path, self.index, dpi)
+
+    def render_region(self, dpi: int, box: Tuple[int, int, int, int]) -> Image.Image:
+        return render_region(self.pdf_path, self.index, dpi, box)
+
+
+def _runs(numbers: List[int]) -> Iterator[Tuple[int, int]]:
+    """
+    Agrupa números consecutivos en rangos (inicio, fin).
+    """
+    start = prev = None
+    for n in numbers:
+        if start is None:
+            start = prev = n
+        elif n == prev + 1:
+            prev = n
+        else:
+            yield start, prev
+            start = prev = n
+    if start is not None:
+        yield start, prev
+
+
+# =========================
+# EXTRACCIÓN DIRECTA (PDF ESCANEADOS)
+# =========================
+# Un PDF de escáner suele tener por página una sola imagen (JPEG, CCITT,
+# JBIG2) que ocupa toda la página. Se decodifica esa imagen en lugar de
+# pedirle a poppler que la vuelva a rasterizar.
+
+# Operadores que no pintan nada (estado gráfico); cualquier otro
+# (texto, trazos, imágenes en línea) manda la página a poppler
+_NEUTRAL_OPERATORS = {"q", "Q", "cm", "gs", "w", "J", "j", "M", "d", "ri", "i"}
+
+# Holgura al comprobar que la imagen cubre la página (fracción del tamaño)
+_COVER_TOLERANCE = 0.02
+
+Matrix = Tuple[float, float, float, float, float, float]
+
+# Orientación de la imagen en pantalla según el signo de sus ejes
+# (dirección de las columnas, dirección de las filas) → transposición PIL
+_ORIENTATIONS = {
+    ((1, 0), (0, 1)): None,
+    ((-1, 0), (0, 1)): Image.Transpose.FLIP_LEFT_RIGHT,
+    ((1, 0), (0, -1)): Image.Transpose.FLIP_TOP_BOTTOM,
+    ((-1, 0), (0, -1)): Image.Transpose.ROTATE_180,
+    ((0, 1), (1, 0)): Image.Transpose.TRANSPOSE,
+    ((0, -1), (-1, 0)): Image.Transpose.TRANSVERSE,
+    ((0, -1), (1, 0)): Image.Transpose.ROTATE_90,
+    ((0, 1), (-1, 0)): Image.Transpose.ROTATE_270,
+}
+
+# /Rotate de la página (horario) → transposición PIL
+_PAGE_ROTATIONS = {
+    90: Image.Transpose.ROTATE_270,
+    180: Image.Transpose.ROTATE_180,
+    270: Image.Transpose.ROTATE_90,
+}
+
+
+def _open_scan_source(pdf_path: str) -> Optional[pikepdf.Pdf]:
     try:
-        images = convert_from_path(
+        return pikepdf.open(pdf_path)
+    except Exception as e:
+        logger.warning(f"No se pudo abrir con pikepdf, se usa poppler: {e}")
+        return None
+
+
+def _multiply(m1: Matrix, m2: Matrix) -> Matrix:
+    a1, b1, c1, d1, e1, f1 = m1
+    a2, b2, c2, d2, e2, f2 = m2
+    return (
+        a1 * a2 + b1 * c2,
+        a1 * b2 + b1 * d2,
+        c1 * a2 + d1 * c2,
+        c1 * b2 + d1 * d2,
+        e1 * a2 + f1 * c2 + e2,
+        e1 * b2 + f1 * d2 + f2,
+    )
+
+
+def _sign(value: float) -> int:
+    return (value > 0) - (value < 0)
+
+
+def _single_image(page: pikepdf.Page) -> Optional[Tuple[pikepdf.Object, Matrix]]:
+    """
+    La imagen y su matriz (CTM) si el contenido de la página es
+    exactamente un `Do` de una imagen; si no, None.
+    """
+    ctm: Matrix = (1, 0, 0, 1, 0, 0)
+    stack: List[Matrix] = []
+    found = None
+
+    for operands, operator in pikepdf.parse_content_stream(page):
+        op = str(operator)
+        if op == "q":
+            stack.append(ctm)
+        elif op == "Q":
+            ctm = stack.pop() if stack else ctm
+        elif op == "cm":
+            ctm = _multiply(tuple(float(v) for v in operands), ctm)
+        elif op == "Do":
+            if found is not None:
+                return None
+            xobjects = page.resources.get("/XObject", {})
+            image = xobjects.get(operands[0])
+            if image is None or image.get("/Subtype") != "/Image":
+                return None
+            found = (image, ctm)
+        elif op not in _NEUTRAL_OPERATORS:
+            return None
+
+    return found
+
+
+def _covers(ctm: Matrix, box: List[float]) -> bool:
+    a, b, c, d, e, f = ctm
+    xs = [e, e + a, e + c, e + a + c]
+    ys = [f, f + b, f + d, f + b + d]
+    x0, y0, x1, y1 = box
+    tol_x = (x1 - x0) * _COVER_TOLERANCE
+    tol_y = (y1 - y0) * _COVER_TOLERANCE
+    return (
+        abs(min(xs) - x0) <= tol_x and abs(max(xs) - x1) <= tol_x
+        and abs(min(ys) - y0) <= tol_y and abs(max(ys) - y1) <= tol_y
+    )
+
+
+def extract_scan_image(
+    pdf: pikepdf.Pdf, index: int, dpi: int = RENDER_DPI
+) -> Optional[Image.Image]:
+    """
+    Decodifica la imagen escaneada de la página `index` (1-based) sin
+    pasar por poppler, orientada como se ve en pantalla y escalada al
+    tamaño que tendría el render a `dpi`.
+
+    Devuelve None si la página no es una sola imagen que cubre la página
+    (contenido vectorial, texto, máscaras...) o si no se puede decodificar
+    (p. ej. JBIG2 sin jbig2dec): en ese caso se renderiza con poppler.
+    """
+    try:
+        page = pdf.pages[index - 1]
+        placement = _single_image(page)
+        if placement is None:
+            return None
+        xobject, ctm = placement
+
+        if any(key in xobject for key in ("/ImageMask", "/SMask", "/Mask", "/Decode")):
+            return None
+
+        x0, y0, x1, y1 = (float(v) for v in page.cropbox)
+        box = [min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)]
+        if not _covers(ctm, box):
+            return None
+
+        # Ejes de la imagen en pantalla (y hacia abajo): columnas y filas
+        a, b, c, d, _, _ = ctm
+        if abs(a) >= abs(b):
+            orientation = ((_sign(a), 0), (0, _sign(d)))
+        else:
+            orientation = ((0, _sign(-b)), (_sign(-c), 0))
+        if orientation not in _ORIENTATIONS:
+            return None
+
+        pdf_image = pikepdf.PdfImage(xobject)
+        if pdf_image.mode == "CMYK":
+            return None
+        image = pdf_image.as_pil_image()
+    except Exception as e:
+        logger.debug(f"Página {index}: extracción directa no disponible ({e})")
+        return None
+
+    if _ORIENTATIONS[orientation] is not None:
+        image = image.transpose(_ORIENTATIONS[orientation])
+
+    rotation = int(page.obj.get("/Rotate", 0)) % 360
+    if rotation in _PAGE_ROTATIONS:
+        image = image.transpose(_PAGE_ROTATIONS[rotation])
+
+    width_pt, height_pt = box[2] - box[0], box[3] - box[1]
+    if rotation in (90, 270):
+        width_pt, height_pt = height_pt, width_pt
+
+    # Mismo modo y tamaño que entrega pdftoppm para esta página
+    if image.mode not in ("L", "RGB"):
+        image = image.convert("L" if image.mode in ("1", "LA", "I", "I;16") else "RGB")
+    size = _pixel_size(width_pt, height_pt, dpi)
+    if image.size != size:
+        image = image.resize(size, Image.Resampling.BILINEAR)
+    return image.convert("RGB")
+
+
+# =========================
+# RENDER POR REGIONES (ROI)
+# =========================
+# Zonas que leen los detectores, como fracciones (x0, y0, x1, y1) de la
+# página. Cada recorte se sirve desde la primera zona que lo contiene,
+# así una sola rasterización cubre varios detectores.
+ROI_BANDS = (
+    (0.05, 0.80, 1.00, 1.00),  # pie: número de página, QR, barcode, No.FAC
+    (0.70, 0.06, 0.98, 0.13),  # encabezado: No. / Ref.Int.
+    (0.00, 0.00, 1.00, 0.35),  # OCR-TOP (solo cascada OCR)
+    (0.00, 0.65, 1.00, 1.00),  # OCR-BOTTOM (solo cascada OCR)
+)
+
+Box = Tuple[int, int, int, int]
+
+
+def _pixel_size(width_pt: float, height_pt: float, dpi: int) -> Tuple[int, int]:
+    # Mismo redondeo que pdftoppm (hacia arriba)
+    scale = dpi / 72.0
+    return (
+        int(math.ceil(width_pt * scale - 1e-6)),
+        int(math.ceil(height_pt * scale - 1e-6)),
+    )
+
+
+def _contains(outer: Box, inner: Box) -> bool:
+    return (
+        outer[0] <= inner[0] and outer[1] <= inner[1]
+        and inner[2] <= outer[2] and inner[3] <= outer[3]
+    )
+
+
+# PyMuPDF no es thread-safe: un solo hilo a la vez usa sus documentos
+# (p. ej. con el escritor de salida en paralelo)
+_FITZ_LOCK = threading.RLock()
+
+
+# Documentos abiertos (los últimos _FITZ_CACHE_SIZE), por proceso:
+# no se comparten tras un fork
+_FITZ_CACHE_SIZE = 4
+_fitz_documents: "OrderedDict[Tuple[str, int], object]" = OrderedDict()
+
+
+def _fitz_document(pdf_path: str):
+    key = (pdf_path, os.getpid())
+    with _FITZ_LOCK:
+        document = _fitz_documents.get(key)
+        if document is None:
+            document = fitz.open(pdf_path)
+            _fitz_documents[key] = document
+            while len(_fitz_documents) > _FITZ_CACHE_SIZE:
+                _close_entry(*_fitz_documents.popitem(last=False))
+        else:
+            _fitz_documents.move_to_end(key)
+        return document
+
+
+def _close_entry(key: Tuple[str, int], document) -> None:
+    # Los documentos heredados de otro proceso solo se sueltan
+    if key[1] == os.getpid():
+        document.close()
+
+
+def close_documents(pdf_path: Optional[str] = None) -> None:
+    """
+    Cierra los documentos PyMuPDF abiertos en este proceso (todos, o solo
+    los de `pdf_path`). Libera el archivo: en Windows no se puede mover
+    ni borrar un PDF mientras está abierto.
+    """
+    with _FITZ_LOCK:
+        for key in list(_fitz_documents):
+            if pdf_path is None or key[0] == str(pdf_path):
+                _close_entry(key, _fitz_documents.pop(key))
+
+
+def page_geometry(pdf_path: str) -> List[Tuple[float, float]]:
+    """
+    Ancho y alto (en puntos, ya rotados) de cada página del PDF.
+    """
+    if fitz is not None:
+        with _FITZ_LOCK:
+            return [(page.rect.width, page.rect.height) for page in _fitz_document(pdf_path)]
+
+    poppler_path = _poppler_path()
+    total_pages = get_page_count(pdf_path)
+    result = run_tool(
+        [
+            str(poppler_path / "pdfinfo"), "-box",
+            "-f", "1", "-l", str(total_pages), pdf_path,
+        ],
+        text=True,
+        errors="replace",
+        **no_window_kwargs(),
+    )
+
+    boxes = {}
+    rotations = {}
+    for line in result.stdout.splitlines():
+        m = re.match(r"Page\s+(\d+)\s+MediaBox:\s+([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)", line)
+        if m:
+            x0, y0, x1, y1 = (float(v) for v in m.groups()[1:])
+            boxes[int(m.group(1))] = (abs(x1 - x0), abs(y1 - y0))
+            continue
+        m = re.match(r"Page\s+(\d+)\s+rot:\s+(-?\d+)", line)
+        if m:
+            rotations[int(m.group(1))] = int(m.group(2)) % 360
+
+    if len(boxes) != total_pages:
+        raise RuntimeError(f"No se pudo leer la geometría de las páginas: {pdf_path}")
+
+    geometry = []
+    for n in range(1, total_pages + 1):
+        width, height = boxes[n]
+        if rotations.get(n, 0) in (90, 270):
+            width, height = height, width
+        geometry.append((width, height))
+    return geometry
+
+
+def render_region(pdf_path: str, index: int, dpi: int, box: Box) -> Image.Image:
+    """
+    Rasteriza solo `box` (en píxeles a `dpi`) de la página `index` (1-based).
+    """
+    x0, y0, x1, y1 = box
+
+    if fitz is not None:
+        with _FITZ_LOCK:
+            page = _fitz_document(pdf_path)[index - 1]
+            zoom = dpi / 72.0
+            clip = fitz.Rect(x0 / zoom, y0 / zoom, x1 / zoom, y1 / zoom)
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, alpha=False)
+            return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+    poppler_path = _poppler_path()
+    result = run_tool(
+        [
+            str(poppler_path / "pdftoppm"),
+            "-r", str(dpi),
+            "-f", str(index), "-l", str(index),
+            "-x", str(x0), "-y", str(y0),
+            "-W", str(x1 - x0), "-H", str(y1 - y0),
             pdf_path,
-            dpi=dpi,
-            poppler_path=str(poppler_path)
+        ],
+        **no_window_kwargs(),
+    )
+    if result.returncode != 0 or not result.stdout:
+        raise RuntimeError(
+            f"pdftoppm falló en la página {index}: "
+            f"{result.stderr.decode(errors='replace').strip()}"
+        )
+
+    image = Image.open(BytesIO(result.stdout))
+    image.load()
+    return image.convert("RGB")
+
+
+class PdfPage:
+    """
+    Página de un PDF que se rasteriza por regiones y bajo demanda.
+
+    Expone lo que usan los detectores de `PIL.Image` (`size` y `crop`),
+    así que se pasa a `split_by_barcode` igual que una imagen. Cada
+    recorte se sirve desde la zona de `ROI_BANDS` que lo contiene, que se
+    rasteriza una sola vez a `dpi`; la página completa solo se rasteriza
+    con `render()`, a la resolución de salida.
+    """
+
+    def __init__(
+        self,
+        pdf_path: str,
+        index: int,
+        width_pt: float,
+        height_pt: float,
+        dpi: int = RENDER_DPI,
+    ):
+        self.pdf_path = str(pdf_path)
+        self.index = index
+        self.width_pt = width_pt
+        self.height_pt = height_pt
+        self.dpi = dpi
+        self.size = _pixel_size(width_pt, height_pt, dpi)
+        self._bands: List[Tuple[Box, Image.Image]] = []
+
+    def _band_boxes(self) -> List[Box]:
+        w, h = self.size
+        return [
+            (int(w * x0), int(h * y0), int(w * x1), int(h * y1))
+            for x0, y0, x1, y1 in ROI_BANDS
+        ]
+
+    def crop(self, box) -> Image.Image:
+        box = tuple(int(v) for v in box)
+
+        for band_box, band in self._bands:
+            if _contains(band_box, box):
+                break
+        else:
+            band_box = next(
+                (b for b in self._band_boxes() if _contains(b, box)), box
+            )
+            band = render_region(self.pdf_path, self.index, self.dpi, band_box)
+            self._bands.append((band_box, band))
+
+        ox, oy = band_box[0], band_box[1]
+        return band.crop((box[0] - ox, box[1] - oy, box[2] - ox, box[3] - oy))
+
+    def release(self) -> None:
+        """
+        Libera las zonas rasterizadas (la página sigue siendo utilizable).
+        """
+        self._bands = []
+
+    def render(self, dpi: Optional[int] = None) -> Image.Image:
+        """
+        Página completa a `dpi` (por defecto, la de detección).
+        """
+        dpi = dpi or self.dpi
+        width, height = _pixel_size(self.width_pt, self.height_pt, dpi)
+        return render_region(self.pdf_path, self.index, dpi, (0, 0, width, height))
+
+
+def iter_pdf_pages(pdf_path: str, dpi: int = RENDER_DPI) -> Iterator[PdfPage]:
+    """
+    Modo ROI: entrega una `PdfPage` por página sin rasterizar nada todavía.
+    """
+    geometry = page_geometry(pdf_path)
+    logger.info(f"Render por regiones (ROI): {pdf_path} ({len(geometry)} páginas)")
+
+    for index, (width_pt, height_pt) in enumerate(geometry, start=1):
+        yield PdfPage(pdf_path, index, width_pt, height_pt, dpi)
+
+
+def iter_pages(
+    pdf_path: str,
+    mode: str = RENDER_MODE,
+    chunk_size: int = RENDER_CHUNK_SIZE,
+    cancel: Optional[CancelToken] = None,
+) -> Iterator:
+    """
+    Páginas para `split_by_barcode` según el modo de render:
+    "full" (imágenes completas por bloques), "roi" (`PdfPage`) o
+    "adaptive" (`PageContext` al primer DPI de `DPI_LADDER`).
+
+    Con `cancel` se revisa la cancelación antes de cada página (así no
+    empieza otro bloque) y al recibirla (un render cortado no se entrega).
+    """
+    if mode == "roi":
+        pages = iter_pdf_pages(pdf_path)
+    elif mode == "adaptive":
+        pages = iter_ladder_pages(pdf_path, chunk_size=chunk_size)
+    else:
+        pages = iter_pdf_images(pdf_path, chunk_size=chunk_size)
+    return checked(pages, cancel) if cancel is not None else pages
+
+
+def iter_ladder_pages(
+    pdf_path: str,
+    ladder: Sequence[int] = DPI_LADDER,
+    chunk_size: int = RENDER_CHUNK_SIZE,
+) -> Iterator:
+    """
+    Modo "adaptive": cada página se renderiza (por bloques) al primer
+    escalón de `ladder` y se entrega como `PageContext` que sabe volver
+    a obtenerse al siguiente (`PageContext.escalate`).
+    """
+    # page_context importa este módulo
+    from page_context import PageContext
+
+    ladder = tuple(sorted(ladder))
+    logger.info(f"Detección adaptativa: escalera de DPI {ladder}")
+
+    images = iter_pdf_images(pdf_path, dpi=ladder[0], chunk_size=chunk_size)
+    for index, image in enumerate(images, start=1):
+        yield PageContext(
+            image, source=PageRef(str(pdf_path), index), dpi=ladder[0], ladder=ladder
         )
-        logger.info(f"Páginas convertidas: {len(images)}")
-        return images
-    finally:
-        # Restaurar
-        if sys.platform == 'win32' and old_startupinfo is not None:
-            subprocess.Popen.__init__ = _original_popen_init
\ No newline at end of file
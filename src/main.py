@@ -1,79 +1,90 @@
-import sys
-import re
+import argparse
+import multiprocessing
 from pathlib import Path
-from collections import defaultdict
 from logger import logger
-from image_converter import pdf_to_images
-from pdf_processor import split_by_barcode
-from utils.file_utils import save_pdf
+from ocr_engine import check_engine
+from pipeline import run_batch, write_report
+from settings import DETECTION_WORKERS
+from utils.metrics import format_summary
 
 OUTPUT_DIR = Path("output")
-OUTPUT_DIR.mkdir(exist_ok=True)
 
 
-def safe_filename(text: str) -> str:
-    """
-    Limpia un texto para que sea seguro como nombre de archivo en Windows.
-    """
-    text = text.strip()
-    text = re.sub(r"[<>:\"/\\|?*\n\r\t]", "_", text)
-    text = re.sub(r"\s+", "_", text)
-    return text[:150]  # límite defensivo
-
-
-def main():
-    if len(sys.argv) < 2:
-        print("Uso: scanner.exe archivo1.pdf archivo2.pdf ...")
-        sys.exit(1)
-
-    pdf_files = sys.argv[1:]
-    counters = defaultdict(int)
-
-    global_report = {
-        "total_pdfs": 0,
-        "total_pages": 0,
-        "documents_with_code": 0,
-        "documents_without_code": 0,
-        "errors": []
-    }
-
-    for pdf_path in pdf_files:
-        path = Path(pdf_path)
-
-        if not path.exists():
-            logger.error(f"No existe: {pdf_path}")
-            global_report["errors"].append(pdf_path)
-            continue
-
-        logger.info(f"Procesando PDF: {pdf_path}")
-        global_report["total_pdfs"] += 1
-
-        images = pdf_to_images(str(path))
-        documents, report = split_by_barcode(images)
-
-        global_report["total_pages"] += report["total_pages"]
-        global_report["documents_with_code"] += report["documents_with_code"]
-        global_report["documents_without_code"] += report["documents_without_code"]
-
-        for code, imgs in documents.items():
-            safe_code = safe_filename(code)
-            counters[safe_code] += 1
-
-            suffix = f"_{counters[safe_code]}" if counters[safe_code] > 1 else ""
-            filename = f"{safe_code}{suffix}.pdf"
-
-            save_pdf(imgs, OUTPUT_DIR / filename)
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="scanner.exe",
+        description="Separa PDFs escaneados en una factura por archivo.",
+    )
+    parser.add_argument("pdfs", nargs="+", metavar="archivo.pdf", help="PDFs a procesar")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1,
+        help="PDFs que se analizan a la vez (comparten el pool de detección)",
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=DETECTION_WORKERS,
+        help="procesos de detección para todo el lote (SCANNER_WORKERS)",
+    )
+    parser.add_argument(
+        "-o", "--output-dir", type=Path, default=OUTPUT_DIR,
+        help="carpeta de salida (por defecto: output)",
+    )
+    parser.add_argument(
+        "-r", "--report", type=Path, default=None,
+        help="guarda el reporte por PDF y por factura (.json o .csv)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    check_engine()
+
+    batch_report = run_batch(
+        args.pdfs, args.output_dir, jobs=args.jobs, workers=args.workers
+    )
+    summary = batch_report["summary"]
 
     # REPORTE GLOBAL
     print("\n====== REPORTE GLOBAL ======")
-    print(f"PDFs procesados: {global_report['total_pdfs']}")
-    print(f"Páginas procesadas: {global_report['total_pages']}")
-    print(f"Facturas sin código: {global_report['documents_without_code']}")
-    print(f"Errores: {len(global_report['errors'])}")
+    print(f"PDFs procesados: {summary['total_pdfs']}")
+    print(f"Páginas procesadas: {summary['total_pages']}")
+    print(f"Facturas generadas: {summary['invoices']}")
+    print(f"Facturas sin código: {summary['documents_without_code']}")
+    print(
+        f"Caché: {summary['cache_hits']} aciertos / "
+        f"{summary['cache_misses']} fallos"
+    )
+    print(
+        f"Números de página leídos: {summary['page_number_ocr']} "
+        f"(omitidos: {summary['page_number_skipped']})"
+    )
+    print(f"Recortes No.FAC omitidos (atajos OCR): {summary['ocr_shortcuts']}")
+    print(
+        f"Códigos localizados fuera de las zonas fijas (OCR evitado): "
+        f"{summary['located_found']} de {summary['located_tried']}"
+    )
+    if summary["dpi"]:
+        print("DPI de detección: " + ", ".join(
+            f"{dpi} DPI: {pages} págs." for dpi, pages in summary["dpi"].items()
+        ))
+    print(f"Tiempo total: {summary['seconds']:.1f} s ({summary['jobs']} PDFs a la vez)")
+    print("Tiempos por etapa:")
+    for line in format_summary(batch_report["metrics"]):
+        print(f"  {line}")
+    print(f"Errores: {len(batch_report['errors'])}")
+    for error in batch_report["errors"]:
+        page = f" (página {error['page']})" if error["page"] is not None else ""
+        print(f"  • {error['pdf']}{page}: {error['error']}")
     print("============================\n")
 
+    if args.report is not None:
+        write_report(batch_report, args.report)
+        print(f"Reporte guardado en: {args.report}")
+
     logger.info("Procesamiento múltiple finalizado.")
 
 
 if __name__ == "__main__":
+    # Necesario para el pool de procesos en el .exe (PyInstaller)
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,73 @@
+from PIL import Image
+from typing import Dict, List, Sequence, Tuple
+
+from ocr_engine import engine_version, image_to_lines
+from utils.metrics import timed_call
+from utils.result_cache import cached
+
+# Blanco entre zonas (y alrededor): Tesseract no une renglones de
+# zonas distintas y cada renglón cae sin dudas en una sola franja
+GAP = 40
+
+# (nombre, recorte ya preprocesado)
+Region = Tuple[str, Image.Image]
+# Texto y [(palabra, confianza), ...] de una zona
+RegionText = Tuple[str, List[Tuple[str, float]]]
+
+
+# ==================================================
+# Varias zonas en una sola pasada de Tesseract
+# ==================================================
+def compose_regions(regions: Sequence[Region]) -> Tuple[Image.Image, List[Tuple[str, int, int]]]:
+    """
+    Apila los recortes (en escala de grises, alineados a la izquierda)
+    en un solo lienzo blanco, separados por GAP píxeles.
+    Devuelve el lienzo y la franja vertical (nombre, y0, y1) de cada zona.
+    """
+    width = max(image.width for _, image in regions) + 2 * GAP
+    height = sum(image.height for _, image in regions) + GAP * (len(regions) + 1)
+    canvas = Image.new("L", (width, height), 255)
+
+    bands = []
+    y = GAP
+    for name, image in regions:
+        canvas.paste(image.convert("L"), (GAP, y))
+        bands.append((name, y, y + image.height))
+        y += image.height + GAP
+    return canvas, bands
+
+
+def ocr_regions(
+    regions: Sequence[Region],
+    lang: str = "eng",
+    config: str = "--psm 6",
+    stage: str = "ocr:MULTI",
+) -> Dict[str, RegionText]:
+    """
+    OCR de todas las zonas con una sola llamada a Tesseract: cada
+    renglón reconocido vuelve a la zona donde cae su centro.
+    Devuelve {nombre: (texto, [(palabra, confianza), ...])}, con el
+    texto en el mismo formato de `image_to_string` (un renglón por línea).
+    """
+    canvas, bands = compose_regions(regions)
+    lines = cached(
+        "ocr_lines",
+        canvas,
+        f"{engine_version()}|{lang}|{config}",
+        lambda: timed_call(stage, image_to_lines, canvas, lang=lang, config=config),
+    )
+
+    routed = {name: ([], []) for name, _, _ in bands}
+    for top, bottom, text, words in lines:
+        center = (top + bottom) / 2
+        for name, y0, y1 in bands:
+            if y0 - GAP / 2 <= center < y1 + GAP / 2:
+                routed[name][0].append(text)
+                # De la caché vuelven como listas
+                routed[name][1].extend((word, conf) for word, conf in words)
+                break
+
+    return {
+        name: ("\n".join(texts) + "\n" if texts else "", words)
+        for name, (texts, words) in routed.items()
+    }
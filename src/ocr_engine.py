@@ -0,0 +1,308 @@
+import queue
+import re
+import threading
+from contextlib import contextmanager
+from loguru import logger
+from PIL import Image
+from typing import List, Optional, Tuple
+
+import pytesseract
+
+from settings import OCR_ENGINES
+from utils.runtime import tesseract_cmd, tessdata_dir
+
+# tesserocr es opcional: enlaza libtesseract y mantiene el modelo cargado
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+
+# =========================
+# Configuración Tesseract (PORTABLE)
+# =========================
+_TESSERACT = tesseract_cmd()
+if _TESSERACT.exists():
+    pytesseract.pytesseract.tesseract_cmd = str(_TESSERACT)
+else:
+    logger.warning(f"Tesseract no encontrado en {_TESSERACT}")
+
+
+_PSM_REGEX = re.compile(r"--psm\s+(\d+)")
+_VAR_REGEX = re.compile(r"-c\s+(\w+)=(\S+)")
+
+
+# =========================
+# POOL DE MOTORES
+# =========================
+class TesseractPool:
+    """
+    Motores libtesseract (tesserocr) que se crean una sola vez por
+    proceso y se reutilizan en cada recorte: `eng.traineddata` se carga
+    al crear cada motor y no en cada llamada.
+
+    Hasta `size` motores se crean bajo demanda; cada llamada toma uno
+    libre (o espera) y lo devuelve al terminar.
+    """
+
+    def __init__(self, size: int):
+        self._size = max(1, size)
+        self._created = 0
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+
+    def _create(self, lang: str):
+        path = tessdata_dir()
+        kwargs = {"lang": lang}
+        if path.exists():
+            kwargs["path"] = str(path)
+        logger.debug(f"Inicializando motor Tesseract ({lang})")
+        return tesserocr.PyTessBaseAPI(**kwargs)
+
+    @contextmanager
+    def acquire(self, lang: str):
+        api = None
+        try:
+            api = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self._size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    api = self._create(lang)
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                api = self._idle.get()
+
+        try:
+            if api.GetInitLanguagesAsString() != lang:
+                api.Init(path=api.GetDatapath(), lang=lang)
+            yield api
+        finally:
+            self._idle.put(api)
+
+
+_pool: Optional[TesseractPool] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> Optional[TesseractPool]:
+    global _pool
+
+    if tesserocr is None:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = TesseractPool(OCR_ENGINES)
+    return _pool
+
+
+def engine_name() -> str:
+    return "tesserocr" if tesserocr is not None else "pytesseract"
+
+
+_checked = False
+
+
+def check_engine() -> None:
+    """
+    Avisa una sola vez, al arrancar, si no hay motores persistentes: sin
+    tesserocr cada recorte lanza un proceso tesseract (mucho más lento).
+    """
+    global _checked
+
+    if _checked:
+        return
+    _checked = True
+
+    if tesserocr is None:
+        logger.warning(
+            "tesserocr no instalado: el OCR usa pytesseract "
+            "(un proceso tesseract por recorte, sin motores persistentes)"
+        )
+    else:
+        logger.info(f"OCR con tesserocr ({OCR_ENGINES} motores por proceso)")
+
+
+_version: Optional[str] = None
+
+
+def engine_version() -> str:
+    """
+    Motor + versión de Tesseract; forma parte de las claves de caché
+    para que un cambio de motor no reutilice textos viejos.
+    """
+    global _version
+
+    if _version is None:
+        try:
+            if tesserocr is not None:
+                version = tesserocr.tesseract_version().splitlines()[0]
+            else:
+                version = str(pytesseract.get_tesseract_version())
+        except Exception:
+            version = "desconocida"
+        _version = f"{engine_name()}-{version}"
+
+    return _version
+
+
+def _configure(api, config: str) -> None:
+    # Traduce los flags de línea de comandos (--psm, -c var=valor)
+    psm = _PSM_REGEX.search(config)
+    api.SetPageSegMode(int(psm.group(1)) if psm else tesserocr.PSM.AUTO)
+    for name, value in _VAR_REGEX.findall(config):
+        api.SetVariable(name, value)
+
+
+# =========================
+# API PÚBLICA
+# =========================
+def image_to_string(
+    image: Image.Image,
+    lang: str = "eng",
+    config: str = "--psm 6",
+) -> str:
+    """
+    Equivalente a `pytesseract.image_to_string`, pero con un motor ya
+    cargado cuando tesserocr está disponible. Sin tesserocr se usa
+    pytesseract (un proceso tesseract por llamada).
+    """
+    pool = _get_pool()
+
+    if pool is None:
+        return pytesseract.image_to_string(image, lang=lang, config=config)
+
+    with pool.acquire(lang) as api:
+        _configure(api, config)
+
+        api.SetImage(image)
+        return api.GetUTF8Text()
+
+
+def image_to_data(
+    image: Image.Image,
+    lang: str = "eng",
+    config: str = "--psm 6",
+) -> Tuple[str, List[Tuple[str, float]]]:
+    """
+    Texto y confianza (0-100) de cada palabra en una sola pasada de
+    Tesseract: (texto, [(palabra, confianza), ...]).
+
+    Con pytesseract el texto se rearma desde `image_to_data` (mismas
+    palabras y renglones que `image_to_string`; los espacios pueden variar).
+    """
+    pool = _get_pool()
+
+    if pool is None:
+        data = pytesseract.image_to_data(
+            image, lang=lang, config=config, output_type=pytesseract.Output.DICT
+        )
+        return _text_from_data(data), [
+            (word, float(conf))
+            for word, conf in zip(data["text"], data["conf"])
+            if word.strip() and float(conf) >= 0
+        ]
+
+    with pool.acquire(lang) as api:
+        _configure(api, config)
+
+        api.SetImage(image)
+        text = api.GetUTF8Text()
+        return text, [(word, float(conf)) for word, conf in api.MapWordConfidences()]
+
+
+# (arriba, abajo, texto, [(palabra, confianza), ...]) de cada renglón
+OcrLine = Tuple[int, int, str, List[Tuple[str, float]]]
+
+
+def image_to_lines(
+    image: Image.Image,
+    lang: str = "eng",
+    config: str = "--psm 6",
+) -> List[OcrLine]:
+    """
+    Renglones reconocidos con su franja vertical (en píxeles de `image`)
+    y la confianza de cada palabra, en una sola pasada de Tesseract.
+    Sirve para repartir el texto de una imagen compuesta por varias
+    zonas (ver `multi_roi_ocr`).
+    """
+    pool = _get_pool()
+
+    if pool is None:
+        data = pytesseract.image_to_data(
+            image, lang=lang, config=config, output_type=pytesseract.Output.DICT
+        )
+        return _lines_from_data(data)
+
+    lines = []
+    with pool.acquire(lang) as api:
+        _configure(api, config)
+
+        api.SetImage(image)
+        api.Recognize()
+        level = tesserocr.RIL.WORD
+        for word in tesserocr.iterate_level(api.GetIterator(), level):
+            text = word.GetUTF8Text(level)
+            if not text or not text.strip():
+                continue
+            if not lines or word.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                box = word.BoundingBox(tesserocr.RIL.TEXTLINE) or word.BoundingBox(level)
+                lines.append([box[1], box[3], [], []])
+            lines[-1][2].append(text.strip())
+            lines[-1][3].append((text.strip(), float(word.Confidence(level))))
+
+    return [(top, bottom, " ".join(words), confs) for top, bottom, words, confs in lines]
+
+
+def _lines_from_data(data) -> List[OcrLine]:
+    lines = {}
+    for n, word in enumerate(data["text"]):
+        if not word.strip() or float(data["conf"][n]) < 0:
+            continue
+        key = (data["block_num"][n], data["par_num"][n], data["line_num"][n])
+        top = data["top"][n]
+        bottom = top + data["height"][n]
+        if key not in lines:
+            lines[key] = [top, bottom, [], []]
+        line = lines[key]
+        line[0], line[1] = min(line[0], top), max(line[1], bottom)
+        line[2].append(word)
+        line[3].append((word, float(data["conf"][n])))
+
+    return [(top, bottom, " ".join(words), confs) for top, bottom, words, confs in lines.values()]
+
+
+def _text_from_data(data) -> str:
+    # Un renglón por (bloque, párrafo, línea); línea en blanco entre párrafos
+    lines = []
+    current, paragraph = None, None
+    for n, word in enumerate(data["text"]):
+        if not word.strip():
+            continue
+        key = (data["block_num"][n], data["par_num"][n], data["line_num"][n])
+        if key != current:
+            if paragraph is not None and key[:2] != paragraph:
+                lines.append("")
+            lines.append(word)
+            current, paragraph = key, key[:2]
+        else:
+            lines[-1] += f" {word}"
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def warm_up(lang: str = "eng") -> None:
+    """
+    Carga el modelo por adelantado (p. ej. como `initializer` de un pool
+    de procesos) para que la primera página no pague la inicialización.
+    """
+    pool = _get_pool()
+    if pool is not None:
+        with pool.acquire(lang):
+            pass
@@ -0,0 +1,157 @@
+import numpy as np
+from PIL import Image
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+
+from image_converter import PageRef, PdfPage
+from utils.image_preprocessor import binarize
+
+# Zona como fracciones (x0, y0, x1, y1) del ancho/alto de la página
+Zone = Tuple[float, float, float, float]
+Box = Tuple[int, int, int, int]
+
+
+class ZoneRef(NamedTuple):
+    """
+    Una zona de una página para rasterizar más tarde (en cualquier
+    proceso) a otra resolución que la de la página.
+    """
+    source: PageRef
+    dpi: int
+    box: Box
+
+    def render(self) -> Image.Image:
+        return self.source.render_region(self.dpi, self.box).convert("L")
+
+
+# ==================================================
+# Contexto por página (escala de grises compartida)
+# ==================================================
+class PageContext:
+    """
+    Una página lista para los detectores: la escala de grises se calcula
+    una sola vez y cada zona (ROI) se entrega como vista del mismo array,
+    sin copiar. La versión binarizada de cada zona se memoriza.
+
+    Con una `PdfPage` (modo ROI) no hay página completa: cada zona se
+    pide a la página (que rasteriza solo su franja) y se memoriza.
+
+    Se puede enviar a otro proceso: se serializa solo la escala de
+    grises, no la imagen RGB.
+
+    En modo "adaptive" la página viene a un DPI bajo (`dpi`) y con su
+    `source`: `escalate()` la vuelve a obtener al siguiente escalón de
+    `ladder`.
+    """
+
+    def __init__(
+        self,
+        image,
+        source: Optional[PageRef] = None,
+        dpi: Optional[int] = None,
+        ladder: Sequence[int] = (),
+    ):
+        self.image = image
+        self.size = image.size
+        self.source = source
+        self.dpi = dpi if dpi is not None else getattr(image, "dpi", None)
+        self.ladder = tuple(ladder)
+        self._gray = None
+        self._zones: Dict[Box, np.ndarray] = {}
+        self._binarized: Dict[Box, np.ndarray] = {}
+
+    def box(self, zone: Zone) -> Box:
+        # Mismo redondeo que los recortes originales: int(w * fracción)
+        w, h = self.size
+        x0, y0, x1, y1 = zone
+        return (int(w * x0), int(h * y0), int(w * x1), int(h * y1))
+
+    def gray(self, zone: Zone) -> np.ndarray:
+        """
+        Zona en escala de grises (vista de solo lectura).
+        """
+        box = self.box(zone)
+        x0, y0, x1, y1 = box
+
+        if isinstance(self.image, PdfPage):
+            if box not in self._zones:
+                region = np.asarray(self.image.crop(box).convert("L"))
+                region.flags.writeable = False
+                self._zones[box] = region
+            return self._zones[box]
+
+        self.load_gray()
+        return self._gray[y0:y1, x0:x1]
+
+    def load_gray(self) -> "PageContext":
+        """
+        Calcula ya la escala de grises de la página completa (no aplica a
+        una `PdfPage`). Así, enviada a otro proceso, no lleva la imagen RGB.
+        """
+        if self._gray is None and not isinstance(self.image, PdfPage):
+            self._gray = np.asarray(self.image.convert("L"))
+            self._gray.flags.writeable = False
+        return self
+
+    def gray_image(self, zone: Zone) -> Image.Image:
+        """
+        Zona en escala de grises como imagen PIL (para decodificadores/OCR).
+        """
+        return Image.fromarray(self.gray(zone))
+
+    def binarized(self, zone: Zone) -> Image.Image:
+        """
+        Zona binarizada para OCR (umbral adaptativo), memorizada.
+        """
+        box = self.box(zone)
+        if box not in self._binarized:
+            self._binarized[box] = binarize(self.gray(zone))
+        return Image.fromarray(self._binarized[box])
+
+    def zone_ref(self, zone: Zone, dpi: int) -> Optional[ZoneRef]:
+        """
+        La zona a `dpi` si la página vino a menos y se sabe de dónde salió
+        (modo "adaptive"); si no, None (la zona se lee de esta página).
+        """
+        if self.source is None or self.dpi is None or self.dpi >= dpi:
+            return None
+        scale = dpi / self.dpi
+        w, h = (int(round(v * scale)) for v in self.size)
+        x0, y0, x1, y1 = zone
+        return ZoneRef(
+            self.source, dpi, (int(w * x0), int(h * y0), int(w * x1), int(h * y1))
+        )
+
+    def zone_image(self, zone: Zone, dpi: int) -> Image.Image:
+        """
+        Zona en escala de grises a `dpi` como mínimo (ver `zone_ref`).
+        """
+        ref = self.zone_ref(zone, dpi)
+        return ref.render() if ref is not None else self.gray_image(zone)
+
+    def escalate(self) -> Optional["PageContext"]:
+        """
+        La misma página al siguiente DPI de la escalera, o None si ya está
+        en el último (o no se sabe de dónde salió).
+        """
+        higher = [dpi for dpi in self.ladder if self.dpi is None or dpi > self.dpi]
+        if self.source is None or not higher:
+            return None
+        return PageContext(
+            self.source.render(higher[0]), self.source, higher[0], self.ladder
+        )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._gray is not None:
+            # Ya no hace falta la imagen RGB (3 veces más grande)
+            state["image"] = None
+        return state
+
+
+def as_context(image) -> PageContext:
+    """
+    Acepta una imagen, una `PdfPage` o un `PageContext` ya creado.
+    """
+    if isinstance(image, PageContext):
+        return image
+    return PageContext(image)
@@ -1,29 +1,42 @@
 import re
-from collections import defaultdict, Counter
+import time
+from collections import defaultdict, deque, Counter
+from contextlib import ExitStack
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
 from loguru import logger
 from PIL import Image
-from typing import List, Tuple, Dict, Optional
-
-import pytesseract
+from typing import Any, Callable, Iterable, Iterator, List, NamedTuple, Tuple, Dict, Optional
 
 from invoice_text_parser import (
     extract_invoice_number_from_text,
     extract_ref_int_from_text,
 )
-from utils.image_preprocessor import preprocess_for_ocr
-from utils.runtime import tesseract_cmd
-from extract_codes import extract_codes
-from extract_qr_and_barcode import extract_qr_and_barcode
-
-
-# =========================
-# Configuración Tesseract (PORTABLE)
-# =========================
-_TESSERACT = tesseract_cmd()
-if _TESSERACT.exists():
-    pytesseract.pytesseract.tesseract_cmd = str(_TESSERACT)
-else:
-    logger.warning(f"Tesseract no encontrado en {_TESSERACT}")
+from ocr_engine import image_to_string, engine_version, warm_up
+from utils.result_cache import cached, cache_stats
+from utils.job_journal import JobJournal
+from utils.metrics import Metrics, collecting, timed, timed_call, timed_iter
+from utils.progress import ProgressCallback, ProgressEvent, report_rendered
+from utils.cancellation import CancelToken, Cancelled
+from extract_codes import OCR_CONFIG, OCR_LANG, extract_codes, extract_codes_multi
+from extract_qr_and_barcode import (
+    extract_located_codes,
+    extract_qr_and_barcode,
+    extract_qr_and_barcode_batch,
+)
+from decoders import get_decoder
+from image_converter import PdfPage
+from multi_roi_ocr import ocr_regions
+from page_context import PageContext, ZoneRef, as_context
+from settings import (
+    DETECTION_WORKERS,
+    DECODE_BATCH_SIZE,
+    LOCATE_CODES,
+    OCR_MODE,
+    PAGE_NUMBER_MODE,
+    RENDER_DPI,
+)
 
 
 # =========================
@@ -57,181 +70,942 @@ def extract_page_number(text: str) -> Optional[int]:
 
 
 
-def extract_page_number_from_image(image: Image.Image) -> Optional[int]:
+# Zonas (fracciones de la página)
+# ⚠️ CROP ORIGINAL DEL NÚMERO DE PÁGINA (NO MODIFICADO)
+PAGE_NUMBER_ZONE = (0.8, 0.9, 1.0, 1.0)
+TOP_ZONE = (0.0, 0.0, 1.0, 0.35)
+BOTTOM_ZONE = (0.0, 0.65, 1.0, 1.0)
+FULL_ZONE = (0.0, 0.0, 1.0, 1.0)
+
+
+def page_number_crop(image) -> Image.Image:
+    """
+    Recorte (en escala de grises) del pie donde está el "Pág. N de M".
+    En modo "adaptive" el pie se vuelve a rasterizar a RENDER_DPI: el
+    primer escalón alcanza para los códigos, no para este OCR.
+    """
+    return as_context(image).zone_image(PAGE_NUMBER_ZONE, RENDER_DPI)
+
+
+def _page_number_context(context: PageContext) -> Tuple[PageContext, Tuple]:
+    # (página, zona) de donde se lee el número: el pie a RENDER_DPI en
+    # modo "adaptive", si no la misma página
+    ref = context.zone_ref(PAGE_NUMBER_ZONE, RENDER_DPI)
+    if ref is not None:
+        return PageContext(ref.render()), FULL_ZONE
+    return context, PAGE_NUMBER_ZONE
+
+
+def extract_page_number_from_image(image) -> Optional[int]:
     """
     Extrae el número de página recortando solo el pie del documento.
-    (Se mantiene EXACTAMENTE el crop que ya validaste)
+    `image` puede ser una imagen o el `PageContext` de la página.
     """
-    width, height = image.size
+    return _page_number_from_zone(*_page_number_context(as_context(image)))
 
-    # ⚠️ CROP ORIGINAL (NO MODIFICADO)
-    bottom_crop = image.crop(
-        (int(width * 0.8), int(height * 0.9), width, height)
-    )
 
-    processed = preprocess_for_ocr(bottom_crop)
+def extract_page_number_from_crop(bottom_crop: Image.Image) -> Optional[int]:
+    """
+    OCR de un recorte ya hecho con `page_number_crop`.
+    """
+    return _page_number_from_zone(PageContext(bottom_crop), FULL_ZONE)
 
-    text = pytesseract.image_to_string(
-        processed,
-        lang="eng",
-        config="--psm 6"
-    )
+
+def _page_number_from_zone(context: PageContext, zone) -> Optional[int]:
+    bottom_crop = context.gray_image(zone)
+
+    def _ocr():
+        return timed_call(
+            "ocr:PAGE",
+            image_to_string,
+            context.binarized(zone),
+            lang="eng",
+            config="--psm 6"
+        )
+
+    # La caché guarda el texto: si cambia la regex no hay que invalidarla
+    text = cached("page_number", bottom_crop, f"{engine_version()}|--psm 6", _ocr)
 
     return extract_page_number(text)
 
 
 # =========================
-# Lógica principal
+# Fase 1: detección por página (sin estado compartido)
 # =========================
-def split_by_barcode(
-    images: List[Image.Image],
-) -> Tuple[Dict[str, List[Tuple[int, Image.Image]]], Dict]:
+def detect_page(
+    idx: int,
+    image,
+    decoded: Optional[Tuple[Optional[str], Optional[str]]] = None,
+    page_numbers: str = PAGE_NUMBER_MODE,
+    ocr_mode: str = OCR_MODE,
+) -> Dict:
     """
-    Procesa cada página e intenta asignarla a un documento basado en QR, barcode o OCR.
+    Analiza una sola página: número de página, QR/barcode y cascada OCR.
+
+    No depende de las páginas anteriores, por eso puede ejecutarse en un
+    proceso aparte. La continuidad de numeración y la asignación a
+    documentos se resuelven después en `PageGrouper`.
+
+    `image` puede ser una imagen o su `PageContext`: todos los detectores
+    leen sus zonas de la misma escala de grises.
+
+    `decoded` permite pasar el (numfac_qr, numfac_barcode) ya leído en
+    lote por `extract_qr_and_barcode_batch`.
+
+    Con `page_numbers="lazy"` no se lee el número de página: lo lee
+    `PageGrouper` solo si la página termina en una factura de varias.
+
+    Con `ocr_mode="multi"` las zonas OCR se leen juntas (`multi_roi_ocr`):
+    el pie del número de página va en la misma pasada que el encabezado
+    y No.FAC, y las franjas TOP y BOTTOM en una segunda.
+
+    Los tiempos de cada etapa (zbar, OCR por zona...) vuelven en
+    `result["timings"]`, así se suman también los de otros procesos.
     """
-    documents = defaultdict(list)
-    report = {
-        "total_pages": 0,
-        "documents_with_code": 0,
-        "documents_without_code": 0,
-        "errors": [],
-    }
+    page_metrics = Metrics()
+    with collecting(page_metrics), timed("detect"):
+        result = _detect_page(idx, image, decoded, page_numbers, ocr_mode)
+    result["timings"] = page_metrics.as_dict()
+    return result
 
-    current_code = None
-    last_page_number = None
-    previous_code = None
 
-    for idx, image in enumerate(images, start=1):
-        report["total_pages"] += 1
+def _detect_page(idx: int, image, decoded, page_numbers: str, ocr_mode: str) -> Dict:
+    result = _empty_result(idx)
+    cache_before = cache_stats()
+    started = time.perf_counter()
+    context = as_context(image)
+
+    try:
+        # =========================
+        # 🔢 EXTRAER NÚMERO DE PÁGINA (modo "eager")
+        # =========================
+        multi = ocr_mode == "multi"
+        if page_numbers == "lazy":
+            result["page_number_deferred"] = True
+        elif not multi:
+            result["page_number"] = extract_page_number_from_image(context)
+            result["page_number_done"] = True
+
         detected_code = None
+        source = None
+
+        # =========================
+        # 1️⃣ Intento QR + Barcode
+        # =========================
+        if decoded is None:
+            decoded = extract_qr_and_barcode(context)
+        numfac_qr, numfac_barcode = decoded
+
+        # Modo "adaptive": sin un código útil se sube de DPI antes de caer
+        # en la cascada OCR, que trabaja sobre el último escalón
+        while not _usable_code(numfac_qr or numfac_barcode):
+            higher = context.escalate()
+            if higher is None:
+                break
+            context = higher
+            numfac_qr, numfac_barcode = extract_qr_and_barcode(context)
+
+        # Tampoco en las zonas fijas: se buscan los códigos en la página
+        if LOCATE_CODES and not _usable_code(numfac_qr or numfac_barcode):
+            result["locate_tried"] = True
+            located = extract_located_codes(context)
+            if _usable_code(located[0] or located[1]):
+                numfac_qr, numfac_barcode = located
+                result["located"] = True
+
+        result["dpi"] = context.dpi
+        result["qr"], result["barcode"] = numfac_qr, numfac_barcode
+
+        if numfac_qr:
+            detected_code = numfac_qr
+            source = "QR"
+        elif numfac_barcode:
+            detected_code = numfac_barcode
+            source = "BARCODE"
+
+        # =========================
+        # 2️⃣ OCR (extract_codes)
+        # =========================
+        if not _usable_code(detected_code):
+            if multi:
+                # El pie pendiente (modo "eager") va en la misma pasada
+                footer = []
+                if page_numbers != "lazy":
+                    footer_context, footer_zone = _page_number_context(context)
+                    footer = [("page", footer_context.binarized(footer_zone))]
+                codes, texts = extract_codes_multi(context, footer)
+                if "page" in texts:
+                    result["page_number"] = extract_page_number(texts["page"])
+                    result["page_number_done"] = True
+            else:
+                codes = extract_codes(context)
+            result["ocr_shortcut"] = codes.get("shortcut")
+
+            candidates = [
+                v
+                for v in (
+                    codes.get("no_header"),
+                    codes.get("ref_int"),
+                    codes.get("no_fac"),
+                )
+                if v
+            ]
+
+            if codes.get("accepted"):
+                # El encabezado ya decidió: no hubo recorte No.FAC ni votación
+                detected_code = codes["accepted"]
+                source = "OCR-COMBINADO"
+            elif candidates:
+                detected_code = Counter(candidates).most_common(1)[0][0]
+                source = "OCR-COMBINADO"
+            else:
+                # ---------- OCR TOP / BOTTOM ----------
+                if multi:
+                    strips = ocr_regions(
+                        [
+                            ("top", context.binarized(TOP_ZONE)),
+                            ("bottom", context.binarized(BOTTOM_ZONE)),
+                        ],
+                        lang=OCR_LANG,
+                        config=OCR_CONFIG,
+                        stage="ocr:STRIPS",
+                    )
+                    text_top, text_bottom = strips["top"][0], strips["bottom"][0]
+                else:
+                    with timed("ocr:TOP"):
+                        text_top = image_to_string(
+                            context.binarized(TOP_ZONE), lang="eng", config="--psm 6"
+                        )
+
+                ref_int = extract_ref_int_from_text(text_top)
+                if ref_int:
+                    detected_code = ref_int
+                    source = "OCR-TOP"
+
+                # ---------- OCR BOTTOM ----------
+                if not detected_code:
+                    if not multi:
+                        with timed("ocr:BOTTOM"):
+                            text_bottom = image_to_string(
+                                context.binarized(BOTTOM_ZONE), lang="eng", config="--psm 6"
+                            )
+
+                    invoice_number = extract_invoice_number_from_text(text_bottom)
+                    if invoice_number:
+                        detected_code = invoice_number
+                        source = "OCR-BOTTOM"
+
+        # Modo "multi" con QR/barcode: el pie no entró en ninguna pasada
+        if page_numbers != "lazy" and not result["page_number_done"]:
+            result["page_number"] = extract_page_number_from_image(context)
+            result["page_number_done"] = True
+
+        result["code"] = detected_code
+        result["source"] = source
+
+    except Cancelled:
+        raise
+    except Exception as e:
+        logger.exception(f"❌ Error en página {idx}")
+        result["error"] = str(e)
+
+    result["cache"] = _stats_delta(cache_before, cache_stats())
+    result["seconds"] = round(time.perf_counter() - started, 4)
+    return result
+
+
+def _usable_code(code: Optional[str]) -> bool:
+    # Más corto que esto se considera lectura fallida y se pasa al OCR
+    return bool(code) and len(code) >= 6
+
+
+def _empty_result(idx: int) -> Dict:
+    return {
+        "index": idx,
+        "page_number": None,
+        "page_number_done": False,
+        "page_number_deferred": False,
+        "code": None,
+        "source": None,
+        "ocr_shortcut": None,
+        "qr": None,
+        "barcode": None,
+        "error": None,
+        # DPI con el que se detectó (None: el de render, sin escalera)
+        "dpi": None,
+        # Búsqueda de códigos fuera de las zonas fijas: intentada / con éxito
+        "locate_tried": False,
+        "located": False,
+        "cache": {},
+        "seconds": 0.0,
+        "timings": {},
+    }
+
+
+def _stats_delta(before: Dict[str, int], after: Dict[str, int]) -> Dict[str, int]:
+    return {key: after[key] - before.get(key, 0) for key in after}
+
+
+# =========================
+# Fase 2: agrupación secuencial
+# =========================
+class PageRecord(NamedTuple):
+    """
+    Lo que queda de cada página tras la detección, sin píxeles: la
+    página se vuelve a obtener al escribir desde `page` (ver
+    `utils.file_utils.output_keeper`: `SourcePage`, `SpooledPage` o una
+    `PdfPage` ya liberada).
+    """
+    index: int                  # página (1-based) del PDF original
+    page_number: Optional[int]  # "Pág. N" (None: no hizo falta leerlo)
+    code: str                   # documento al que fue
+    source: Optional[str]       # QR, BARCODE, OCR-..., ERROR o None
+    page: Any
+
+
+class PageGrouper:
+    """
+    Reproduce, en orden de página, la lógica de `current_code` /
+    `previous_code` / `last_page_number` sobre los resultados de
+    `detect_page` y arma los documentos.
+
+    El número de página solo importa para ordenar las páginas dentro de
+    una factura. Si `detect_page` no lo leyó (modo "lazy"), se guarda el
+    pie de la página y el OCR se hace recién cuando su factura pasa a
+    tener más de una página; las facturas de una sola página no lo leen.
+
+    Cada documento es una lista de `PageRecord`; lo que guarda de la
+    página es `keep_page(índice, imagen)` (por defecto, la imagen).
+
+    Con `on_document(código, páginas)` cada factura se entrega apenas
+    queda cerrada (empieza otra), con sus páginas ya ordenadas. Si un
+    código vuelve a aparecer después, sus páginas se suman al mismo
+    documento y se entrega otra vez completo (ver `InvoiceWriter`); las
+    de error y lo que quede abierto se entregan en `finish`.
+
+    Con `cancel`, el OCR diferido del número de página revisa la
+    cancelación antes de cada lectura.
+
+    Con un `executor` (el pool de detección), los pies de una factura se
+    envían a leer apenas se sabe que tiene varias páginas; una factura
+    cerrada se entrega cuando terminan esas lecturas, sin frenar la
+    agrupación de las siguientes (en orden de cierre). Sin él, los pies
+    se leen en este proceso al entregarla.
+    """
+
+    def __init__(
+        self,
+        keep_page: Optional[Callable[[int, Image.Image], Any]] = None,
+        on_document: Optional[Callable[[str, List[PageRecord]], None]] = None,
+        cancel: Optional[CancelToken] = None,
+        executor: Optional[Executor] = None,
+    ):
+        self._keep = keep_page or (lambda idx, page: page)
+        self._on_document = on_document
+        self._cancel = cancel
+        self._executor = executor
+        # Documentos con páginas nuevas desde su última entrega, y los
+        # cerrados que esperan sus números de página para entregarse
+        self._dirty: Dict[str, bool] = {}
+        self._closed: deque = deque()
+
+        self.documents: Dict[str, List[PageRecord]] = defaultdict(list)
+        self.report = {
+            "total_pages": 0,
+            "documents_with_code": 0,
+            "documents_without_code": 0,
+            "errors": [],
+            "cache": {"hits": 0, "misses": 0},
+            "page_number_ocr": {"done": 0, "skipped": 0},
+            "ocr_shortcuts": {"header": 0, "confidence": 0, "vote": 0},
+            # Páginas por DPI efectivo de detección (modo "adaptive")
+            "dpi": {},
+            # Páginas sin código en las zonas fijas: búsqueda en la página
+            # y cuántas veces evitó la cascada OCR
+            "localization": {"tried": 0, "found": 0},
+            # Una entrada por página: a qué documento fue y por qué
+            "pages": [],
+        }
+
+        self.current_code = None
+        self.previous_code = None
+
+        # Numeración: cada página apunta a la anterior de la que hereda
+        # la continuidad (None tras una factura nueva); se resuelve bajo
+        # demanda y se memoriza
+        self._last_idx: Optional[int] = None
+        self._prev: Dict[int, Optional[int]] = {}
+        self._ocr: Dict[int, Optional[int]] = {}
+        self._footers: Dict[int, Any] = {}
+        self._reading: Dict[int, Future] = {}
+        self._resolved: Dict[int, int] = {}
+        self._dropped = 0
+
+        # Tiempos por etapa: los de cada página más los de este proceso
+        self.metrics = Metrics()
+
+    def add(self, result: Dict, image: Image.Image) -> None:
+        idx = result["index"]
+        self.report["total_pages"] += 1
+        self.add_cache_stats(result.get("cache", {}))
+        self.metrics.merge(result.get("timings", {}))
 
         logger.info(f"\n📄 Procesando página {idx}")
 
-        try:
-            # =========================
-            # 🔢 EXTRAER NÚMERO DE PÁGINA (SIEMPRE)
-            # =========================
-            page_number = extract_page_number_from_image(image)
+        if result["error"] is not None:
+            # Van por índice: ni entran en la numeración ni se lee su pie
+            if result["page_number_done"]:
+                self.report["page_number_ocr"]["done"] += 1
+            logger.error(f"❌ Error en página {idx}: {result['error']}")
+            self.report["errors"].append(result["error"])
+            self.documents["ERROR"].append(
+                PageRecord(idx, None, "ERROR", "ERROR", self._keep(idx, image))
+            )
+            self._dirty["ERROR"] = True
+            self._record_page(result, "ERROR")
+            return
+
+        page_number = None
+        if result["page_number_done"] or result.get("page_number_deferred"):
+            self._link(idx, result, image)
+            if result["page_number_done"]:
+                page_number = self._page_number(idx)
+
+        detected_code = result["code"]
+        source = result["source"]
+
+        if result.get("locate_tried"):
+            self.report["localization"]["tried"] += 1
+        if result.get("located"):
+            self.report["localization"]["found"] += 1
+
+        located = " (fuera de la zona fija)" if result.get("located") else ""
+        if result["qr"]:
+            logger.info(f"[QR] Detectado{located}: {result['qr']}")
+        elif result["barcode"]:
+            logger.info(f"[BARCODE] Detectado{located}: {result['barcode']}")
+        else:
+            logger.info("[QR/BARCODE] No detectado")
+
+        shortcut = result.get("ocr_shortcut")
+        if shortcut is not None:
+            self.report["ocr_shortcuts"][shortcut] += 1
+
+        if source == "OCR-COMBINADO" and shortcut in ("header", "confidence"):
+            logger.info(
+                f"[OCR-COMBINADO] Código del encabezado (atajo {shortcut}, "
+                f"sin leer No.FAC): {detected_code}"
+            )
+        elif source == "OCR-COMBINADO":
+            logger.info(
+                f"[OCR-COMBINADO] Código más común extraído: {detected_code}"
+            )
+        elif source == "OCR-TOP":
+            logger.info(f"[OCR-TOP] Ref.Int extraída: {detected_code}")
+        elif source == "OCR-BOTTOM":
+            logger.info(
+                f"[OCR-BOTTOM] Página: {page_number}, "
+                f"Factura extraída: {detected_code}"
+            )
+
+        # =========================
+        # 3️⃣ Asignación final
+        # =========================
+        closing = False
+        if detected_code:
+            detected_code = str(detected_code).strip()
+
+            # 🔁 Nueva factura → reiniciar numeración; la anterior ya está completa
+            closing = detected_code != self.previous_code
+            if closing:
+                self._last_idx = None
+                logger.info(
+                    f"[PAGE] Nueva factura detectada ({detected_code})"
+                )
+                if self.current_code is not None:
+                    self._closed.append(self.current_code)
+
+            self.current_code = detected_code
+            self.previous_code = detected_code
+            self.report["documents_with_code"] += 1
+        else:
+            if not self.current_code:
+                self.current_code = "SIN_CODIGO"
+            self.report["documents_without_code"] += 1
+            logger.warning(
+                f"⚠️ Página {idx}: Sin código, se asigna a -> {self.current_code}"
+            )
+
+        self.documents[self.current_code].append(PageRecord(
+            idx, page_number, self.current_code, source, self._keep(idx, image)
+        ))
+        self._dirty[self.current_code] = True
+        self._record_page(result, self.current_code)
+
+        # Factura de varias páginas (contiguas o no): hace falta el orden
+        if len(self.documents[self.current_code]) > 1:
+            self._prefetch(self.current_code)
+        self._emit_ready()
+        if closing:
+            self._drop_footers()
+
+    def _record_page(self, result: Dict, document: str) -> None:
+        dpi = result.get("dpi")
+        if dpi is not None:
+            self.report["dpi"][dpi] = self.report["dpi"].get(dpi, 0) + 1
+
+        self.report["pages"].append({
+            "index": result["index"],
+            "document": document,
+            "source": result["source"],
+            "error": result["error"],
+            "dpi": dpi,
+            "seconds": result.get("seconds", 0.0),
+        })
+
+    def add_cache_stats(self, stats: Dict[str, int]) -> None:
+        for key, value in stats.items():
+            self.report["cache"][key] = self.report["cache"].get(key, 0) + value
+
+    # =========================
+    # Numeración de páginas
+    # =========================
+    def _link(self, idx: int, result: Dict, image: Image.Image) -> None:
+        self._prev[idx] = self._last_idx
+        self._last_idx = idx
+
+        if result["page_number_done"]:
+            self._ocr[idx] = result["page_number"]
+            self.report["page_number_ocr"]["done"] += 1
+        else:
+            self._footers[idx] = _store_footer(image)
+
+    def _prefetch(self, code: str) -> None:
+        # Los pies de la factura que faltan se leen en el pool, en paralelo
+        # con la detección de las páginas siguientes
+        if self._executor is None:
+            return
+        for record in self.documents[code]:
+            if record.index in self._footers:
+                self._reading[record.index] = self._executor.submit(
+                    read_footer, self._footers.pop(record.index)
+                )
+
+    def _drop_footers(self) -> None:
+        # Al cerrarse una factura, sus pies y los de las anteriores ya no
+        # se van a pedir, salvo los de las que siguen abiertas o esperando
+        # sus lecturas y la página anterior a cada una (la cadena de
+        # continuidad de su primera página pasa por ella). Un pie
+        # descartado cuenta como OCR sin resultado si una página tardía
+        # reabre su factura.
+        keep = set()
+        for code in (self.current_code, *self._closed):
+            for record in self.documents[code]:
+                keep.add(record.index)
+                keep.add(self._prev.get(record.index))
+        for idx in [idx for idx in self._footers if idx not in keep]:
+            footer = self._footers.pop(idx)
+            if isinstance(footer, PdfPage):
+                footer.release()
+            self._ocr[idx] = None
+            self._dropped += 1
+
+    def _read(self, idx: int) -> Optional[int]:
+        # OCR diferido del pie guardado (o ya enviado al pool)
+        if idx not in self._ocr:
+            if self._cancel is not None:
+                self._cancel.check()
+            try:
+                if idx in self._reading:
+                    read = self._reading.pop(idx).result()
+                else:
+                    read = read_footer(self._footers.pop(idx))
+            except Exception as e:
+                # Pool roto
+                read = {"page_number": None, "cache": {}, "timings": {}, "error": str(e)}
+            if read["error"] is not None:
+                # Un tesseract cortado por la cancelación no es un fallo
+                if self._cancel is not None:
+                    self._cancel.check()
+                # Igual que un OCR sin resultado: se usa la continuidad
+                logger.error(f"❌ Error leyendo el número de la página {idx}: {read['error']}")
+            self._ocr[idx] = read["page_number"]
+            self.add_cache_stats(read["cache"])
+            self.metrics.merge(read["timings"])
+            self.report["page_number_ocr"]["done"] += 1
+        return self._ocr[idx]
+
+    def _page_number(self, idx: int) -> int:
+        # Se recorre hacia atrás solo hasta una página con número leído
+        # o ya resuelta; luego se resuelve hacia adelante
+        chain = []
+        current = idx
+        while current is not None and current not in self._resolved:
+            chain.append(current)
+            if self._read(current) is not None:
+                break
+            current = self._prev[current]
+
+        for current in reversed(chain):
+            page_number = self._read(current)
+            previous = self._prev[current]
 
             if page_number is not None:
                 logger.info(f"[PAGE] Número de página detectado: {page_number}")
-                last_page_number = page_number
+            elif previous is not None:
+                page_number = self._resolved[previous] + 1
+                logger.warning(
+                    f"[PAGE] OCR falló, usando continuidad → {page_number}"
+                )
             else:
-                if last_page_number is not None:
-                    page_number = last_page_number + 1
-                    logger.warning(
-                        f"[PAGE] OCR falló, usando continuidad → {page_number}"
-                    )
-                    last_page_number = page_number
-                else:
-                    page_number = 1
-                    logger.warning(
-                        f"[PAGE] OCR falló en la primera página, usando 1"
-                    )
-                    last_page_number = page_number
-
-            # =========================
-            # 1️⃣ Intento QR + Barcode
-            # =========================
-            numfac_qr, numfac_barcode = extract_qr_and_barcode(image)
-
-            if numfac_qr:
-                detected_code = numfac_qr
-                logger.info(f"[QR] Detectado: {detected_code}")
-            elif numfac_barcode:
-                detected_code = numfac_barcode
-                logger.info(f"[BARCODE] Detectado: {detected_code}")
+                page_number = 1
+                logger.warning(
+                    f"[PAGE] OCR falló en la primera página, usando 1"
+                )
+
+            self._resolved[current] = page_number
+
+        return self._resolved[idx]
+
+    def _emit_ready(self) -> None:
+        while self._closed:
+            code = self._closed[0]
+            if code == self.current_code:
+                # Reabierta por una página tardía: se entrega al cerrarse otra vez
+                self._closed.popleft()
+            elif all(
+                self._reading[record.index].done()
+                for record in self.documents[code]
+                if record.index in self._reading
+            ):
+                self._emit(self._closed.popleft())
             else:
-                logger.info("[QR/BARCODE] No detectado")
-
-            # =========================
-            # 2️⃣ OCR (extract_codes)
-            # =========================
-            if not detected_code or len(detected_code) < 6:
-                codes = extract_codes(image)
-
-                candidates = [
-                    v
-                    for v in (
-                        codes.get("no_header"),
-                        codes.get("ref_int"),
-                        codes.get("no_fac"),
-                    )
-                    if v
-                ]
+                return
+
+    def _emit(self, code: str) -> None:
+        if not self._dirty.pop(code, False):
+            return
+        # Se resuelve al cerrarse aunque nadie la reciba: así sus pies no
+        # esperan hasta `finish`
+        self._resolve_document(code)
+        if self._on_document is not None:
+            self._on_document(code, sorted(self.documents[code], key=_record_key))
+
+    def _resolve_document(self, code: str) -> None:
+        records = self.documents[code]
+        if code == "ERROR" or len(records) < 2:
+            return
+        for n, record in enumerate(records):
+            if record.page_number is None:
+                records[n] = record._replace(page_number=self._page_number(record.index))
+
+    def finish(self) -> Tuple[Dict[str, List[PageRecord]], Dict]:
+        # =========================
+        # Ordenar páginas dentro de cada documento (y entregar los que
+        # siguen abiertos: el último, los de error)
+        # =========================
+        while self._closed:
+            self._emit(self._closed.popleft())
+        for code in self.documents:
+            self._resolve_document(code)
+            self.documents[code].sort(key=_record_key)
+            self._emit(code)
+
+        # Pies que nunca hizo falta leer (facturas de una sola página)
+        self.report["page_number_ocr"]["skipped"] = self._dropped + len(self._footers)
+        self._footers.clear()
+
+        return self.documents, self.report
+
+
+def _record_key(record: PageRecord) -> int:
+    # Las de error, y las facturas de una página en modo "lazy", no
+    # tienen número: van por índice
+    return record.page_number if record.page_number is not None else record.index
+
+
+def read_footer(footer: Any) -> Dict:
+    """
+    OCR del número de página de un pie guardado con `_store_footer`.
+    Corre en este proceso o en el pool: devuelve el número junto con los
+    aciertos/fallos de caché, los tiempos y el error, como `detect_page`
+    (una excepción que no se pueda reconstruir al volver del pool lo
+    daría por roto).
+    """
+    page_metrics = Metrics()
+    cache_before = cache_stats()
+    page_number, error = None, None
+    with collecting(page_metrics):
+        try:
+            page_number = extract_page_number_from_crop(_load_footer(footer))
+        except Exception as e:
+            error = str(e)
+    return {
+        "page_number": page_number,
+        "cache": _stats_delta(cache_before, cache_stats()),
+        "timings": page_metrics.as_dict(),
+        "error": error,
+    }
 
-                if candidates:
-                    detected_code = Counter(candidates).most_common(1)[0][0]
-                    logger.info(
-                        f"[OCR-COMBINADO] Código más común extraído: {detected_code}"
-                    )
-                else:
-                    # ---------- OCR TOP ----------
-                    width, height = image.size
-                    top_crop = image.crop((0, 0, width, int(height * 0.35)))
-                    processed_top = preprocess_for_ocr(top_crop)
-                    text_top = pytesseract.image_to_string(
-                        processed_top, lang="eng", config="--psm 6"
-                    )
 
-                    ref_int = extract_ref_int_from_text(text_top)
-                    if ref_int:
-                        detected_code = ref_int
-                        logger.info(f"[OCR-TOP] Ref.Int extraída: {detected_code}")
+def _store_footer(image) -> Any:
+    """
+    Lo que se guarda del pie de una página hasta saber si hace falta su
+    número. Una `PdfPage`, o el pie de una página del modo "adaptive"
+    (`ZoneRef` a RENDER_DPI), se rasteriza si se necesita; de una imagen
+    se guarda solo el recorte, comprimido sin pérdida.
+    """
+    if isinstance(image, PdfPage):
+        return image
+    if isinstance(image, PageContext):
+        ref = image.zone_ref(PAGE_NUMBER_ZONE, RENDER_DPI)
+        if ref is not None:
+            return ref
 
-                    # ---------- OCR BOTTOM ----------
-                    if not detected_code:
-                        bottom_crop = image.crop(
-                            (0, int(height * 0.65), width, height)
-                        )
-                        processed_bottom = preprocess_for_ocr(bottom_crop)
-                        text_bottom = pytesseract.image_to_string(
-                            processed_bottom, lang="eng", config="--psm 6"
-                        )
+    buffer = BytesIO()
+    page_number_crop(image).save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
 
-                        invoice_number = extract_invoice_number_from_text(text_bottom)
-                        if invoice_number:
-                            detected_code = invoice_number
-                            logger.info(
-                                f"[OCR-BOTTOM] Página: {page_number}, "
-                                f"Factura extraída: {detected_code}"
-                            )
 
-            # =========================
-            # 3️⃣ Asignación final
-            # =========================
-            if detected_code:
-                detected_code = str(detected_code).strip()
-
-                # 🔁 Nueva factura → reiniciar numeración
-                if detected_code != previous_code:
-                    last_page_number = None
-                    logger.info(
-                        f"[PAGE] Nueva factura detectada ({detected_code})"
-                    )
+def _load_footer(footer: Any) -> Image.Image:
+    if isinstance(footer, ZoneRef):
+        return footer.render()
+    if isinstance(footer, PdfPage):
+        crop = page_number_crop(footer)
+        footer.release()
+        return crop
+
+    crop = Image.open(BytesIO(footer))
+    crop.load()
+    return crop
+
+
+# =========================
+# Lógica principal
+# =========================
+def split_by_barcode(
+    images: Iterable[Image.Image],
+    keep_page: Optional[Callable[[int, Image.Image], Any]] = None,
+    workers: int = DETECTION_WORKERS,
+    executor: Optional[Executor] = None,
+    journal: Optional[JobJournal] = None,
+    on_document: Optional[Callable[[str, List[PageRecord]], None]] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    cancel: Optional[CancelToken] = None,
+) -> Tuple[Dict[str, List[PageRecord]], Dict, Metrics]:
+    """
+    Procesa cada página e intenta asignarla a un documento basado en QR, barcode o OCR.
 
-                current_code = detected_code
-                previous_code = detected_code
-                report["documents_with_code"] += 1
+    `images` puede ser un generador (ver `iter_pdf_images`): las páginas se
+    consumen una a una. `documents` trae un `PageRecord` por página; si se
+    indica `keep_page`, cada uno guarda `keep_page(índice, imagen)` en lugar
+    de la imagen a resolución completa, que queda libre apenas termina la
+    detección de esa página.
+
+    Con `workers > 1` (o un `executor` ya creado) la detección de cada
+    página corre en paralelo en un pool de procesos; la agrupación sigue
+    siendo secuencial, así que el resultado es idéntico al modo serie. El
+    mismo pool lee los números de página diferidos (modo "lazy").
+
+    Con un `journal` cada resultado de detección se guarda apenas se
+    obtiene, y las páginas que ya figuran en él (ejecución interrumpida)
+    no se vuelven a analizar: pasan directo a la agrupación.
+
+    Con `on_document` cada factura se entrega apenas se cierra, sin
+    esperar al final del PDF (ver `PageGrouper`).
+
+    Con `on_progress` se avisa un `ProgressEvent` cuando cada página sale
+    del render y cuando queda asignada a una factura (con su fuente y su
+    código), siempre desde el hilo que llama y en orden de página.
+
+    Con `cancel` se revisa la cancelación en cada página (antes de
+    enviarla a detectar y antes de agruparla) y se lanza `Cancelled`:
+    un resultado que llega después del pedido puede venir de un
+    subproceso cortado y no se guarda en la bitácora ni se agrupa. El
+    pool de la detección queda registrado en `cancel`: se cortan sus
+    procesos, no los de otros pools del proceso.
+
+    Devuelve (documents, report, metrics): `metrics` tiene los tiempos
+    de render, zbar, cada OCR y la agrupación (ver `utils.metrics`).
+    """
+    done = journal.load() if journal is not None else {}
+    if done:
+        logger.info(f"⏩ {len(done)} páginas tomadas de la bitácora, no se vuelven a analizar")
+
+    with ExitStack() as stack:
+        # Sin un executor ya creado, un pool propio para este PDF: lo usan
+        # la detección y la lectura diferida de los números de página
+        if executor is None and workers > 1:
+            executor = stack.enter_context(
+                ProcessPoolExecutor(max_workers=workers, initializer=warm_up)
+            )
+        # Al cancelar se cortan los procesos de este pool, no los de otros
+        if cancel is not None and executor is not None:
+            cancel.watch(executor)
+        grouper = PageGrouper(keep_page, on_document, cancel, executor)
+
+        def _on_result(result: Dict, image: Image.Image, fresh: bool) -> None:
+            if cancel is not None:
+                cancel.check()
+            # Las páginas con error no se guardan: se reintentan al reanudar
+            if fresh and journal is not None and result["error"] is None:
+                journal.append(result)
+            with timed("group"):
+                grouper.add(result, image)
+            if on_progress is not None:
+                on_progress(ProgressEvent(
+                    "detect" if fresh else "journal",
+                    result["index"],
+                    result["source"],
+                    _document_of(grouper, result),
+                ))
+
+        # Lo que se mide en este hilo (render, lotes zbar) va directo a
+        # las métricas del PDF
+        with collecting(grouper.metrics):
+            rendered = report_rendered(timed_iter(images, "render"), on_progress)
+            pages = _iter_decoded(rendered, grouper, skip=done)
+
+            if executor is None:
+                for idx, image, page, decoded in pages:
+                    if idx in done:
+                        _on_result(_resumed(done[idx]), image, False)
+                    else:
+                        _on_result(detect_page(idx, page, decoded), image, True)
             else:
-                if not current_code:
-                    current_code = "SIN_CODIGO"
-                report["documents_without_code"] += 1
-                logger.warning(
-                    f"⚠️ Página {idx}: Sin código, se asigna a -> {current_code}"
-                )
+                _detect_parallel(pages, _on_result, executor, workers, done, cancel)
 
-            documents[current_code].append((page_number, image))
+        documents, report = grouper.finish()
 
-        except Exception as e:
-            logger.exception(f"❌ Error en página {idx}")
-            report["errors"].append(str(e))
-            documents["ERROR"].append((idx, image))
+    return documents, report, grouper.metrics
 
-    # =========================
-    # Ordenar páginas dentro de cada documento
-    # =========================
-    for code in documents:
-        documents[code].sort(key=lambda x: x[0])
 
-    return documents, report
+def _document_of(grouper: PageGrouper, result: Dict) -> str:
+    # Factura a la que quedó asignada la página recién agrupada
+    return "ERROR" if result["error"] is not None else grouper.current_code
+
+
+def _resumed(result: Dict) -> Dict:
+    # Los aciertos/fallos de caché y los tiempos ya se contaron en la
+    # ejecución original
+    return {**result, "cache": {}, "timings": {}}
+
+
+def _iter_decoded(
+    images: Iterable[Image.Image],
+    grouper: PageGrouper,
+    skip: Dict[int, Dict],
+    batch_size: int = DECODE_BATCH_SIZE,
+) -> Iterator[Tuple[int, Image.Image, Any, Optional[Tuple]]]:
+    """
+    Entrega (idx, imagen, página a analizar, decoded) en orden de página.
+
+    Si el decodificador trabaja mejor por lotes (zbarimg por subproceso),
+    agrupa `batch_size` páginas y lee todos sus recortes con una sola
+    ejecución; si no, `decoded` es None y cada página decodifica por su
+    cuenta en `detect_page`. Las páginas en `skip` no se decodifican.
+
+    La página a analizar es un `PageContext` con la escala de grises ya
+    calculada (en lotes, el mismo usado para decodificar): `detect_page`
+    la reutiliza y al pool de procesos viaja solo ella, no la imagen RGB.
+    """
+    try:
+        decoder = get_decoder()
+    except Exception:
+        # Sin decodificador: cada página reportará el error en detect_page
+        decoder = None
+
+    if decoder is None or not decoder.batch or batch_size <= 1:
+        for idx, image in enumerate(images, start=1):
+            page = image if idx in skip else as_context(image).load_gray()
+            yield idx, image, page, None
+        return
+
+    batch = []
+
+    def _flush():
+        contexts = [as_context(image) for _, image in batch]
+        cache_before = cache_stats()
+        try:
+            decoded = extract_qr_and_barcode_batch(contexts, decoder)
+            # La lectura por lote ocurre aquí y no en detect_page
+            grouper.add_cache_stats(_stats_delta(cache_before, cache_stats()))
+        except Cancelled:
+            raise
+        except Exception:
+            logger.exception("Falló la lectura por lote, se decodifica página a página")
+            decoded = [None] * len(batch)
+
+        for (idx, image), context, page_decoded in zip(batch, contexts, decoded):
+            yield idx, image, context, page_decoded
+        batch.clear()
+
+    for idx, image in enumerate(images, start=1):
+        if idx in skip:
+            # Se respeta el orden: primero se vacía el lote pendiente
+            if batch:
+                yield from _flush()
+            yield idx, image, image, None
+            continue
+
+        batch.append((idx, image))
+        if len(batch) >= batch_size:
+            yield from _flush()
+
+    if batch:
+        yield from _flush()
+
+
+def _detect_parallel(
+    pages: Iterable[Tuple[int, Image.Image, Any, Optional[Tuple]]],
+    on_result: Callable[[Dict, Image.Image, bool], None],
+    executor: Executor,
+    workers: int,
+    done: Dict[int, Dict],
+    cancel: Optional[CancelToken] = None,
+) -> None:
+    """
+    Envía las páginas al pool con una ventana acotada y entrega los
+    resultados a `on_result` en orden de página. Un pool roto corta con
+    `BrokenProcessPool`; con `cancel`, los procesos cortados por la
+    cancelación terminan en `Cancelled`.
+    """
+    # Ventana de páginas en vuelo: mantiene ocupados a los workers
+    # sin acumular más imágenes de las necesarias
+    window = max(2, workers * 2)
+    pending = deque()
+
+    def _collect():
+        idx, future, image, fresh = pending.popleft()
+        try:
+            result = future.result()
+        except BrokenProcessPool:
+            # No es un error de la página: las siguientes tampoco tendrían
+            # pool, así que se corta el PDF (el modo servicio lo reintenta)
+            if cancel is not None:
+                cancel.check()
+            raise
+        except Exception as e:
+            if cancel is not None:
+                cancel.check()
+            logger.exception(f"❌ Error en página {idx}")
+            result = _empty_result(idx)
+            result["error"] = str(e)
+        on_result(result, image, fresh)
+
+    for idx, image, page, decoded in pages:
+        if cancel is not None:
+            cancel.check()
+        if idx in done:
+            # Ya analizada en una ejecución anterior: no pasa por el pool
+            future, fresh = Future(), False
+            future.set_result(_resumed(done[idx]))
+        else:
+            future, fresh = executor.submit(detect_page, idx, page, decoded), True
+
+        pending.append((idx, future, image, fresh))
+        if len(pending) >= window:
+            _collect()
+
+    while pending:
+        _collect()
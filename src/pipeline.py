@@ -0,0 +1,386 @@
+import csv
+import json
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+from loguru import logger
+from typing import Any, Dict, List, Optional, Sequence
+
+from image_converter import iter_pages
+from ocr_engine import warm_up
+from pdf_processor import split_by_barcode
+from settings import DETECTION_WORKERS, INCREMENTAL_OUTPUT, RENDER_CHUNK_SIZE
+from utils.file_utils import InvoiceWriter, output_keeper, write_documents
+from utils.job_journal import JobJournal
+from utils.metrics import Metrics
+
+
+# ==================================================
+# Un PDF: detección y escritura
+# ==================================================
+def analyze_pdf(
+    pdf_path,
+    executor: Optional[Executor] = None,
+    workers: int = DETECTION_WORKERS,
+    chunk_size: int = RENDER_CHUNK_SIZE,
+    writer: Optional[InvoiceWriter] = None,
+) -> Dict[str, Any]:
+    """
+    Render + `split_by_barcode` de un PDF, con reanudación desde la
+    bitácora. Devuelve {documents, report, metrics, journal, seconds,
+    writer}; la bitácora se descarta recién cuando los PDF quedan escritos.
+
+    Con un `writer` (`InvoiceWriter`) cada factura se escribe apenas se
+    cierra, mientras sigue la detección; `write_pdf_outputs` solo espera
+    las últimas.
+    """
+    path = Path(pdf_path)
+    started = time.perf_counter()
+    logger.info(f"Procesando PDF: {path}")
+
+    # Bitácora por página: si una ejecución anterior se cortó,
+    # se reanuda automáticamente sin volver a analizar esas páginas
+    journal = JobJournal(path)
+    resumed_pages = journal.completed_pages()
+    if resumed_pages:
+        logger.info(
+            f"Trabajo incompleto encontrado ({resumed_pages} páginas "
+            f"analizadas), se reanuda"
+        )
+
+    # Render por bloques (o por regiones en modo ROI): de cada página
+    # solo se conserva lo necesario para escribirla después
+    images = iter_pages(str(path), chunk_size=chunk_size)
+    try:
+        with journal:
+            documents, report, metrics = split_by_barcode(
+                images,
+                keep_page=output_keeper(path),
+                workers=workers,
+                executor=executor,
+                journal=journal,
+                on_document=writer.add if writer is not None else None,
+            )
+    except BaseException:
+        # Las facturas ya entregadas terminan de escribirse
+        if writer is not None:
+            writer.close()
+        raise
+
+    return {
+        "documents": documents,
+        "report": report,
+        "metrics": metrics,
+        "journal": journal,
+        "seconds": time.perf_counter() - started,
+        "writer": writer,
+    }
+
+
+def write_pdf_outputs(
+    analysis: Dict[str, Any],
+    output_dir: Path,
+    counters: Dict[str, int],
+    keep_existing: bool = False,
+) -> Dict[str, Any]:
+    """
+    Escribe las facturas de un PDF ya analizado y arma su fila de reporte.
+    Con `keep_existing` no se pisan facturas que ya están en `output_dir`.
+    Los tiempos de `save_pdf` se suman a `analysis["metrics"]`.
+
+    Si el análisis tuvo escritura incremental solo se esperan las
+    facturas pendientes (`output_dir`, `counters` y `keep_existing` ya
+    son los del `InvoiceWriter`); `write` mide solo esa espera.
+    """
+    started = time.perf_counter()
+    writer = analysis.get("writer")
+    write_errors = []
+    if writer is not None:
+        written = writer.close()
+        write_errors = writer.errors
+        analysis["metrics"].merge(writer.metrics)
+    else:
+        written = write_documents(
+            analysis["documents"], output_dir, counters,
+            keep_existing=keep_existing, metrics=analysis["metrics"],
+        )
+    write_seconds = time.perf_counter() - started
+
+    # PDF terminado: la bitácora ya no hace falta
+    analysis["journal"].discard()
+
+    return _file_row(
+        analysis["journal"].pdf_path, analysis["report"], written,
+        analysis["seconds"], write_seconds, analysis["metrics"], write_errors,
+    )
+
+
+def _file_row(
+    pdf_path,
+    report: Dict,
+    written,
+    detect_seconds: float,
+    write_seconds: float,
+    metrics: Metrics,
+    write_errors: Sequence[Dict] = (),
+) -> Dict:
+    pages_by_document = defaultdict(list)
+    for page in report["pages"]:
+        pages_by_document[page["document"]].append(page)
+
+    invoices = []
+    for document in written:
+        pages = pages_by_document.get(document.code, [])
+        invoices.append({
+            "invoice": document.code,
+            "filename": document.filename,
+            "pages": document.pages,
+            "page_indices": [page["index"] for page in pages],
+            "sources": dict(Counter(_page_source(page) for page in pages)),
+            "detect_seconds": round(sum(page["seconds"] for page in pages), 3),
+        })
+
+    return {
+        "pdf": str(pdf_path),
+        "status": "ok",
+        "error": None,
+        "pages": report["total_pages"],
+        "invoices_count": len(written),
+        "documents_with_code": report["documents_with_code"],
+        "documents_without_code": report["documents_without_code"],
+        "cache": report["cache"],
+        "page_number_ocr": report["page_number_ocr"],
+        "ocr_shortcuts": report["ocr_shortcuts"],
+        "dpi": report["dpi"],
+        "localization": report["localization"],
+        "errors": [
+            {"page": page["index"], "error": page["error"]}
+            for page in report["pages"]
+            if page["error"] is not None
+        ],
+        # Facturas que no se pudieron escribir (escritura incremental)
+        "write_errors": list(write_errors),
+        "seconds": {
+            "detect": round(detect_seconds, 3),
+            "write": round(write_seconds, 3),
+            "total": round(detect_seconds + write_seconds, 3),
+        },
+        "metrics": metrics.summary(),
+        "invoices": invoices,
+    }
+
+
+def _page_source(page: Dict) -> str:
+    if page["error"] is not None:
+        return "ERROR"
+    return page["source"] or "SIN_CODIGO"
+
+
+def failed_row(pdf_path, error: str) -> Dict:
+    return {
+        "pdf": str(pdf_path),
+        "status": "error",
+        "error": error,
+        "pages": 0,
+        "invoices_count": 0,
+        "documents_with_code": 0,
+        "documents_without_code": 0,
+        "cache": {"hits": 0, "misses": 0},
+        "page_number_ocr": {"done": 0, "skipped": 0},
+        "ocr_shortcuts": {"header": 0, "confidence": 0, "vote": 0},
+        "dpi": {},
+        "localization": {"tried": 0, "found": 0},
+        "errors": [],
+        "write_errors": [],
+        "seconds": {"detect": 0.0, "write": 0.0, "total": 0.0},
+        "metrics": {},
+        "invoices": [],
+    }
+
+
+# ==================================================
+# Lote de PDFs
+# ==================================================
+def run_batch(
+    pdf_files: Sequence,
+    output_dir: Path,
+    jobs: int = 1,
+    workers: int = DETECTION_WORKERS,
+) -> Dict[str, Any]:
+    """
+    Procesa varios PDFs. Con `jobs > 1` se analizan hasta `jobs` PDFs a
+    la vez, pero todos comparten un solo pool de `workers` procesos de
+    detección (presupuesto de CPU) y se reparten la ventana de páginas en
+    vuelo y el bloque de render (presupuesto de memoria), así el consumo
+    no crece con `jobs`.
+
+    Las facturas se escriben en el orden de `pdf_files`, así los nombres
+    (sufijos _2, _3...) son los mismos que en una ejecución en serie.
+    Por eso la escritura incremental (INCREMENTAL_OUTPUT) se usa solo con
+    `jobs == 1`: con varios PDFs a la vez el orden dependería de cuál
+    cierra antes cada factura.
+    Un PDF que falla queda en el reporte con su error y no detiene el lote.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    jobs = max(1, min(jobs, len(pdf_files) or 1))
+    incremental = INCREMENTAL_OUTPUT and jobs == 1
+    job_workers = max(1, workers // jobs)
+    chunk_size = max(1, RENDER_CHUNK_SIZE // jobs)
+
+    counters = defaultdict(int)
+    files: List[Dict] = []
+    metrics = Metrics()
+    started = time.perf_counter()
+
+    with ExitStack() as stack:
+        # Un solo pool para todo el lote: los motores se cargan una vez
+        executor = None
+        if workers > 1:
+            executor = stack.enter_context(
+                ProcessPoolExecutor(max_workers=workers, initializer=warm_up)
+            )
+
+        def _analyze(path: Path):
+            writer = InvoiceWriter(output_dir, counters) if incremental else None
+            return analyze_pdf(
+                path, executor=executor, workers=job_workers, chunk_size=chunk_size,
+                writer=writer,
+            )
+
+        threads = stack.enter_context(ThreadPoolExecutor(max_workers=jobs))
+        pending = []
+        for pdf_path in pdf_files:
+            path = Path(pdf_path)
+            if not path.exists():
+                logger.error(f"No existe: {pdf_path}")
+                pending.append((path, None))
+            else:
+                pending.append((path, threads.submit(_analyze, path)))
+
+        for path, future in pending:
+            if future is None:
+                files.append(failed_row(path, "No existe"))
+                continue
+            try:
+                analysis = future.result()
+                files.append(write_pdf_outputs(analysis, output_dir, counters))
+                metrics.merge(analysis["metrics"])
+            except Exception as e:
+                logger.exception(f"❌ Error procesando {path}")
+                files.append(failed_row(path, str(e)))
+
+    return _batch_report(files, time.perf_counter() - started, jobs, metrics)
+
+
+def _batch_report(
+    files: List[Dict], seconds: float, jobs: int, metrics: Metrics
+) -> Dict[str, Any]:
+    ok = [f for f in files if f["status"] == "ok"]
+
+    def _total(key: str, sub: Optional[str] = None) -> int:
+        return sum(f[key][sub] if sub else f[key] for f in ok)
+
+    dpi = Counter()
+    for f in ok:
+        dpi.update(f["dpi"])
+
+    errors = []
+    for f in files:
+        if f["error"] is not None:
+            errors.append({"pdf": f["pdf"], "page": None, "error": f["error"]})
+        for page_error in f["errors"]:
+            errors.append({"pdf": f["pdf"], **page_error})
+        for write_error in f["write_errors"]:
+            errors.append({
+                "pdf": f["pdf"],
+                "page": None,
+                "error": f"No se pudo escribir {write_error['filename']}: {write_error['error']}",
+            })
+
+    return {
+        "summary": {
+            "total_pdfs": len(ok),
+            "failed_pdfs": len(files) - len(ok),
+            "total_pages": _total("pages"),
+            "invoices": _total("invoices_count"),
+            "documents_with_code": _total("documents_with_code"),
+            "documents_without_code": _total("documents_without_code"),
+            "cache_hits": _total("cache", "hits"),
+            "cache_misses": _total("cache", "misses"),
+            "page_number_ocr": _total("page_number_ocr", "done"),
+            "page_number_skipped": _total("page_number_ocr", "skipped"),
+            "ocr_shortcuts": _total("ocr_shortcuts", "header") + _total("ocr_shortcuts", "confidence"),
+            # Páginas por DPI efectivo de detección (modo "adaptive")
+            "dpi": dict(sorted(dpi.items())),
+            # Páginas leídas localizando el código (sin cascada OCR)
+            "located_tried": _total("localization", "tried"),
+            "located_found": _total("localization", "found"),
+            "jobs": jobs,
+            "seconds": round(seconds, 3),
+        },
+        # Tiempos por etapa de todo el lote (count / total / p50 / p95)
+        "metrics": metrics.summary(),
+        "errors": errors,
+        "files": files,
+    }
+
+
+# ==================================================
+# Reporte en JSON / CSV
+# ==================================================
+CSV_COLUMNS = [
+    "type", "pdf", "invoice", "filename", "pages", "page_indices",
+    "sources", "detect_seconds", "write_seconds", "status", "error",
+]
+
+
+def write_report(batch_report: Dict[str, Any], path: Path) -> None:
+    """
+    Guarda el reporte: JSON completo, o CSV (según la extensión) con
+    una fila por PDF ("file") y una por factura ("invoice").
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    if path.suffix.lower() != ".csv":
+        path.write_text(
+            json.dumps(batch_report, ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+        return
+
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+
+        for file_row in batch_report["files"]:
+            page_errors = "; ".join(
+                [f"página {e['page']}: {e['error']}" for e in file_row["errors"]]
+                + [f"{e['filename']}: {e['error']}" for e in file_row["write_errors"]]
+            )
+            writer.writerow({
+                "type": "file",
+                "pdf": file_row["pdf"],
+                "pages": file_row["pages"],
+                "detect_seconds": file_row["seconds"]["detect"],
+                "write_seconds": file_row["seconds"]["write"],
+                "status": file_row["status"],
+                "error": file_row["error"] or page_errors,
+            })
+            for invoice in file_row["invoices"]:
+                writer.writerow({
+                    "type": "invoice",
+                    "pdf": file_row["pdf"],
+                    "invoice": invoice["invoice"],
+                    "filename": invoice["filename"],
+                    "pages": invoice["pages"],
+                    "page_indices": " ".join(str(i) for i in invoice["page_indices"]),
+                    "sources": " ".join(
+                        f"{source}:{count}" for source, count in invoice["sources"].items()
+                    ),
+                    "detect_seconds": invoice["detect_seconds"],
+                    "status": "error" if invoice["invoice"] == "ERROR" else "ok",
+                })
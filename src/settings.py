@@ -0,0 +1,145 @@
+import os
+from dotenv import load_dotenv
+
+# Permite sobreescribir la configuración con un archivo .env
+# junto al ejecutable o variables de entorno SCANNER_*
+load_dotenv()
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        return default
+
+
+def _env_ints(name: str, default: str) -> tuple:
+    # Lista separada por comas ("150,300"), sin repetidos y en orden creciente
+    value = os.getenv(name) or default
+    try:
+        return tuple(sorted({int(v) for v in value.split(",") if v.strip()}))
+    except ValueError:
+        return tuple(sorted({int(v) for v in default.split(",")}))
+
+
+# =========================
+# RENDERIZADO
+# =========================
+RENDER_DPI = _env_int("SCANNER_RENDER_DPI", 300)
+
+# Páginas que se renderizan por bloque (ventana first_page/last_page).
+# Acota la memoria: nunca hay más de este número de páginas a
+# resolución completa vivas a la vez, sin importar el tamaño del PDF.
+RENDER_CHUNK_SIZE = _env_int("SCANNER_CHUNK_SIZE", 8)
+
+# Toma directamente la imagen escaneada de las páginas que son una sola
+# imagen (pikepdf) en lugar de rasterizarlas con poppler. 0 = siempre poppler.
+DIRECT_IMAGES = _env_int("SCANNER_DIRECT_IMAGES", 1) == 1
+
+
+# =========================
+# DETECCIÓN
+# =========================
+# Procesos para la detección por página (fase 1 de split_by_barcode).
+# 0 = automático (núcleos - 1); 1 = modo serie, sin pool de procesos.
+DETECTION_WORKERS = _env_int("SCANNER_WORKERS", 0)
+if DETECTION_WORKERS <= 0:
+    DETECTION_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+# Backend para QR/barcode: auto | pyzbar | opencv | zbarimg
+# ("auto" prefiere libzbar en memoria y usa zbarimg por subproceso
+# solo si pyzbar no está disponible)
+DECODER_BACKEND = os.getenv("SCANNER_DECODER", "auto")
+
+# Páginas por ejecución de zbarimg cuando el backend es el subproceso:
+# todos los recortes QR/barcode del lote se leen con un solo proceso.
+# Las páginas del lote se mantienen en memoria hasta decodificarlas.
+DECODE_BATCH_SIZE = _env_int("SCANNER_DECODE_BATCH", RENDER_CHUNK_SIZE)
+
+# Lectura del número de página ("Pág. N de M"), que solo sirve para
+# ordenar las páginas dentro de una factura:
+# "eager": se lee en todas las páginas durante la detección.
+# "lazy": solo en las páginas de facturas con más de una página.
+PAGE_NUMBER_MODE = os.getenv("SCANNER_PAGE_NUMBERS", "lazy").lower()
+
+# Si las zonas fijas no dan un código, se buscan el QR y el barcode en
+# toda la página (reducida) y se decodifican esos recortes antes de
+# caer en la cascada OCR. 0 = solo zonas fijas.
+LOCATE_CODES = _env_int("SCANNER_LOCATE", 1) == 1
+
+
+# =========================
+# OCR
+# =========================
+# Motores Tesseract persistentes por proceso (requiere tesserocr).
+# Con el pool de detección cada proceso ya tiene su propio motor,
+# así que normalmente basta con 1.
+OCR_ENGINES = _env_int("SCANNER_OCR_ENGINES", 1)
+
+# Confianza mínima (0-100) de Tesseract para aceptar el No. del
+# encabezado sin leer el recorte No.FAC. Más de 100 desactiva el atajo.
+OCR_MIN_CONFIDENCE = _env_int("SCANNER_OCR_MIN_CONF", 90)
+
+# Cómo se leen las zonas de una página sin QR/barcode:
+# "crops": una llamada a Tesseract por recorte (pie, encabezado, No.FAC,
+#          franjas TOP y BOTTOM), cada una solo si hace falta.
+# "multi": los recortes se apilan en una sola imagen y se leen juntos:
+#          pie + encabezado + No.FAC en una pasada y, si no alcanzan,
+#          TOP + BOTTOM en otra.
+OCR_MODE = os.getenv("SCANNER_OCR_MODE", "crops").lower()
+
+
+# =========================
+# CACHÉ DE RESULTADOS
+# =========================
+# Caché en disco (logs/results_cache.sqlite3) de lecturas zbar y OCR,
+# indexada por el contenido de cada recorte. Útil al reprocesar un PDF.
+CACHE_ENABLED = _env_int("SCANNER_CACHE", 1) == 1
+CACHE_MAX_ENTRIES = _env_int("SCANNER_CACHE_MAX_ENTRIES", 200_000)
+
+
+# =========================
+# MODO DE RENDER / SALIDA
+# =========================
+# "full": cada página se rasteriza completa a RENDER_DPI para detectar.
+# "roi": solo se rasterizan las zonas que leen los detectores; la
+#        página completa se rasteriza al escribir, a OUTPUT_DPI.
+# "adaptive": cada página se rasteriza al primer DPI de DPI_LADDER; solo
+#        si no se lee su QR/barcode se vuelve a obtener al siguiente.
+RENDER_MODE = os.getenv("SCANNER_RENDER_MODE", "full").lower()
+
+# Escalera de DPI del modo "adaptive" (de menor a mayor). La cascada OCR
+# usa el último escalón: 150 alcanza para QR/Code128 con la cuarta parte
+# de los píxeles de 300.
+DPI_LADDER = _env_ints("SCANNER_DPI_LADDER", f"150,{RENDER_DPI}")
+
+# Resolución de las páginas en los PDF de salida (1240x1754 ≈ carta a 150 DPI)
+OUTPUT_DPI = _env_int("SCANNER_OUTPUT_DPI", 150)
+
+# "raster": cada página se re-rasteriza en escala de grises y reducida.
+# "lossless": se copian las páginas originales del PDF (pikepdf), sin
+#             recomprimir; mantiene la calidad del escaneo.
+OUTPUT_MODE = os.getenv("SCANNER_OUTPUT_MODE", "raster").lower()
+
+# Hilos que escriben los PDF de salida en paralelo
+WRITE_WORKERS = _env_int("SCANNER_WRITE_WORKERS", min(4, os.cpu_count() or 1))
+
+# Escritura incremental: cada factura se escribe apenas empieza la
+# siguiente (y se liberan sus páginas), sin esperar al final del PDF.
+# 0 = todas al final.
+INCREMENTAL_OUTPUT = _env_int("SCANNER_INCREMENTAL", 1) == 1
+
+
+# =========================
+# MODO SERVICIO (CARPETA VIGILADA)
+# =========================
+# Cada cuántos segundos se revisa la carpeta de entrada (además de los
+# eventos del sistema de archivos, si watchdog está instalado)
+WATCH_POLL_SECONDS = _env_int("SCANNER_WATCH_POLL", 2)
+
+# Segundos que el tamaño de un PDF debe quedar quieto para considerarlo
+# completo (el escáner puede seguir copiándolo a la carpeta compartida)
+WATCH_STABLE_SECONDS = _env_int("SCANNER_WATCH_STABLE", 3)
@@ -7,7 +7,7 @@ from PySide6.QtWidgets import (
 from PySide6.QtGui import QPixmap, QIcon
 from PySide6.QtCore import Qt
 
-from ui.worker import ScannerWorker
+from ui.worker import ResumeCheck, ScannerWorker
 from pathlib import Path
 import sys
 
@@ -158,6 +158,7 @@ class MainWindow(QMainWindow):
         # ---------------- ESTADO ----------------
         self.selected_pdf = None
         self.output_dir = None
+        self.resume_check = None
         self.worker = None
 
         # ---------------- SEÑALES ----------------
@@ -210,18 +211,52 @@ class MainWindow(QMainWindow):
         self.btn_process.setEnabled(False)
         self.btn_select.setEnabled(False)
         self.btn_select_output.setEnabled(False)
+        self.status_label.setText("Buscando trabajos incompletos…")
+
+        # El hash del PDF se calcula en otro hilo: la ventana no se congela
+        self.resume_check = ResumeCheck(self.selected_pdf)
+        self.resume_check.checked.connect(self._start_worker)
+        self.resume_check.start()
+
+    def _start_worker(self, journal, done):
+        journal = self._check_resume(journal, done)
+
         self.btn_cancel.setEnabled(True)
 
         self.progress.setVisible(True)
         self.progress.setValue(0)
         self.status_label.setText("Procesando…")
 
-        self.worker = ScannerWorker(self.selected_pdf, self.output_dir)
+        self.worker = ScannerWorker(self.selected_pdf, self.output_dir, journal)
         self.worker.log.connect(self._append_log)
         self.worker.progress.connect(self.progress.setValue)
+        self.worker.status.connect(self.status_label.setText)
         self.worker.finished.connect(self.on_finished)
         self.worker.start()
 
+    def _check_resume(self, journal, done):
+        """
+        Si el PDF tiene un trabajo incompleto, ofrece reanudarlo.
+        """
+        if not done:
+            return journal
+
+        reply = QMessageBox.question(
+            self,
+            "Trabajo incompleto",
+            f"Este PDF tiene un procesamiento incompleto "
+            f"({done} páginas ya analizadas).\n¿Deseas reanudarlo?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+
+        if reply == QMessageBox.StandardButton.Yes:
+            self.log_area.append(f"⏩ Reanudando: {done} páginas ya analizadas")
+        else:
+            journal.discard()
+            self.log_area.append("🔄 Se procesa de nuevo desde la primera página")
+
+        return journal
+
     # ==================================================
     # Cancelar
     # ==================================================
@@ -241,7 +276,10 @@ class MainWindow(QMainWindow):
 
     # ==================================================
     def on_finished(self):
-        self.status_label.setText("Proceso finalizado")
+        if self.worker is not None and self.worker.cancel.is_cancelled():
+            self.status_label.setText("Proceso cancelado")
+        else:
+            self.status_label.setText("Proceso finalizado")
         self.progress.setValue(100)
         self.progress.setVisible(False)
 
@@ -254,6 +292,9 @@ class MainWindow(QMainWindow):
     # Cierre seguro
     # ==================================================
     def closeEvent(self, event):
+        if self.resume_check is not None and self.resume_check.isRunning():
+            # Solo lee el PDF: se espera a que termine
+            self.resume_check.wait()
         if self.worker and self.worker.isRunning():
             reply = QMessageBox.question(
                 self,
@@ -262,8 +303,11 @@ class MainWindow(QMainWindow):
                 QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
             )
 
-            if reply == QMessageBox.standardButton.Yes:
+            if reply == QMessageBox.StandardButton.Yes:
+                # La cancelación corta los subprocesos y el hilo sale en
+                # menos de un segundo: se espera para no destruirlo vivo
                 self.worker.stop()
+                self.worker.wait()
                 event.accept()
             else:
                 event.ignore()
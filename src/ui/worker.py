@@ -1,35 +1,59 @@
 from PySide6.QtCore import QThread, Signal
 from pathlib import Path
 from collections import defaultdict
-import re
 from loguru import logger
 
-from image_converter import pdf_to_images
+from image_converter import iter_pages, get_page_count
 from pdf_processor import split_by_barcode
-from utils.file_utils import save_pdf
-
+from settings import INCREMENTAL_OUTPUT
+from utils.cancellation import CancelToken, Cancelled
+from utils.file_utils import InvoiceWriter, output_keeper, write_documents
+from utils.job_journal import JobJournal
+from utils.metrics import format_summary
+from utils.progress import Throughput, format_eta
+
+
+class ResumeCheck(QThread):
+    """
+    Busca la bitácora de un PDF fuera del hilo de la interfaz: calcular
+    el hash de un escaneo grande tarda. Emite `checked(bitácora, páginas
+    ya analizadas)`; si no se pudo leer el PDF, `checked(None, 0)` y el
+    error lo informa el procesamiento.
+    """
+    checked = Signal(object, int)
+
+    def __init__(self, pdf_path):
+        super().__init__()
+        self.pdf_path = pdf_path
 
-def safe_filename(text: str) -> str:
-    text = text.strip()
-    text = re.sub(r"[<>:\"/\\|?*\n\r\t]", "_", text)
-    text = re.sub(r"\s+", "_", text)
-    return text[:150]
+    def run(self):
+        try:
+            journal = JobJournal(self.pdf_path)
+            done = journal.completed_pages()
+        except Exception as e:
+            logger.warning(f"No se pudo revisar la bitácora de {self.pdf_path}: {e}")
+            journal, done = None, 0
+        self.checked.emit(journal, done)
 
 
 class ScannerWorker(QThread):
     log = Signal(str)
     progress = Signal(int)
+    status = Signal(str)
     finished = Signal()
 
-    def __init__(self, pdf_path, output_dir):
+    def __init__(self, pdf_path, output_dir, journal=None):
         super().__init__()
         self.pdf_path = pdf_path
         self.output_dir = Path(output_dir)
-        self._is_running = True
+        self.journal = journal
+        self.cancel = CancelToken()
         self._loguru_id = None
 
     def stop(self):
-        self._is_running = False
+        # Se llama desde la GUI: corta los subprocesos en curso y el
+        # hilo sale en la próxima página o bloque
+        self.cancel.cancel()
 
     # 🔗 Sink de loguru → UI
     def _loguru_sink(self, message):
@@ -47,32 +71,98 @@ class ScannerWorker(QThread):
             )
 
             # -------------------------------
-            # FASE 1: PDF -> IMÁGENES (0–25%)
+            # FASE 1: LECTURA DEL PDF (0–25%)
             # -------------------------------
-            self.log.emit("📄 Convirtiendo PDF a imágenes…")
+            self.log.emit("📄 Leyendo PDF…")
             self.progress.emit(5)
 
-            images = pdf_to_images(self.pdf_path)
-            total_pages = len(images)
+            total_pages = get_page_count(self.pdf_path)
 
             if total_pages == 0:
                 raise ValueError("El PDF no contiene páginas")
 
             self.progress.emit(25)
-            self.log.emit(f"✅ {total_pages} páginas convertidas exitosamente")
+            self.log.emit(f"✅ {total_pages} páginas encontradas")
 
             # -------------------------------
-            # FASE 2: DETECCIÓN (25–50%)
+            # FASE 2: RENDER + DETECCIÓN (30–90%)
             # -------------------------------
+            # Las páginas se renderizan por bloques (o por regiones en modo
+            # ROI) y se analizan a medida que llegan; de cada una solo se
+            # conserva lo necesario para escribir el PDF
             self.log.emit("🔍 Analizando códigos de barras en todas las páginas…")
             self.progress.emit(30)
 
-            documents, report = split_by_barcode(images)
+            # Cada página analizada queda en la bitácora: si se cierra la
+            # app o se suspende el equipo, se puede reanudar desde ahí
+            journal = self.journal or JobJournal(self.pdf_path)
+
+            # Cada factura se informa apenas queda escrita; en modo
+            # incremental eso pasa durante la detección
+            def _on_written(document, written, total):
+                page_text = "página" if document.pages == 1 else "páginas"
+                action = " (páginas agregadas)" if document.merged else ""
+
+                self.log.emit(f"📄 Factura: {document.code}{action}")
+                self.log.emit(f"   └─ {document.pages} {page_text} → {document.filename}")
+
+                if total:
+                    self.progress.emit(90 + int((written / total) * 10))
+
+            # Cada página analizada avanza la barra; el estado muestra el
+            # ritmo (pág/min) y el tiempo restante estimado
+            throughput = Throughput(total_pages)
+            rendered = 0
+
+            def _on_progress(event):
+                nonlocal rendered
+                if event.stage == "render":
+                    rendered = event.index
+                    return
+
+                throughput.add(event)
+                self.progress.emit(30 + int((throughput.done / total_pages) * 60))
+
+                text = f"Analizando página {throughput.done} de {total_pages}"
+                if rendered > throughput.done:
+                    text += f" (renderizadas: {rendered})"
+                rate = throughput.pages_per_minute
+                if rate is not None:
+                    text += f"  ·  {rate:.0f} pág/min  ·  restante ≈ {format_eta(throughput.eta_seconds)}"
+                self.status.emit(text)
+
+            writer = None
+            if INCREMENTAL_OUTPUT:
+                self.output_dir.mkdir(parents=True, exist_ok=True)
+                writer = InvoiceWriter(
+                    self.output_dir, defaultdict(int),
+                    on_written=_on_written, cancel=self.cancel,
+                )
+
+            images = iter_pages(self.pdf_path, cancel=self.cancel)
+            try:
+                with journal:
+                    documents, report, metrics = split_by_barcode(
+                        images,
+                        keep_page=output_keeper(self.pdf_path),
+                        journal=journal,
+                        on_document=writer.add if writer is not None else None,
+                        on_progress=_on_progress,
+                        cancel=self.cancel,
+                    )
+            finally:
+                if writer is not None:
+                    writer.close()
+            if writer is not None:
+                metrics.merge(writer.metrics)
+                for error in writer.errors:
+                    self.log.emit(f"❌ No se pudo escribir {error['filename']}: {error['error']}")
 
             total_docs = len(documents)
             docs_without_code = report.get("documents_without_code", 0)
 
-            self.progress.emit(50)
+            self.progress.emit(90)
+            self.status.emit("Generando archivos PDF…")
             self.log.emit("📊 Resumen de detección:")
             self.log.emit(f"   • Facturas detectadas: {total_docs}")
             self.log.emit(f"   • Páginas sin código: {docs_without_code}")
@@ -80,40 +170,32 @@ class ScannerWorker(QThread):
             if total_docs == 0:
                 self.log.emit("⚠️ No se detectaron documentos con código de barras")
                 self.progress.emit(100)
+                journal.discard()
                 return
 
             # -------------------------------
-            # FASE 3: GENERACIÓN DE PDFs (50–100%)
+            # FASE 3: GENERACIÓN DE PDFs (90–100%)
             # -------------------------------
-            self.log.emit("")
-            self.log.emit("📝 Generando archivos PDF individuales…")
-            self.log.emit("─" * 50)
-
-            counters = defaultdict(int)
-            processed_docs = 0
-
-            for code, imgs in documents.items():
-                if not self._is_running:
-                    self.log.emit("")
-                    self.log.emit("⛔ Proceso cancelado por el usuario")
-                    return
-
-                safe_code = safe_filename(code)
-                counters[safe_code] += 1
-                suffix = f"_{counters[safe_code]}" if counters[safe_code] > 1 else ""
-                filename = f"{safe_code}{suffix}.pdf"
-
-                save_pdf(imgs, self.output_dir / filename)
-
-                num_pages = len(imgs)
-                page_text = "página" if num_pages == 1 else "páginas"
-
-                self.log.emit(f"📄 Factura: {code}")
-                self.log.emit(f"   └─ {num_pages} {page_text} → {filename}")
-
-                processed_docs += 1
-                progress_value = 50 + int((processed_docs / total_docs) * 50)
-                self.progress.emit(progress_value)
+            # Las facturas se escriben en paralelo: el progreso avanza a
+            # medida que cada archivo queda escrito (en modo incremental
+            # ya se escribieron durante la detección)
+            if writer is None:
+                self.log.emit("")
+                self.log.emit("📝 Generando archivos PDF individuales…")
+                self.log.emit("─" * 50)
+                write_documents(
+                    documents,
+                    self.output_dir,
+                    defaultdict(int),
+                    on_written=_on_written,
+                    cancelled=self.cancel.is_cancelled,
+                    metrics=metrics,
+                )
+
+            self.cancel.check()
+
+            # Trabajo completo: ya no hay nada que reanudar
+            journal.discard()
 
             # -------------------------------
             # FINAL
@@ -123,12 +205,33 @@ class ScannerWorker(QThread):
             self.log.emit("✨ Resumen final:")
             self.log.emit(f"   • Total de facturas generadas: {total_docs}")
             self.log.emit(f"   • Páginas sin código detectado: {docs_without_code}")
+            self.log.emit(
+                f"   • Caché: {report['cache']['hits']} aciertos / "
+                f"{report['cache']['misses']} fallos"
+            )
+            self.log.emit(
+                f"   • Números de página leídos: {report['page_number_ocr']['done']} "
+                f"(omitidos: {report['page_number_ocr']['skipped']})"
+            )
+            self.log.emit(
+                f"   • Códigos localizados (OCR evitado): "
+                f"{report['localization']['found']} de {report['localization']['tried']}"
+            )
             self.log.emit(f"   • Ubicación: {self.output_dir}")
+            self.log.emit("")
+            self.log.emit("⏱️ Tiempos por etapa:")
+            for line in format_summary(metrics.summary()):
+                self.log.emit(f"   {line}")
 
             self.progress.emit(100)
             self.log.emit("")
             self.log.emit("✔️ Procesamiento completado exitosamente")
 
+        except Cancelled:
+            # La bitácora queda: se puede reanudar desde la última página
+            self.log.emit("")
+            self.log.emit("⛔ Proceso cancelado por el usuario")
+
         except Exception as e:
             self.log.emit("")
             self.log.emit(f"❌ Error crítico: {str(e)}")
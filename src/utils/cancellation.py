@@ -0,0 +1,181 @@
+import subprocess
+import threading
+from typing import Iterable, Iterator, List
+
+# psutil es opcional: permite cortar también los procesos que lanzan
+# pytesseract, y los que quedan bajo los procesos de detección
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Herramientas externas que se cortan al cancelar (por nombre de proceso)
+TOOLS = ("pdftoppm", "pdfinfo", "zbarimg", "tesseract")
+
+
+class Cancelled(Exception):
+    """
+    El trabajo se canceló (ver `CancelToken`).
+    """
+
+
+# ==================================================
+# Subprocesos propios (zbarimg, pdftoppm -x/-y, pdfinfo -box)
+# ==================================================
+_LOCK = threading.Lock()
+_running: List[subprocess.Popen] = []
+_killed: List[subprocess.Popen] = []
+
+
+def run_tool(args: List[str], **kwargs) -> subprocess.CompletedProcess:
+    """
+    Como `subprocess.run(args, capture_output=True, ...)`, pero el proceso
+    queda registrado para que `CancelToken.cancel` pueda cortarlo. Si se
+    cortó, lanza `Cancelled` en lugar de devolver una salida incompleta
+    (que se tomaría por "sin códigos" y terminaría en la caché).
+    """
+    process = subprocess.Popen(
+        args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs
+    )
+    with _LOCK:
+        _running.append(process)
+    try:
+        stdout, stderr = process.communicate()
+    finally:
+        with _LOCK:
+            _running.remove(process)
+            killed = process in _killed
+            if killed:
+                _killed.remove(process)
+
+    if killed:
+        raise Cancelled(f"{args[0]} interrumpido")
+    return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+
+def kill_children(executors: Iterable = ()) -> None:
+    """
+    Corta los procesos hijos en curso del trabajo:
+    - los procesos de `executors` (los pools del trabajo cancelado), que
+      el pool da por rotos; otros pools del proceso no se tocan
+    - los subprocesos de `run_tool` de este proceso
+    - con psutil, cualquier herramienta de TOOLS lanzada por este proceso
+      o por los procesos de `executors` (se buscan antes de cortar a
+      estos, que las dejarían huérfanas)
+    """
+    workers = []
+    for executor in executors:
+        # `_processes` queda en None cuando el pool ya se cerró
+        workers.extend((getattr(executor, "_processes", None) or {}).values())
+
+    tools = []
+    if psutil is not None:
+        parents = [psutil.Process()]
+        for worker in workers:
+            try:
+                parents.append(psutil.Process(worker.pid))
+            except (psutil.Error, ValueError):
+                pass
+        for parent in parents:
+            try:
+                # Los hijos directos de este proceso: los de debajo de
+                # otros pools no son de este trabajo
+                children = parent.children(recursive=parent is not parents[0])
+            except psutil.Error:
+                continue
+            for child in children:
+                try:
+                    if child.name().lower().startswith(TOOLS):
+                        tools.append(child)
+                except psutil.Error:
+                    pass
+
+    for worker in workers:
+        if worker.is_alive():
+            worker.kill()
+
+    with _LOCK:
+        for process in _running:
+            if process.poll() is None:
+                _killed.append(process)
+                process.kill()
+
+    for child in tools:
+        try:
+            child.kill()
+        except psutil.Error:
+            pass
+
+
+# ==================================================
+# Token de cancelación
+# ==================================================
+class CancelToken:
+    """
+    Pedido de cancelación compartido entre el hilo que lo pide (la GUI) y
+    el que trabaja. El render, la detección y la escritura lo revisan en
+    cada página o bloque con `check()`; `cancel()` además corta los
+    subprocesos en curso para no esperar a que terminen.
+
+    De los pools solo se cortan los registrados con `watch()`: los que
+    usa este trabajo. Pensado para un trabajo a la vez por proceso (la
+    GUI): los subprocesos de `run_tool` son de todo el proceso.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._executors: List = []
+
+    def watch(self, executor) -> None:
+        """
+        Registra el pool de procesos del trabajo: `cancel()` corta sus
+        procesos. Si ya se canceló, se cortan en el momento.
+        """
+        with self._lock:
+            if executor not in self._executors:
+                self._executors.append(executor)
+            cancelled = self._event.is_set()
+        if cancelled:
+            kill_children([executor])
+
+    def cancel(self) -> None:
+        # Primero la marca: lo que termine por el corte ya la ve
+        with self._lock:
+            self._event.set()
+            executors = list(self._executors)
+        kill_children(executors)
+
+    def is_cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self) -> None:
+        if self._event.is_set():
+            raise Cancelled("Proceso cancelado")
+
+
+def checked(iterable: Iterable, cancel: CancelToken) -> Iterator:
+    """
+    Deja pasar `iterable` revisando `cancel` antes de pedir cada elemento
+    (no se empieza otro bloque) y al recibirlo (no se entrega algo
+    obtenido a medias por un corte). Un error tras la cancelación se
+    toma como consecuencia del corte: se lanza `Cancelled`.
+    """
+    iterator = iter(iterable)
+    try:
+        while True:
+            cancel.check()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            except Exception:
+                cancel.check()
+                raise
+            cancel.check()
+            yield item
+    finally:
+        # El generador de origen cierra lo que tenga abierto (PDF, bloque)
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
@@ -0,0 +1,84 @@
+import cv2
+import numpy as np
+from typing import List, Tuple
+
+# (tipo, (x0, y0, x1, y1)) en píxeles de la página original
+Region = Tuple[str, Tuple[int, int, int, int]]
+
+# Ancho al que se reduce la página para buscar (≈ 95 DPI en carta)
+LOCATE_WIDTH = 800
+
+# Alto mínimo de una región, como fracción del ancho de la página: deja
+# fuera los renglones de texto (~3 mm) y pasa un Code128 de 8 mm
+MIN_HEIGHT = 0.02
+
+# Regiones a devolver como máximo (las más grandes primero)
+MAX_REGIONS = 4
+
+# Margen alrededor de cada región (fracción del ancho de la página): el
+# barcode necesita su zona en blanco a los lados
+PADDING = 0.015
+
+
+# ==================================================
+# Localización de QR / barcode en la página
+# ==================================================
+def locate_code_regions(gray: np.ndarray) -> List[Region]:
+    """
+    Busca en la página (escala de grises) las manchas densas en bordes
+    que parecen un código y las clasifica:
+    - "barcode": más ancha que alta y con bordes casi solo verticales
+    - "qr": casi cuadrada y con bordes en ambas direcciones
+
+    Trabaja sobre la página reducida a LOCATE_WIDTH (gradiente de Sobel,
+    umbral de Otsu y cierre morfológico); las cajas se devuelven en
+    píxeles de la página original, con margen y ordenadas por área.
+    """
+    h, w = gray.shape[:2]
+    scale = min(1.0, LOCATE_WIDTH / w)
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    sh, sw = small.shape[:2]
+
+    gx = np.abs(cv2.Sobel(small, cv2.CV_32F, 1, 0, ksize=3))
+    gy = np.abs(cv2.Sobel(small, cv2.CV_32F, 0, 1, ksize=3))
+    edges = cv2.convertScaleAbs(gx + gy, alpha=0.25)
+    _, mask = cv2.threshold(edges, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    # Une barras / módulos en una sola mancha y borra el ruido suelto
+    k = max(3, int(sw * 0.012))
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (k, k))
+    blobs = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    blobs = cv2.morphologyEx(blobs, cv2.MORPH_OPEN, kernel)
+
+    contours, _ = cv2.findContours(blobs, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    candidates = []
+    for contour in contours:
+        x, y, bw, bh = cv2.boundingRect(contour)
+        if bh < MIN_HEIGHT * sw:
+            continue
+
+        # Un código llena su caja de bordes; un logo o una firma no
+        if mask[y:y + bh, x:x + bw].mean() < 0.4 * 255:
+            continue
+
+        aspect = bw / bh
+        ratio = gx[y:y + bh, x:x + bw].mean() / max(gy[y:y + bh, x:x + bw].mean(), 1e-6)
+        if aspect >= 1.5 and ratio >= 2.5:
+            kind = "barcode"
+        elif 0.7 <= aspect <= 1.4 and 0.5 <= ratio <= 2.0:
+            kind = "qr"
+        else:
+            continue
+
+        pad = PADDING * sw
+        box = (
+            int(max(0, x - pad) / scale),
+            int(max(0, y - pad) / scale),
+            int(min(sw, x + bw + pad) / scale),
+            int(min(sh, y + bh + pad) / scale),
+        )
+        candidates.append((bw * bh, kind, box))
+
+    candidates.sort(key=lambda c: c[0], reverse=True)
+    return [(kind, box) for _, kind, box in candidates[:MAX_REGIONS]]
@@ -1,13 +1,34 @@
+import os
 import re
+import tempfile
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, as_completed
 from pathlib import Path
 from loguru import logger
 from PIL import Image
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import pikepdf
+
+from image_converter import PdfPage
+from page_context import PageContext
+from settings import OUTPUT_DPI, OUTPUT_MODE, WRITE_WORKERS
+from utils.cancellation import CancelToken
+from utils.metrics import Metrics, collecting, timed
 
 def sanitize_filename(text: str) -> str:
     text = text.strip()
     text = re.sub(r"[^\w\-\.]", "_", text)
     return text
 
+def safe_filename(text: str) -> str:
+    """
+    Limpia un texto para que sea seguro como nombre de archivo en Windows.
+    """
+    text = text.strip()
+    text = re.sub(r"[<>:\"/\\|?*\n\r\t]", "_", text)
+    text = re.sub(r"\s+", "_", text)
+    return text[:150]  # límite defensivo
+
 def process_image_for_pdf(img: Image.Image, max_width=1240, max_height=1754, quality=60) -> Image.Image:
     """
     Ajusta la imagen para PDF de facturas escaneadas:
@@ -19,17 +40,144 @@ def process_image_for_pdf(img: Image.Image, max_width=1240, max_height=1754, qua
     img.thumbnail((max_width, max_height))
     return img
 
-def save_pdf(images_with_meta, output_path: Path, quality: int = 60):
+class SourcePage(NamedTuple):
+    """
+    Referencia a una página (1-based) del PDF original, para la salida
+    sin pérdida: no guarda píxeles.
+    """
+    pdf_path: str
+    index: int
+
+
+class SpooledPage(NamedTuple):
+    """
+    Página ya reducida para la salida, guardada en un `PageSpool`
+    (en disco, no en memoria) hasta que se escribe su factura.
+    """
+    spool: "PageSpool"
+    path: str
+
+    def load(self) -> Image.Image:
+        with Image.open(self.path) as image:
+            image.load()
+            return image
+
+    def release(self) -> None:
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class PageSpool:
+    """
+    Carpeta temporal con las páginas reducidas (PNG, sin pérdida: la
+    salida es la misma que con las páginas en memoria). Cada
+    `SpooledPage` mantiene viva su carpeta; se borra sola cuando ya no
+    queda ninguna (o con `cleanup`).
+    """
+
+    def __init__(self):
+        self._dir = tempfile.TemporaryDirectory(prefix="scanner_spool_")
+
+    def put(self, idx: int, image: Image.Image) -> SpooledPage:
+        path = str(Path(self._dir.name) / f"{idx:06d}.png")
+        image.save(path, format="PNG", compress_level=1)
+        return SpooledPage(self, path)
+
+    def cleanup(self) -> None:
+        self._dir.cleanup()
+
+
+def prepare_for_output(idx: int, page):
+    """
+    Lo que se conserva de cada página entre la detección y la escritura
+    (`keep_page` de `split_by_barcode`):
+    - imagen completa → su versión reducida para el PDF
+    - `PdfPage` (modo ROI) → la misma página sin sus zonas rasterizadas;
+      se vuelve a rasterizar a OUTPUT_DPI al escribir
+    - `PageContext` (modo "adaptive") → su imagen, ya a baja resolución
+    """
+    if isinstance(page, PageContext):
+        page = page.image
+    if isinstance(page, PdfPage):
+        page.release()
+        return page
+    return process_image_for_pdf(page)
+
+def output_keeper(pdf_path, mode: str = OUTPUT_MODE) -> Callable[[int, Any], Any]:
+    """
+    `keep_page` según el modo de salida; en ningún caso quedan píxeles
+    en memoria hasta la escritura:
+    - "raster": `prepare_for_output`, y la imagen reducida va a un
+      `PageSpool` en disco (una `PdfPage` liberada se guarda tal cual)
+    - "lossless": `SourcePage`, se copian las páginas originales del PDF
     """
-    Guarda un PDF optimizado desde una lista de imágenes escaneadas.
+    if mode == "lossless":
+        pdf_path = str(pdf_path)
+        return lambda idx, page: SourcePage(pdf_path, idx)
+
+    spool = PageSpool()
+
+    def _keep(idx: int, page):
+        kept = prepare_for_output(idx, page)
+        if isinstance(kept, PdfPage):
+            return kept
+        return spool.put(idx, kept)
+
+    return _keep
+
+
+def load_output_page(page) -> Image.Image:
     """
-    if not images_with_meta:
+    Píxeles de una página guardada por `keep_page`, listos para
+    `process_image_for_pdf`.
+    """
+    if isinstance(page, SpooledPage):
+        return page.load()
+    if isinstance(page, PageContext):
+        page = page.image
+    if isinstance(page, PdfPage):
+        return page.render(OUTPUT_DPI)
+    return page
+
+def save_pdf_lossless(records, output_path: Path):
+    """
+    Arma el PDF copiando los objetos de página del PDF original, en el
+    orden recibido: sin decodificar ni recomprimir las imágenes escaneadas.
+    """
+    sources = {}
+    try:
+        with pikepdf.new() as output:
+            for page in (record.page for record in records):
+                if page.pdf_path not in sources:
+                    sources[page.pdf_path] = pikepdf.open(page.pdf_path)
+                output.pages.append(sources[page.pdf_path].pages[page.index - 1])
+            output.save(output_path)
+    finally:
+        for source in sources.values():
+            source.close()
+
+    logger.info(f"PDF generado (páginas originales): {output_path.name}")
+
+def save_pdf(records, output_path: Path, quality: int = 60):
+    """
+    Guarda un PDF optimizado con las páginas de una factura (`PageRecord`
+    de `split_by_barcode`, en orden). Los píxeles se obtienen recién aquí
+    (ver `load_output_page`); si las páginas son `SourcePage` se copian
+    sin pérdida del PDF original.
+    """
+    if not records:
         logger.warning("No hay imágenes para generar PDF.")
         return
+
+    if isinstance(records[0].page, SourcePage):
+        save_pdf_lossless(records, output_path)
+        return
     
     processed_images = []
-    for _, img in images_with_meta:
-        processed = process_image_for_pdf(img, quality=quality)
+    for record in records:
+        processed = process_image_for_pdf(load_output_page(record.page), quality=quality)
         processed_images.append(processed)
 
     # Guardar PDF optimizado
@@ -43,3 +191,294 @@ def save_pdf(images_with_meta, output_path: Path, quality: int = 60):
     )
 
     logger.info(f"PDF optimizado generado: {output_path.name}")
+
+
+# ==================================================
+# Escritura de facturas en paralelo
+# ==================================================
+class WrittenDocument(NamedTuple):
+    code: str
+    filename: str
+    pages: int
+    # Escritura incremental: páginas agregadas a una factura ya escrita
+    merged: bool = False
+
+
+def plan_outputs(
+    documents: Dict[str, List[Any]],
+    counters: Dict[str, int],
+    existing_dir: Optional[Path] = None,
+) -> List[Tuple[str, str, List[Any]]]:
+    """
+    Asigna el nombre de archivo de cada factura, en el orden de
+    `documents`: <código>.pdf, y <código>_N.pdf si el código ya se usó
+    (`counters` se comparte entre PDFs de una misma ejecución).
+    Los nombres se fijan antes de escribir, así no dependen del orden
+    en que terminan los hilos.
+
+    Con `existing_dir` también se saltan los nombres que ya existen en
+    esa carpeta (p. ej. de ejecuciones anteriores del modo servicio).
+    """
+    plan = []
+    for code, entries in documents.items():
+        safe_code = safe_filename(code)
+        while True:
+            counters[safe_code] += 1
+            suffix = f"_{counters[safe_code]}" if counters[safe_code] > 1 else ""
+            filename = f"{safe_code}{suffix}.pdf"
+            if existing_dir is None or not (Path(existing_dir) / filename).exists():
+                break
+        plan.append((code, filename, entries))
+    return plan
+
+
+def _timed_save(entries, output_path: Path, metrics: Optional[Metrics]) -> None:
+    # Hilo del pool: registra directo en las métricas de la ejecución
+    with collecting(metrics), timed("save_pdf"):
+        save_pdf(entries, output_path)
+
+
+def write_documents(
+    documents: Dict[str, List[Any]],
+    output_dir: Path,
+    counters: Dict[str, int],
+    on_written: Optional[Callable[[WrittenDocument, int, int], None]] = None,
+    workers: int = WRITE_WORKERS,
+    cancelled: Optional[Callable[[], bool]] = None,
+    keep_existing: bool = False,
+    metrics: Optional[Metrics] = None,
+) -> List[WrittenDocument]:
+    """
+    Escribe cada factura con `save_pdf` en un pool de hilos (la
+    conversión, el redimensionado y la codificación JPEG de Pillow, y la
+    copia con pikepdf, sueltan el GIL).
+
+    `on_written(documento, escritos, total)` se llama en el hilo que
+    invoca a medida que cada archivo queda escrito. Si `cancelled()`
+    devuelve True se descartan los archivos que aún no empezaron.
+    Con `keep_existing` no se pisan archivos que ya están en `output_dir`.
+    El tiempo de cada `save_pdf` se registra en `metrics` ("save_pdf").
+    Devuelve los documentos escritos en el orden de `documents`.
+    """
+    output_dir = Path(output_dir)
+    plan = plan_outputs(documents, counters, output_dir if keep_existing else None)
+    total = len(plan)
+    written = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            pool.submit(_timed_save, entries, output_dir / filename, metrics):
+                WrittenDocument(code, filename, len(entries))
+            for code, filename, entries in plan
+        }
+
+        for future in as_completed(futures):
+            future.result()
+            document = futures[future]
+            written[document.filename] = document
+
+            if on_written is not None:
+                on_written(document, len(written), total)
+
+            if cancelled is not None and cancelled():
+                for pending in futures:
+                    pending.cancel()
+                break
+
+    return [
+        WrittenDocument(code, filename, len(entries))
+        for code, filename, entries in plan
+        if filename in written
+    ]
+
+
+# ==================================================
+# Escritura incremental (factura por factura)
+# ==================================================
+def merge_pdf(records, output_path: Path, written: List[int]) -> None:
+    """
+    Rearma un PDF ya escrito con todas las páginas de su factura
+    (`records`, en orden): las de índices `written` se copian del mismo
+    PDF, sin recomprimir; las nuevas se guardan con `save_pdf` y se
+    intercalan en su lugar.
+    """
+    already = set(written)
+    added = [record for record in records if record.index not in already]
+    part = output_path.with_name(f"{output_path.stem}.part.pdf")
+    merged_path = output_path.with_name(f"{output_path.stem}.merge.pdf")
+
+    old_position = {idx: n for n, idx in enumerate(written)}
+    new_position = {record.index: n for n, record in enumerate(added)}
+    try:
+        save_pdf(added, part)
+        with pikepdf.open(output_path) as old, pikepdf.open(part) as new, pikepdf.new() as merged:
+            for record in records:
+                if record.index in old_position:
+                    merged.pages.append(old.pages[old_position[record.index]])
+                else:
+                    merged.pages.append(new.pages[new_position[record.index]])
+            merged.save(merged_path)
+        os.replace(merged_path, output_path)
+    finally:
+        for leftover in (part, merged_path):
+            if leftover.exists():
+                leftover.unlink()
+
+
+class InvoiceWriter:
+    """
+    Escribe cada factura apenas `split_by_barcode` la entrega
+    (`on_document=writer.add`), en un pool de hilos, sin esperar al final
+    del PDF. Al quedar escrita se liberan sus páginas guardadas (ver
+    `PageSpool`).
+
+    Regla para páginas tardías: si un código ya escrito vuelve a llegar
+    (la factura reaparece más adelante en el escaneo), sus páginas nuevas
+    se fusionan en el mismo archivo, ordenadas por número de página
+    (`merge_pdf`). El resultado es el mismo que escribir todo al final.
+
+    Los nombres se asignan con `plan_outputs` al entregar cada factura.
+    `on_written(documento, escritos, None)` se llama en el hilo que
+    entrega las facturas (o en `close`) a medida que cada escritura
+    termina; `documento.merged` indica una fusión. Una escritura que
+    falla no corta la detección: queda en `errors`, y si la factura
+    vuelve a llegar se parte de lo último que quedó escrito. Los tiempos de cada
+    escritura quedan en `metrics` ("save_pdf").
+
+    Con `cancel`, tras la cancelación no se aceptan facturas nuevas y
+    `close` descarta las escrituras que aún no empezaron; las que están
+    en curso terminan (un archivo nunca queda a medias).
+    """
+
+    def __init__(
+        self,
+        output_dir: Path,
+        counters: Dict[str, int],
+        on_written: Optional[Callable[[WrittenDocument, int, Optional[int]], None]] = None,
+        workers: int = WRITE_WORKERS,
+        keep_existing: bool = False,
+        cancel: Optional[CancelToken] = None,
+    ):
+        self.output_dir = Path(output_dir)
+        self._cancel = cancel
+        self.metrics = Metrics()
+        self._counters = counters
+        self._on_written = on_written
+        self._keep_existing = keep_existing
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        # código -> (archivo, última escritura)
+        self._files: Dict[str, Tuple[str, Future]] = {}
+        # archivo -> índices que tiene escritos, en su orden (solo se
+        # actualiza cuando una escritura termina bien)
+        self._on_disk: Dict[str, List[int]] = {}
+        self._pending: List[Tuple[Future, WrittenDocument]] = []
+        self._written = 0
+        # Escrituras que fallaron: {"invoice", "filename", "error"}
+        self.errors: List[Dict[str, str]] = []
+
+    def add(self, code: str, records: List[Any]) -> None:
+        if self._cancelled():
+            return
+
+        previous = self._files.get(code)
+        if previous is None:
+            existing_dir = self.output_dir if self._keep_existing else None
+            _, filename, _ = plan_outputs({code: records}, self._counters, existing_dir)[0]
+            after = None
+        else:
+            filename, after = previous
+
+        future = self._pool.submit(self._write, filename, records, after)
+        self._files[code] = (filename, future)
+        self._pending.append(
+            (future, WrittenDocument(code, filename, len(records), merged=previous is not None))
+        )
+        self._drain(block=False)
+
+    def _write(self, filename: str, records, after: Optional[Future]) -> None:
+        # Las escrituras de un mismo archivo van en orden
+        if after is not None:
+            try:
+                after.result()
+            except CancelledError:
+                raise
+            except Exception:
+                # El archivo quedó como en su última escritura buena (o no
+                # existe): se parte de `_on_disk`
+                pass
+
+        output_path = self.output_dir / filename
+        written = self._on_disk.get(filename, [])
+        with collecting(self.metrics), timed("save_pdf"):
+            if written:
+                merge_pdf(records, output_path, written)
+            else:
+                try:
+                    save_pdf(records, output_path)
+                except Exception:
+                    # No queda un archivo a medias
+                    output_path.unlink(missing_ok=True)
+                    raise
+        self._on_disk[filename] = [record.index for record in records]
+
+        already = set(written)
+        for record in records:
+            if record.index not in already and isinstance(record.page, SpooledPage):
+                record.page.release()
+
+    def _drain(self, block: bool) -> None:
+        pending = []
+        for future, document in self._pending:
+            if not block and not future.done():
+                pending.append((future, document))
+                continue
+
+            try:
+                future.result()
+            except CancelledError:
+                # Descartada al cancelar (o la escritura previa del archivo)
+                continue
+            except Exception as e:
+                # Disco lleno, archivo bloqueado...: la detección sigue y el
+                # fallo queda en `errors`
+                logger.error(f"❌ No se pudo escribir {document.filename}: {e}")
+                self.errors.append({
+                    "invoice": document.code,
+                    "filename": document.filename,
+                    "error": str(e),
+                })
+                continue
+            self._written += 1
+            if self._on_written is not None:
+                self._on_written(document, self._written, None)
+            else:
+                # Sin callback (CLI, modo servicio) el aviso va al log
+                action = "actualizada" if document.merged else "escrita"
+                logger.info(
+                    f"💾 Factura {action}: {document.filename} ({document.pages} págs.)"
+                )
+        self._pending = pending
+
+    def close(self) -> List[WrittenDocument]:
+        """
+        Espera las escrituras pendientes y devuelve una entrada por
+        archivo (con su total de páginas), en el orden de las facturas.
+        Si se canceló, solo espera las que ya estaban en curso. Un
+        archivo cuya última escritura falló se devuelve como quedó en la
+        anterior, y si nunca se pudo escribir no se devuelve (ver `errors`).
+        """
+        if self._cancelled():
+            for future, _ in self._pending:
+                future.cancel()
+        try:
+            self._drain(block=True)
+        finally:
+            self._pool.shutdown()
+        return [
+            WrittenDocument(code, filename, len(self._on_disk[filename]))
+            for code, (filename, _) in self._files.items()
+            if filename in self._on_disk
+        ]
+
+    def _cancelled(self) -> bool:
+        return self._cancel is not None and self._cancel.is_cancelled()
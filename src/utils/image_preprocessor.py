@@ -2,14 +2,11 @@ import cv2
 import numpy as np
 from PIL import Image
 
-def preprocess_for_ocr(pil_image: Image.Image) -> Image.Image:
+def binarize(gray: np.ndarray) -> np.ndarray:
     """
-    Mejora contraste y binariza para OCR.
+    Umbral adaptativo sobre una zona ya en escala de grises.
     """
-    img = np.array(pil_image)
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-    processed = cv2.adaptiveThreshold(
+    return cv2.adaptiveThreshold(
         gray,
         255,
         cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
@@ -18,4 +15,15 @@ def preprocess_for_ocr(pil_image: Image.Image) -> Image.Image:
         10
     )
 
-    return Image.fromarray(processed)
+def preprocess_for_ocr(pil_image: Image.Image) -> Image.Image:
+    """
+    Mejora contraste y binariza para OCR.
+    """
+    img = np.array(pil_image)
+    if img.ndim == 3:
+        # PIL entrega RGB (no BGR)
+        gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    else:
+        gray = img
+
+    return Image.fromarray(binarize(gray))
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from loguru import logger
+from typing import Any, Dict
+
+from logger import get_base_dir
+from ocr_engine import engine_version
+from settings import (
+    CACHE_ENABLED,
+    DECODER_BACKEND,
+    DIRECT_IMAGES,
+    DPI_LADDER,
+    LOCATE_CODES,
+    OCR_MIN_CONFIDENCE,
+    OCR_MODE,
+    PAGE_NUMBER_MODE,
+    RENDER_DPI,
+    RENDER_MODE,
+)
+
+JOBS_DIR = get_base_dir() / "logs" / "jobs"
+
+
+def file_hash(path, chunk_size: int = 1 << 20) -> str:
+    """
+    SHA-256 del contenido del PDF: una bitácora no se reanuda sobre un
+    archivo que cambió.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def settings_fingerprint() -> Dict[str, Any]:
+    """
+    Configuración que cambia el resultado de detección de una página. Va
+    en la cabecera de la bitácora: con otra configuración no se reanuda.
+    """
+    return {
+        "page_numbers": PAGE_NUMBER_MODE,
+        "ocr_mode": OCR_MODE,
+        # Atajo por confianza del encabezado (más de 100 lo desactiva)
+        "ocr_min_confidence": OCR_MIN_CONFIDENCE,
+        "ocr_engine": engine_version(),
+        "render_mode": RENDER_MODE,
+        "direct_images": DIRECT_IMAGES,
+        "locate_codes": LOCATE_CODES,
+        "decoder": DECODER_BACKEND,
+        "render_dpi": RENDER_DPI,
+        "dpi_ladder": list(DPI_LADDER),
+        # Con la caché se reutilizan lecturas de ejecuciones anteriores
+        "cache": CACHE_ENABLED,
+    }
+
+
+# ==================================================
+# Bitácora de trabajo (checkpoint por página)
+# ==================================================
+class JobJournal:
+    """
+    Archivo append-only (JSON por línea) con el resultado de detección de
+    cada página ya analizada de un PDF. Si el proceso se interrumpe, una
+    nueva ejecución sobre el mismo PDF (mismo contenido y misma ruta)
+    retoma desde la bitácora.
+
+    La primera línea guarda `settings_fingerprint()`; una bitácora hecha
+    con otra configuración (o sin cabecera) se descarta al cargarla.
+
+    Se elimina con `discard()` cuando el trabajo termina correctamente.
+    """
+
+    def __init__(self, pdf_path):
+        self.pdf_path = Path(pdf_path)
+        # Contenido + ruta: dos copias idénticas en un mismo lote
+        # (`--jobs`) no comparten bitácora
+        location = hashlib.sha256(str(self.pdf_path.resolve()).encode("utf-8"))
+        self.key = f"{file_hash(self.pdf_path)}_{location.hexdigest()[:16]}"
+        self.path = JOBS_DIR / f"{self.key}.jsonl"
+        self.settings = settings_fingerprint()
+        self._file = None
+
+    def load(self) -> Dict[int, Dict]:
+        """
+        Resultados guardados, por número de página.
+        """
+        if not self.path.exists():
+            return {}
+
+        with open(self.path, encoding="utf-8") as f:
+            lines = f.readlines()
+
+        if not lines or self._header(lines[0]) != self.settings:
+            logger.warning(
+                f"Bitácora {self.path.name} hecha con otra configuración "
+                "de detección, se descarta"
+            )
+            self.discard()
+            return {}
+
+        results = {}
+        for line in lines[1:]:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # Última línea a medio escribir (corte abrupto)
+                logger.warning(f"Línea inválida en bitácora {self.path.name}, se ignora")
+                continue
+            results[int(result["index"])] = result
+        return results
+
+    @staticmethod
+    def _header(line: str):
+        try:
+            header = json.loads(line)
+        except json.JSONDecodeError:
+            return None
+        return header.get("settings") if isinstance(header, dict) else None
+
+    def completed_pages(self) -> int:
+        return len(self.load())
+
+    def append(self, result: Dict) -> None:
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+            if self._file.tell() == 0:
+                self._write({"settings": self.settings})
+
+        self._write(result)
+
+    def _write(self, record: Dict) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        # Sobrevive a suspensión / corte de energía
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self) -> None:
+        self.close()
+        if self.path.exists():
+            self.path.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,166 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+# Orden en que se muestran las etapas conocidas; las demás van al final
+STAGE_ORDER = (
+    "render",
+    "detect",
+    "zbar",
+    "zbar_batch",
+    "locate",
+    "ocr:HEADER",
+    "ocr:NOFAC",
+    "ocr:TOP",
+    "ocr:BOTTOM",
+    "ocr:PAGE",
+    "ocr:MULTI",
+    "ocr:STRIPS",
+    "group",
+    "save_pdf",
+)
+
+
+# ==================================================
+# Métricas de tiempo por etapa
+# ==================================================
+class Metrics:
+    """
+    Duraciones (en segundos) de cada llamada, agrupadas por etapa:
+    "render", "zbar", "ocr:HEADER", "save_pdf", etc.
+
+    Se suman entre páginas, procesos y PDFs con `merge` y se resumen en
+    count / total / p50 / p95 con `summary`. Es seguro usarlo desde
+    varios hilos (p. ej. el escritor de salida).
+    """
+
+    def __init__(self, samples: Optional[Dict[str, List[float]]] = None):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+        if samples:
+            self.merge(samples)
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def merge(self, other: Union["Metrics", Dict[str, List[float]]]) -> None:
+        samples = other.samples if isinstance(other, Metrics) else other
+        with self._lock:
+            for stage, values in samples.items():
+                self.samples[stage].extend(values)
+
+    def as_dict(self) -> Dict[str, List[float]]:
+        """
+        Muestras crudas (serializables: viajan desde los procesos de detección).
+        """
+        with self._lock:
+            return {stage: list(values) for stage, values in self.samples.items()}
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            stages = sorted(self.samples, key=_stage_key)
+            return {stage: _describe(self.samples[stage]) for stage in stages}
+
+    def __getstate__(self):
+        return {"samples": self.as_dict()}
+
+    def __setstate__(self, state):
+        self.__init__(state["samples"])
+
+
+def _stage_key(stage: str):
+    if stage in STAGE_ORDER:
+        return (STAGE_ORDER.index(stage), stage)
+    return (len(STAGE_ORDER), stage)
+
+
+def _percentile(ordered: List[float], p: float) -> float:
+    # Rango más cercano: siempre es una muestra real
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _describe(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "total": round(sum(ordered), 4),
+        "p50": round(_percentile(ordered, 50), 4) if ordered else 0.0,
+        "p95": round(_percentile(ordered, 95), 4) if ordered else 0.0,
+    }
+
+
+def format_summary(summary: Dict[str, Dict[str, float]]) -> List[str]:
+    """
+    Tabla de texto (una línea por etapa) para la consola o el log de la UI.
+    """
+    lines = [f"{'etapa':<12} {'n':>6} {'total s':>9} {'p50 ms':>8} {'p95 ms':>8}"]
+    for stage, s in summary.items():
+        lines.append(
+            f"{stage:<12} {s['count']:>6} {s['total']:>9.2f} "
+            f"{s['p50'] * 1000:>8.1f} {s['p95'] * 1000:>8.1f}"
+        )
+    return lines
+
+
+# ==================================================
+# Registro: a las métricas activas del hilo
+# ==================================================
+_local = threading.local()
+
+
+@contextmanager
+def collecting(metrics: Metrics) -> Iterator[Metrics]:
+    """
+    Dentro del bloque, `timed` registra en `metrics` (por hilo; los
+    bloques se pueden anidar, p. ej. una página dentro de un PDF).
+    """
+    previous = getattr(_local, "metrics", None)
+    _local.metrics = metrics
+    try:
+        yield metrics
+    finally:
+        _local.metrics = previous
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """
+    Mide el bloque; sin `collecting` activo no registra nada.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(stage, time.perf_counter() - started)
+
+
+def _record(stage: str, seconds: float) -> None:
+    metrics = getattr(_local, "metrics", None)
+    if metrics is not None:
+        metrics.add(stage, seconds)
+
+
+def timed_call(stage: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    with timed(stage):
+        return fn(*args, **kwargs)
+
+
+def timed_iter(iterable: Iterable, stage: str) -> Iterator:
+    """
+    Mide cuánto tarda en llegar cada elemento (p. ej. el render perezoso
+    de cada página).
+    """
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        _record(stage, time.perf_counter() - started)
+        yield item
@@ -0,0 +1,80 @@
+import time
+from collections import deque
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional
+
+
+# ==================================================
+# Eventos de avance
+# ==================================================
+class ProgressEvent(NamedTuple):
+    """
+    Avance de una página:
+    - "render": la página salió del render (o de la extracción directa)
+    - "detect": la página quedó analizada y asignada a una factura
+    - "journal": la página se tomó de la bitácora (no se volvió a analizar)
+    `source` y `code` solo vienen en "detect" y "journal".
+    """
+    stage: str
+    index: int
+    source: Optional[str] = None
+    code: Optional[str] = None
+
+
+ProgressCallback = Callable[[ProgressEvent], None]
+
+
+def report_rendered(images: Iterable, on_progress: Optional[ProgressCallback]) -> Iterator:
+    """
+    Deja pasar las páginas de `images` avisando un evento "render" por cada una.
+    """
+    for index, image in enumerate(images, start=1):
+        if on_progress is not None:
+            on_progress(ProgressEvent("render", index))
+        yield image
+
+
+# ==================================================
+# Ritmo y tiempo restante
+# ==================================================
+class Throughput:
+    """
+    Páginas por minuto sobre las últimas `window` páginas analizadas y el
+    tiempo restante estimado a ese ritmo. Las páginas tomadas de la
+    bitácora cuentan como hechas pero no entran en el ritmo.
+    """
+
+    def __init__(self, total: int, window: int = 20):
+        self.total = total
+        self.done = 0
+        self._times = deque(maxlen=window)
+
+    def add(self, event: ProgressEvent) -> None:
+        if event.stage not in ("detect", "journal"):
+            return
+        self.done += 1
+        if event.stage == "detect":
+            self._times.append(time.perf_counter())
+
+    @property
+    def pages_per_minute(self) -> Optional[float]:
+        if len(self._times) < 2:
+            return None
+        elapsed = self._times[-1] - self._times[0]
+        if elapsed <= 0:
+            return None
+        return (len(self._times) - 1) * 60 / elapsed
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        rate = self.pages_per_minute
+        if rate is None:
+            return None
+        return max(0, self.total - self.done) * 60 / rate
+
+
+def format_eta(seconds: float) -> str:
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours} h {minutes:02d} min"
+    return f"{minutes}:{seconds:02d}"
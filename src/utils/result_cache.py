@@ -0,0 +1,224 @@
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from loguru import logger
+from PIL import Image
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from logger import get_base_dir
+from settings import CACHE_ENABLED, CACHE_MAX_ENTRIES
+
+CACHE_PATH = get_base_dir() / "logs" / "results_cache.sqlite3"
+
+# Cada cuántas escrituras se revisa el límite de tamaño
+_EVICT_EVERY = 200
+# Cada cuántos aciertos se vuelcan sus last_used pendientes
+_TOUCH_EVERY = 200
+
+
+# ==================================================
+# Caché persistente de resultados OCR / decodificación
+# ==================================================
+class ResultCache:
+    """
+    Caché en SQLite indexada por el hash de los píxeles del recorte
+    (ROI) más la versión del motor/configuración que lo procesa.
+
+    Se acota a `max_entries` filas con expulsión LRU. Un acierto no
+    escribe en la base: su `last_used` queda en memoria y se vuelca en
+    lote (cada `_TOUCH_EVERY` aciertos, antes de cada expulsión y al
+    salir). Lo pendiente de un proceso que muere sin volcar se pierde;
+    el LRU es aproximado. Los contadores de aciertos/fallos son por
+    proceso (ver `cache_stats`).
+    """
+
+    def __init__(self, path, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._pid = None
+        self._writes = 0
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Una conexión por proceso: tras un fork no se reutiliza la del padre
+        if self._conn is None or self._pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(
+                str(self.path), timeout=30, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_last_used ON results(last_used)"
+            )
+            self._conn = conn
+            self._pid = os.getpid()
+            # Lo pendiente del padre lo vuelca el padre
+            self._touched = {}
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value FROM results WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= _TOUCH_EVERY:
+                self._flush(conn)
+                conn.commit()
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, last_used) "
+                "VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            self._touched.pop(key, None)
+            self._writes += 1
+            if self._writes % _EVICT_EVERY == 0:
+                # El orden LRU tiene que ver los aciertos recientes
+                self._flush(conn)
+                self._evict(conn)
+            conn.commit()
+
+    def flush(self) -> None:
+        """
+        Vuelca los `last_used` pendientes (se llama también al salir).
+        """
+        with self._lock:
+            if not self._touched or self._pid != os.getpid():
+                return
+            self._flush(self._conn)
+            self._conn.commit()
+
+    def _flush(self, conn: sqlite3.Connection) -> None:
+        if self._touched:
+            conn.executemany(
+                "UPDATE results SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()],
+            )
+            self._touched = {}
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        (count,) = conn.execute("SELECT COUNT(*) FROM results").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM results WHERE key IN ("
+                "SELECT key FROM results ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+            logger.debug(f"Caché: {excess} entradas expulsadas (LRU)")
+
+
+_cache = ResultCache(CACHE_PATH, CACHE_MAX_ENTRIES)
+
+
+def _flush_at_exit() -> None:
+    try:
+        _cache.flush()
+    except sqlite3.Error as e:
+        logger.warning(f"No se pudo actualizar la caché al salir: {e}")
+
+
+atexit.register(_flush_at_exit)
+
+
+def roi_key(namespace: str, image: Image.Image, version: str) -> str:
+    """
+    Clave de contenido: hash de los píxeles del recorte + versión.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{namespace}|{version}|{image.mode}|{image.size}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def _get(key: str):
+    try:
+        stored = _cache.get(key)
+    except sqlite3.Error as e:
+        logger.warning(f"Caché no disponible: {e}")
+        return False, None
+
+    if stored is None:
+        return False, None
+    return True, json.loads(stored)
+
+
+def _put(key: str, value: Any) -> None:
+    try:
+        _cache.put(key, json.dumps(value))
+    except sqlite3.Error as e:
+        logger.warning(f"No se pudo guardar en caché: {e}")
+
+
+def cached(
+    namespace: str,
+    image: Image.Image,
+    version: str,
+    compute: Callable[[], Any],
+) -> Any:
+    """
+    Devuelve el resultado guardado para este recorte o lo calcula con
+    `compute()` y lo guarda. Los valores se serializan como JSON.
+    """
+    if not CACHE_ENABLED:
+        return compute()
+
+    key = roi_key(namespace, image, version)
+    found, value = _get(key)
+    if found:
+        return value
+
+    value = compute()
+    _put(key, value)
+    return value
+
+
+def lookup(namespace: str, image: Image.Image, version: str) -> Tuple[bool, Any]:
+    """
+    Consulta sin calcular (para lotes). Devuelve (encontrado, valor).
+    """
+    if not CACHE_ENABLED:
+        return False, None
+    return _get(roi_key(namespace, image, version))
+
+
+def store(namespace: str, image: Image.Image, version: str, value: Any) -> None:
+    if CACHE_ENABLED:
+        _put(roi_key(namespace, image, version), value)
+
+
+def cache_stats() -> Dict[str, int]:
+    """
+    Aciertos/fallos acumulados en este proceso.
+    """
+    return {"hits": _cache.hits, "misses": _cache.misses}
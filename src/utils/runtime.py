@@ -1,4 +1,5 @@
 from pathlib import Path
+import shutil
 import sys
 import os
 
@@ -13,11 +14,23 @@ def runtime_path(relative: str) -> Path:
     return Path(relative)
 
 
+def installed_tool(bundled: Path, name: str) -> Path:
+    """
+    Ejecutable incluido en runtime/ (Windows / .exe) o, si no está,
+    el instalado en el sistema (p. ej. Linux: apt install tesseract-ocr).
+    Si no hay ninguno se devuelve la ruta incluida, para el mensaje de error.
+    """
+    if bundled.exists():
+        return bundled
+    found = shutil.which(name)
+    return Path(found) if found else bundled
+
+
 # ==================================================
 # TESSERACT
 # ==================================================
 def tesseract_cmd() -> Path:
-    return runtime_path("runtime/tesseract/tesseract.exe")
+    return installed_tool(runtime_path("runtime/tesseract/tesseract.exe"), "tesseract")
 
 
 def tessdata_dir() -> Path:
@@ -28,12 +41,31 @@ def tessdata_dir() -> Path:
 # POPPLER
 # ==================================================
 def poppler_bin() -> Path:
-    return runtime_path("runtime/poppler/Library/bin")
+    bundled = runtime_path("runtime/poppler/Library/bin")
+    return installed_tool(bundled / "pdftoppm.exe", "pdftoppm").parent
+
+
+# ==================================================
+# ZBAR
+# ==================================================
+def zbarimg_exe() -> Path:
+    return installed_tool(runtime_path("runtime/zbar/bin/zbarimg.exe"), "zbarimg")
 
 
 # ==================================================
 # OCULTAR CONSOLAS DE SUBPROCESOS (Windows)
 # ==================================================
+def no_window_kwargs() -> dict:
+    """
+    kwargs para subprocess.run/Popen que evitan abrir una consola por
+    cada proceso hijo en Windows (vacío en otros sistemas).
+    """
+    if sys.platform == 'win32':
+        import subprocess
+        return {"creationflags": subprocess.CREATE_NO_WINDOW}
+    return {}
+
+
 def hide_subprocess_consoles():
     """
     Configura subprocess para que no muestre ventanas de consola
@@ -0,0 +1,14 @@
+import os
+import sys
+from pathlib import Path
+
+# Los módulos de src/ se importan igual que en la app (sin paquete)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+# Antes de importar settings: sin caché en disco, detección en serie y
+# modos por defecto, sin importar el .env de quien corre las pruebas
+os.environ["SCANNER_CACHE"] = "0"
+os.environ["SCANNER_WORKERS"] = "1"
+os.environ["SCANNER_PAGE_NUMBERS"] = "lazy"
+os.environ["SCANNER_OCR_MODE"] = "crops"
+os.environ["SCANNER_RENDER_MODE"] = "full"
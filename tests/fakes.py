@@ -0,0 +1,76 @@
+"""
+Páginas sintéticas y detectores falsos para las pruebas: no hacen falta
+Tesseract, zbar ni poppler.
+
+Cada página es una imagen lisa cuyo tono identifica la página; los
+detectores falsos leen ese tono y devuelven lo que dice su `Spec`.
+"""
+from typing import List, NamedTuple, Optional
+
+from PIL import Image
+
+# Tono de la página 1 (el de la página n es OFFSET + n)
+OFFSET = 20
+
+
+class Spec(NamedTuple):
+    code: Optional[str]          # lo que "lee" el QR (None: nada)
+    page_number: Optional[int]   # lo que "lee" el OCR del pie (None: falla)
+
+
+def make_pages(specs: List[Spec], size=(120, 160)) -> List[Image.Image]:
+    return [Image.new("L", size, OFFSET + n) for n in range(1, len(specs) + 1)]
+
+
+def page_index(image) -> int:
+    from page_context import as_context
+
+    gray = as_context(image).gray((0.0, 0.0, 1.0, 1.0))
+    return int(gray[0, 0]) - OFFSET
+
+
+class FakeDetectors:
+    """
+    Reemplaza en `pdf_processor` el decodificador, el OCR y la lectura
+    del número de página; cuenta las lecturas del pie.
+    """
+
+    def __init__(self, monkeypatch, specs: List[Spec]):
+        import pdf_processor
+
+        self.specs = specs
+        self.footer_reads: List[int] = []
+
+        monkeypatch.setattr(pdf_processor, "get_decoder", lambda: None)
+        monkeypatch.setattr(pdf_processor, "extract_qr_and_barcode", self._decode)
+        monkeypatch.setattr(
+            pdf_processor, "extract_located_codes", lambda *a, **k: (None, None)
+        )
+        monkeypatch.setattr(pdf_processor, "extract_codes", lambda *a, **k: {})
+        monkeypatch.setattr(pdf_processor, "image_to_string", lambda *a, **k: "")
+        monkeypatch.setattr(
+            pdf_processor, "extract_page_number_from_image", self._page_number
+        )
+        monkeypatch.setattr(
+            pdf_processor, "extract_page_number_from_crop", self._page_number
+        )
+
+    def _spec(self, image) -> Spec:
+        return self.specs[page_index(image) - 1]
+
+    def _decode(self, image, *args, **kwargs):
+        return self._spec(image).code, None
+
+    def _page_number(self, image):
+        self.footer_reads.append(page_index(image))
+        return self._spec(image).page_number
+
+
+def layout(documents) -> dict:
+    """
+    {código: [(índice, número de página), ...]} para comparar documentos.
+    """
+    return {
+        code: [(record.index, record.page_number) for record in records]
+        for code, records in documents.items()
+    }
@@ -0,0 +1,95 @@
+import base64
+import subprocess
+
+from PIL import Image
+
+import decoders
+from decoders import _parse_zbar_xml, run_zbar_batch
+
+XML = """<barcodes xmlns='http://zbar.sourceforge.net/2008/barcode'>
+<source href='/tmp/qr_1.png'>
+<index num='0'>
+<symbol type='QR-Code' quality='1' orientation='UP'><data><![CDATA[NumFac: 9900000001
+Total: 10]]></data></symbol>
+<symbol type='CODE-128' quality='45' orientation='UP'><data><![CDATA[9900000001]]></data></symbol>
+</index>
+</source>
+<source href='/tmp/qr_2.png'>
+</source>
+<source href='/tmp/qr_3.png'>
+<index num='0'>
+<symbol type='QR-Code' quality='1'><data format='base64' length='11'><![CDATA[{b64}]]></data></symbol>
+</index>
+</source>
+</barcodes>
+""".replace("{b64}", base64.b64encode("NumFac: ñ-7".encode()).decode())
+
+
+def test_parse_zbar_xml_groups_symbols_by_file():
+    assert _parse_zbar_xml(XML) == {
+        "/tmp/qr_1.png": ["NumFac: 9900000001\nTotal: 10", "9900000001"],
+        "/tmp/qr_2.png": [],
+        "/tmp/qr_3.png": ["NumFac: ñ-7"],
+    }
+
+
+def test_parse_zbar_xml_empty_output():
+    assert _parse_zbar_xml("") == {}
+    assert _parse_zbar_xml("  \n") == {}
+
+
+def test_run_zbar_batch_splits_lines_like_raw(monkeypatch):
+    calls = []
+
+    def _run_tool(args, **kwargs):
+        calls.append(args)
+        return subprocess.CompletedProcess(args, 0, XML, "")
+
+    monkeypatch.setattr(decoders, "run_tool", _run_tool)
+
+    result = run_zbar_batch(["/tmp/qr_1.png", "/tmp/qr_2.png", "/tmp/qr_3.png"])
+
+    # Una sola ejecución para todos los archivos
+    assert len(calls) == 1
+    assert calls[0][1:3] == ["--xml", "-q"]
+    assert result == {
+        "/tmp/qr_1.png": ["NumFac: 9900000001", "Total: 10", "9900000001"],
+        "/tmp/qr_2.png": [],
+        "/tmp/qr_3.png": ["NumFac: ñ-7"],
+    }
+
+
+def test_run_zbar_batch_splits_long_command_lines(monkeypatch):
+    calls = []
+
+    def _run_tool(args, **kwargs):
+        calls.append(args[3:])
+        return subprocess.CompletedProcess(args, 4, "", "")
+
+    monkeypatch.setattr(decoders, "run_tool", _run_tool)
+    monkeypatch.setattr(decoders, "_MAX_CMDLINE", 100)
+
+    paths = [f"/tmp/{'x' * 30}_{n}.png" for n in range(7)]
+    result = run_zbar_batch(paths)
+
+    assert len(calls) > 1
+    assert [path for call in calls for path in call] == paths
+    assert result == {path: [] for path in paths}
+
+
+def test_opencv_reads_barcodes_with_pyzbar_when_available(monkeypatch):
+    monkeypatch.setattr(decoders.PyzbarDecoder, "available", lambda self: True)
+    monkeypatch.setattr(decoders.PyzbarDecoder, "decode", lambda self, image: ["9900000001"])
+    decoder = decoders.OpenCVDecoder()
+
+    assert decoder.available()
+    assert decoder.decode(Image.new("L", (200, 80), 255)) == ["9900000001"]
+
+
+def test_opencv_without_pyzbar_falls_back_to_cv2_barcode(monkeypatch):
+    monkeypatch.setattr(decoders.PyzbarDecoder, "available", lambda self: False)
+    decoder = decoders.OpenCVDecoder()
+
+    assert decoder.available()
+    assert decoder._barcode is not None
+    assert decoder.decode(Image.new("L", (200, 80), 255)) == []
@@ -0,0 +1,103 @@
+from collections import Counter
+
+from PIL import Image
+
+import extract_codes
+from extract_codes import codes_from_header, extract_codes_multi
+
+
+def _fake_ocr(texts):
+    def ocr_regions(regions, **kwargs):
+        return {name: (texts.get(name, ""), []) for name, _ in regions}
+    return ocr_regions
+
+
+def _baseline_vote(codes):
+    # Votación original de split_by_barcode, con el No.FAC siempre leído
+    candidates = [v for v in (codes["no_header"], codes["ref_int"], codes["no_fac"]) if v]
+    return Counter(candidates).most_common(1)[0][0] if candidates else None
+
+
+def _decide(header_text, words, no_fac_text):
+    reads = []
+
+    def read_no_fac():
+        reads.append(no_fac_text)
+        return no_fac_text
+
+    codes = codes_from_header(header_text, words, read_no_fac, min_confidence=90)
+    full = dict(codes)
+    m = extract_codes.NO_FAC_REGEX.search(no_fac_text)
+    full["no_fac"] = m.group(1) if m else None
+    return codes, full, bool(reads)
+
+
+def test_header_shortcut_when_header_has_one_code():
+    for no_fac in ("No. FAC: 9900000002", "No. FAC: 9900000001", ""):
+        codes, full, read = _decide("Ref. Int: 9900000001", [], no_fac)
+
+        assert codes["shortcut"] == "header"
+        assert not read
+        assert codes["accepted"] == _baseline_vote(full) == "9900000001"
+
+
+def test_header_shortcut_when_both_header_codes_agree():
+    codes, full, read = _decide(
+        "No. 990-0000001 Ref. Int: 99000000001", [], "No. FAC: 12345678"
+    )
+
+    assert codes["shortcut"] == "header"
+    assert not read
+    assert codes["accepted"] == _baseline_vote(full) == "99000000001"
+
+
+def test_confidence_shortcut_keeps_the_header_number():
+    # Un Ref.Int. distinto leído con confianza no gana sin que No.FAC lo confirme
+    words = [("No.", 95.0), ("990-0000001", 96.0), ("Ref.", 95.0), ("12345678", 99.0)]
+    codes, full, read = _decide(
+        "No. 990-0000001 Ref. Int: 12345678", words, "No. FAC: 55555555"
+    )
+
+    assert codes["shortcut"] == "confidence"
+    assert not read
+    assert codes["accepted"] == _baseline_vote(full) == "99000000001"
+
+
+def test_vote_when_header_number_has_low_confidence():
+    words = [("No.", 95.0), ("990-0000001", 60.0), ("12345678", 99.0)]
+    codes, full, read = _decide(
+        "No. 990-0000001 Ref. Int: 12345678", words, "No. FAC: 12345678"
+    )
+
+    assert codes["shortcut"] == "vote"
+    assert read
+    assert codes["accepted"] is None
+    # No.FAC confirma el Ref.Int.: la votación lo elige
+    assert _baseline_vote(codes) == _baseline_vote(full) == "12345678"
+
+
+def test_vote_when_header_has_no_code():
+    codes, full, read = _decide("sin códigos", [], "No. FAC: 12345678")
+
+    assert codes["shortcut"] == "vote"
+    assert read
+    assert _baseline_vote(codes) == _baseline_vote(full) == "12345678"
+
+
+def test_multi_reads_no_fac_so_no_shortcut_is_reported(monkeypatch):
+    monkeypatch.setattr(extract_codes, "ocr_regions", _fake_ocr({
+        "header": "Ref. Int: 9900000001",
+        "no_fac": "No. FAC: 9900000002",
+        "page": "Pág. 2 de 3",
+    }))
+
+    codes, texts = extract_codes_multi(
+        Image.new("L", (400, 600)), [("page", Image.new("L", (10, 10)))]
+    )
+
+    # El encabezado decide el código; No.FAC se leyó en la misma pasada
+    # aunque no se use, así que no cuenta como recorte omitido
+    assert codes["accepted"] == "9900000001"
+    assert codes["no_fac"] is None
+    assert codes["shortcut"] is None
+    assert texts == {"page": "Pág. 2 de 3"}
@@ -0,0 +1,138 @@
+import os
+from collections import defaultdict
+
+import pikepdf
+from PIL import Image
+
+from pdf_processor import PageRecord
+from utils import file_utils
+from utils.file_utils import InvoiceWriter, PageSpool, SourcePage, WrittenDocument
+
+A, B = "9900000001", "9900000002"
+
+
+def _width(index: int) -> int:
+    # El ancho identifica la página de origen en el PDF de salida
+    return 100 + 10 * index
+
+
+def _widths(path) -> list:
+    with pikepdf.open(path) as pdf:
+        return [round(float(page.mediabox[2])) for page in pdf.pages]
+
+
+def _write(tmp_path, record):
+    # A: páginas 1 y 2, luego B, y la página 7 de A (su pág. 2) llega tarde
+    writer = InvoiceWriter(tmp_path, defaultdict(int), workers=2)
+    a = [record(1, 1, A), record(2, 3, A)]
+    writer.add(A, a)
+    writer.add(B, [record(3, 1, B)])
+    writer.add(A, sorted(a + [record(7, 2, A)], key=lambda r: r.page_number))
+    return writer.close()
+
+
+def test_late_page_is_merged_in_page_order(tmp_path):
+    spool = PageSpool()
+    spooled = []
+
+    def record(index, page_number, code):
+        page = spool.put(index, Image.new("L", (_width(index), 200), 255))
+        spooled.append(page)
+        return PageRecord(index, page_number, code, "QR", page)
+
+    try:
+        written = _write(tmp_path, record)
+    finally:
+        spool.cleanup()
+
+    assert written == [WrittenDocument(A, f"{A}.pdf", 3), WrittenDocument(B, f"{B}.pdf", 1)]
+    assert _widths(tmp_path / f"{A}.pdf") == [_width(1), _width(7), _width(2)]
+    assert _widths(tmp_path / f"{B}.pdf") == [_width(3)]
+    # Sin archivos intermedios, y cada página escrita soltó su copia en disco
+    assert sorted(os.listdir(tmp_path)) == [f"{A}.pdf", f"{B}.pdf"]
+    assert not any(os.path.exists(page.path) for page in spooled)
+
+
+def test_late_page_is_merged_without_recompressing(tmp_path):
+    source = tmp_path / "original.pdf"
+    with pikepdf.new() as pdf:
+        for index in range(1, 8):
+            pdf.add_blank_page(page_size=(_width(index), 200))
+        pdf.save(source)
+    output = tmp_path / "salida"
+    output.mkdir()
+
+    def record(index, page_number, code):
+        return PageRecord(index, page_number, code, "QR", SourcePage(str(source), index))
+
+    _write(output, record)
+
+    assert _widths(output / f"{A}.pdf") == [_width(1), _width(7), _width(2)]
+    assert _widths(output / f"{B}.pdf") == [_width(3)]
+
+
+def _failing_once(function):
+    calls = []
+
+    def _call(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise OSError("disco lleno")
+        return function(*args, **kwargs)
+    return _call
+
+
+def _blank_record(index, page_number, code):
+    page = Image.new("L", (_width(index), 200), 255)
+    return PageRecord(index, page_number, code, "QR", page)
+
+
+def test_failed_write_is_reported_and_the_late_page_rewrites_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_utils, "save_pdf", _failing_once(file_utils.save_pdf))
+    writer = InvoiceWriter(tmp_path, defaultdict(int), workers=1)
+
+    # La primera escritura de A falla: add no lanza y la detección sigue
+    a = [_blank_record(1, 1, A), _blank_record(2, 3, A)]
+    writer.add(A, a)
+    writer.add(B, [_blank_record(3, 1, B)])
+    writer.add(A, sorted(a + [_blank_record(7, 2, A)], key=lambda r: r.page_number))
+    written = writer.close()
+
+    assert writer.errors == [{"invoice": A, "filename": f"{A}.pdf", "error": "disco lleno"}]
+    # Sin un archivo previo bueno no se fusiona: se escribe completo
+    assert written == [WrittenDocument(A, f"{A}.pdf", 3), WrittenDocument(B, f"{B}.pdf", 1)]
+    assert _widths(tmp_path / f"{A}.pdf") == [_width(1), _width(7), _width(2)]
+
+
+def test_failed_merge_keeps_the_previous_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_utils, "merge_pdf", _failing_once(file_utils.merge_pdf))
+    writer = InvoiceWriter(tmp_path, defaultdict(int), workers=1)
+
+    a = [_blank_record(1, 1, A), _blank_record(2, 2, A)]
+    writer.add(A, list(a))
+    a.append(_blank_record(5, 3, A))
+    writer.add(A, list(a))
+    a.append(_blank_record(8, 4, A))
+    writer.add(A, list(a))
+    written = writer.close()
+
+    assert [error["error"] for error in writer.errors] == ["disco lleno"]
+    # La fusión siguiente parte de lo que quedó escrito y suma ambas páginas
+    assert written == [WrittenDocument(A, f"{A}.pdf", 4)]
+    assert _widths(tmp_path / f"{A}.pdf") == [_width(1), _width(2), _width(5), _width(8)]
+    assert sorted(os.listdir(tmp_path)) == [f"{A}.pdf"]
+
+
+def test_write_that_never_succeeded_leaves_no_file(tmp_path, monkeypatch):
+    def _save_pdf(records, output_path):
+        output_path.write_bytes(b"%PDF-1.4 a medias")
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(file_utils, "save_pdf", _save_pdf)
+    writer = InvoiceWriter(tmp_path, defaultdict(int), workers=1)
+
+    writer.add(A, [_blank_record(1, 1, A)])
+
+    assert writer.close() == []
+    assert len(writer.errors) == 1
+    assert os.listdir(tmp_path) == []
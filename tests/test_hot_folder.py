@@ -0,0 +1,106 @@
+import json
+import os
+import shutil
+
+import hot_folder
+from hot_folder import HotFolder
+
+
+def _folder(tmp_path):
+    folder = HotFolder(tmp_path / "entrada", tmp_path / "salida", workers=1)
+    for path in (folder.input_dir, folder.done_dir, folder.failed_dir):
+        path.mkdir(parents=True)
+    return folder
+
+
+def test_stuck_original_is_retried_with_backoff(tmp_path, monkeypatch):
+    monkeypatch.setattr(hot_folder, "MOVE_RETRY_SECONDS", 0)
+    folder = _folder(tmp_path)
+    path = folder.input_dir / "lote.pdf"
+    path.write_bytes(b"%PDF-1.4\n%%EOF")
+    row = {"pdf": str(path), "status": "ok", "invoices_count": 2}
+
+    real_move = shutil.move
+    locked = True
+
+    def _move(src, dst):
+        if locked:
+            raise PermissionError("archivo en uso")
+        return real_move(src, dst)
+
+    monkeypatch.setattr(hot_folder.shutil, "move", _move)
+
+    folder._archive(path, folder.done_dir, row, attempts=0)
+    stuck = folder._stuck[path]
+    report = json.loads((folder.failed_dir / "lote.move_error.json").read_text(encoding="utf-8"))
+    assert report["move_error"] == "archivo en uso"
+    assert report["move_target"] == str(folder.done_dir)
+    assert report["invoices_count"] == 2
+
+    # Antes de su hora no se reintenta; después, la espera se duplica
+    folder._retry_stuck()
+    assert folder._stuck[path] == stuck
+    folder._stuck[path] = stuck._replace(next_try=0)
+    folder._retry_stuck()
+    assert folder._stuck[path].attempts == 2
+    assert folder._stuck[path].next_try - stuck.next_try >= hot_folder.STUCK_RETRY_SECONDS - 1
+
+    locked = False
+    folder._stuck[path] = folder._stuck[path]._replace(next_try=0)
+    folder._retry_stuck()
+
+    assert folder._stuck == {}
+    assert not path.exists()
+    assert not (folder.failed_dir / "lote.move_error.json").exists()
+    report = json.loads((folder.done_dir / "lote.json").read_text(encoding="utf-8"))
+    assert report["pdf"] == str(folder.done_dir / "lote.pdf")
+    assert report["source"] == str(path)
+
+
+def test_stuck_original_removed_by_someone_else_is_forgotten(tmp_path):
+    folder = _folder(tmp_path)
+    path = folder.input_dir / "lote.pdf"
+    folder._stuck[path] = hot_folder._Stuck(folder.done_dir, {}, 1, 0)
+
+    folder._retry_stuck()
+
+    assert folder._stuck == {}
+
+
+def test_broken_pool_is_restarted_and_the_pdf_retried(tmp_path, monkeypatch):
+    # Procesos reales: el motor y el decodificador no hacen falta
+    monkeypatch.setattr(hot_folder, "warm_up", lambda: None)
+    monkeypatch.setattr(hot_folder, "get_decoder", lambda: None)
+    monkeypatch.setattr(hot_folder, "check_engine", lambda: None)
+    monkeypatch.setattr(hot_folder, "INCREMENTAL_OUTPUT", False)
+    folder = HotFolder(tmp_path / "entrada", tmp_path / "salida", workers=2)
+    for path in (folder.input_dir, folder.output_dir, folder.done_dir, folder.failed_dir):
+        path.mkdir(parents=True)
+    path = folder.input_dir / "lote.pdf"
+    path.write_bytes(b"%PDF-1.4\n%%EOF")
+
+    pools = []
+
+    def _analyze_pdf(pdf_path, executor, **kwargs):
+        pools.append(executor)
+        if len(pools) == 1:
+            # Un proceso de detección muere a mitad del PDF
+            executor.submit(os._exit, 1).result()
+        return {"pdf": pdf_path}
+
+    monkeypatch.setattr(hot_folder, "analyze_pdf", _analyze_pdf)
+    monkeypatch.setattr(
+        hot_folder, "write_pdf_outputs", lambda *a, **k: {"invoices_count": 1, "write_errors": []}
+    )
+
+    folder._start_engines()
+    try:
+        folder._process(path)
+
+        assert len(pools) == 2 and pools[0] is not pools[1]
+        assert folder._executor is pools[1]
+        assert (folder.done_dir / "lote.pdf").exists()
+        # El pool nuevo sirve para los PDF siguientes
+        assert folder._executor.submit(hot_folder._ping).result() is None
+    finally:
+        folder._executor.shutdown()
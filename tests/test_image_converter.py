@@ -0,0 +1,167 @@
+import itertools
+import subprocess
+from io import BytesIO
+
+import pikepdf
+import pytest
+from PIL import Image
+
+import image_converter
+from image_converter import extract_scan_image
+
+# Imagen de 4 × 3 con un tono distinto por píxel (filas de arriba abajo);
+# a 72 dpi cada píxel ocupa un punto de la página
+W, H = 4, 3
+PIXELS = [[10 * (row * W + col + 1) for col in range(W)] for row in range(H)]
+
+
+def _placements():
+    # Las 8 formas de apoyar la imagen sobre la página girada o espejada
+    for sa, sd in itertools.product((1, -1), repeat=2):
+        yield (sa * W, 0, 0, sd * H)
+    for sb, sc in itertools.product((1, -1), repeat=2):
+        yield (0, sb * W, sc * H, 0)
+
+
+def _make_pdf(path, a, b, c, d, rotate=0):
+    e = -min(0, a) - min(0, c)
+    f = -min(0, b) - min(0, d)
+    pdf = pikepdf.new()
+    pdf.add_blank_page(page_size=(abs(a) + abs(c), abs(b) + abs(d)))
+    page = pdf.pages[0]
+    page.Resources = pikepdf.Dictionary(XObject=pikepdf.Dictionary(Im0=pikepdf.Stream(
+        pdf,
+        bytes(v for row in PIXELS for v in row),
+        Type=pikepdf.Name.XObject,
+        Subtype=pikepdf.Name.Image,
+        Width=W,
+        Height=H,
+        ColorSpace=pikepdf.Name.DeviceGray,
+        BitsPerComponent=8,
+    )))
+    page.Contents = pdf.make_stream(f"q {a} {b} {c} {d} {e} {f} cm /Im0 Do Q".encode())
+    if rotate:
+        page.Rotate = rotate
+    pdf.save(path)
+    return (e, f)
+
+
+def _expected(a, b, c, d, e, f):
+    """
+    Cómo se ve la página: cada píxel de la imagen va a donde lo lleva la
+    matriz (espacio de la imagen: y hacia arriba, fila 0 arriba).
+    """
+    width, height = abs(a) + abs(c), abs(b) + abs(d)
+    screen = [[None] * width for _ in range(height)]
+    for row, col in itertools.product(range(H), range(W)):
+        u, v = (col + 0.5) / W, 1 - (row + 0.5) / H
+        x, y = a * u + c * v + e, b * u + d * v + f
+        screen[int(height - y)][int(x)] = PIXELS[row][col]
+    return screen
+
+
+def _screen(image):
+    gray = image.convert("L")
+    return [[gray.getpixel((x, y)) for x in range(gray.width)] for y in range(gray.height)]
+
+
+@pytest.mark.parametrize("matrix", list(_placements()))
+def test_scan_image_is_oriented_as_displayed(tmp_path, matrix):
+    path = tmp_path / "scan.pdf"
+    e, f = _make_pdf(path, *matrix)
+
+    with pikepdf.open(path) as pdf:
+        image = extract_scan_image(pdf, 1, dpi=72)
+
+    assert _screen(image) == _expected(*matrix, e, f)
+
+
+@pytest.mark.parametrize("rotate", [90, 180, 270])
+def test_page_rotation_is_applied_clockwise(tmp_path, rotate):
+    path = tmp_path / "scan.pdf"
+    matrix = (W, 0, 0, H)
+    _make_pdf(path, *matrix, rotate=rotate)
+
+    with pikepdf.open(path) as pdf:
+        image = extract_scan_image(pdf, 1, dpi=72)
+
+    expected = _expected(*matrix, 0, 0)
+    for _ in range(rotate // 90):
+        # Un cuarto de vuelta en sentido horario
+        expected = [list(row) for row in zip(*expected[::-1])]
+    assert _screen(image) == expected
+
+
+def test_page_with_text_is_left_to_poppler(tmp_path):
+    path = tmp_path / "scan.pdf"
+    _make_pdf(path, W, 0, 0, H)
+    with pikepdf.open(path, allow_overwriting_input=True) as pdf:
+        pdf.pages[0].Contents = pdf.make_stream(b"q 4 0 0 3 0 0 cm /Im0 Do Q BT ET")
+        pdf.save(path)
+
+    with pikepdf.open(path) as pdf:
+        assert extract_scan_image(pdf, 1, dpi=72) is None
+
+
+def _ppm(image):
+    buffer = BytesIO()
+    image.save(buffer, format="PPM")
+    return buffer.getvalue()
+
+
+def test_poppler_renders_through_run_tool(monkeypatch, tmp_path):
+    calls = []
+    pages = [Image.new("RGB", (5, 4), "red"), Image.new("RGB", (5, 4), "blue")]
+
+    def _run_tool(args, **kwargs):
+        calls.append(args)
+        return subprocess.CompletedProcess(args, 0, b"".join(_ppm(p) for p in pages), b"")
+
+    monkeypatch.setattr(image_converter, "_poppler_path", lambda: tmp_path)
+    monkeypatch.setattr(image_converter, "run_tool", _run_tool)
+
+    rendered = image_converter._pdftoppm("lote.pdf", 150, 3, 4)
+
+    assert calls == [[str(tmp_path / "pdftoppm"), "-r", "150", "-f", "3", "-l", "4", "lote.pdf"]]
+    assert [image.getpixel((0, 0)) for image in rendered] == [(255, 0, 0), (0, 0, 255)]
+
+
+def test_page_count_without_poppler(monkeypatch, tmp_path):
+    path = tmp_path / "lote.pdf"
+    with pikepdf.new() as pdf:
+        for _ in range(3):
+            pdf.add_blank_page(page_size=(100, 100))
+        pdf.save(path)
+
+    def _no_poppler():
+        raise RuntimeError("Poppler no encontrado")
+
+    monkeypatch.setattr(image_converter, "_poppler_path", _no_poppler)
+
+    assert image_converter.get_page_count(str(path)) == 3
+
+
+def test_scanned_pages_are_streamed_without_poppler(monkeypatch, tmp_path):
+    path = tmp_path / "lote.pdf"
+    _make_pdf(path, W, 0, 0, H)
+
+    def _no_poppler():
+        raise RuntimeError("Poppler no encontrado")
+
+    monkeypatch.setattr(image_converter, "_poppler_path", _no_poppler)
+
+    images = list(image_converter.iter_pdf_images(str(path), dpi=72, direct=True))
+
+    assert [image.size for image in images] == [(W, H)]
+
+
+def test_page_count_from_pdfinfo(monkeypatch, tmp_path):
+    # pikepdf no puede abrir el archivo: se pregunta a pdfinfo
+    output = "Producer:       escáner\nPages:          12\nEncrypted:      no\n"
+    monkeypatch.setattr(image_converter, "_poppler_path", lambda: tmp_path)
+    monkeypatch.setattr(
+        image_converter, "run_tool",
+        lambda args, **kwargs: subprocess.CompletedProcess(args, 0, output, ""),
+    )
+
+    assert image_converter.get_page_count("lote.pdf") == 12
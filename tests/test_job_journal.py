@@ -0,0 +1,98 @@
+from functools import partial
+
+import pytest
+
+import pdf_processor
+from pdf_processor import split_by_barcode
+from utils import job_journal
+from utils.job_journal import JobJournal
+
+from tests.fakes import FakeDetectors, Spec, layout, make_pages, page_index
+
+A, B = "9900000001", "9900000002"
+
+SPECS = [Spec(A, 1), Spec(None, 2), Spec(B, 1), Spec(B, 2), Spec(A, 3)]
+
+
+@pytest.fixture
+def pdf(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_journal, "JOBS_DIR", tmp_path / "jobs")
+    monkeypatch.setattr(
+        pdf_processor, "detect_page", partial(pdf_processor.detect_page, page_numbers="eager")
+    )
+    path = tmp_path / "lote.pdf"
+    path.write_bytes(b"%PDF-1.4 lote de prueba")
+    return path
+
+
+def _counting_decoder(monkeypatch, fakes):
+    decoded = []
+
+    def _decode(image, *args, **kwargs):
+        decoded.append(page_index(image))
+        return fakes._decode(image)
+
+    monkeypatch.setattr(pdf_processor, "extract_qr_and_barcode", _decode)
+    return decoded
+
+
+def test_resume_skips_journaled_pages(monkeypatch, pdf):
+    fakes = FakeDetectors(monkeypatch, SPECS)
+    expected, _, _ = split_by_barcode(make_pages(SPECS), workers=1)
+
+    # Primera ejecución cortada tras la página 3
+    with JobJournal(pdf) as journal:
+        split_by_barcode(make_pages(SPECS)[:3], workers=1, journal=journal)
+    assert sorted(JobJournal(pdf).load()) == [1, 2, 3]
+
+    decoded = _counting_decoder(monkeypatch, fakes)
+    with JobJournal(pdf) as journal:
+        documents, report, _ = split_by_barcode(make_pages(SPECS), workers=1, journal=journal)
+
+    assert decoded == [4, 5]
+    assert layout(documents) == layout(expected)
+    assert report["total_pages"] == 5
+
+
+@pytest.mark.parametrize("setting, change", [
+    ("OCR_MODE", lambda mode: "multi" if mode == "crops" else "crops"),
+    ("OCR_MIN_CONFIDENCE", lambda confidence: confidence + 1),
+    ("CACHE_ENABLED", lambda enabled: not enabled),
+    ("DIRECT_IMAGES", lambda enabled: not enabled),
+])
+def test_journal_from_other_settings_is_discarded(monkeypatch, pdf, setting, change):
+    fakes = FakeDetectors(monkeypatch, SPECS)
+    with JobJournal(pdf) as journal:
+        split_by_barcode(make_pages(SPECS)[:3], workers=1, journal=journal)
+
+    monkeypatch.setattr(job_journal, setting, change(getattr(job_journal, setting)))
+    journal = JobJournal(pdf)
+    assert journal.load() == {}
+    assert not journal.path.exists()
+
+    decoded = _counting_decoder(monkeypatch, fakes)
+    with journal:
+        split_by_barcode(make_pages(SPECS), workers=1, journal=journal)
+    assert decoded == [1, 2, 3, 4, 5]
+    assert sorted(JobJournal(pdf).load()) == [1, 2, 3, 4, 5]
+
+
+def test_journal_without_header_is_discarded(pdf):
+    journal = JobJournal(pdf)
+    journal.path.parent.mkdir(parents=True)
+    journal.path.write_text('{"index": 1}\n', encoding="utf-8")
+
+    assert journal.load() == {}
+    assert not journal.path.exists()
+
+
+def test_identical_copies_do_not_share_a_journal(pdf):
+    copy = pdf.with_name("copia.pdf")
+    copy.write_bytes(pdf.read_bytes())
+
+    with JobJournal(pdf) as journal:
+        journal.append({"index": 1})
+
+    assert JobJournal(copy).path != journal.path
+    assert JobJournal(copy).load() == {}
+    assert sorted(JobJournal(pdf).load()) == [1]
@@ -0,0 +1,19 @@
+from loguru import logger
+
+import ocr_engine
+
+
+def test_check_engine_warns_once_without_tesserocr(monkeypatch):
+    monkeypatch.setattr(ocr_engine, "tesserocr", None)
+    monkeypatch.setattr(ocr_engine, "_checked", False)
+    messages = []
+    sink = logger.add(messages.append, level="WARNING")
+    try:
+        ocr_engine.check_engine()
+        ocr_engine.check_engine()
+    finally:
+        logger.remove(sink)
+
+    assert len(messages) == 1
+    assert "tesserocr no instalado" in messages[0]
+    assert ocr_engine._get_pool() is None
@@ -0,0 +1,50 @@
+from PIL import Image
+
+from page_context import PageContext, ZoneRef
+
+ZONE = (0.8, 0.9, 1.0, 1.0)
+
+
+class FakeSource:
+    """
+    `PageRef` falso: cada región "renderizada" es lisa y del tono dado.
+    """
+
+    def __init__(self, tone: int = 200):
+        self.tone = tone
+        self.regions = []
+
+    def render(self, dpi):
+        return Image.new("L", (dpi * 8, dpi * 10), self.tone)
+
+    def render_region(self, dpi, box):
+        self.regions.append((dpi, box))
+        x0, y0, x1, y1 = box
+        return Image.new("L", (x1 - x0, y1 - y0), self.tone)
+
+
+def test_zone_is_rendered_again_at_the_requested_dpi():
+    source = FakeSource()
+    context = PageContext(Image.new("RGB", (1200, 1500)), source=source, dpi=150)
+
+    assert context.zone_ref(ZONE, 300) == ZoneRef(source, 300, (1920, 2700, 2400, 3000))
+    crop = context.zone_image(ZONE, 300)
+
+    assert crop.size == (480, 300)
+    assert crop.getpixel((0, 0)) == 200
+    assert source.regions == [(300, (1920, 2700, 2400, 3000))]
+
+
+def test_zone_is_cropped_when_already_at_that_dpi():
+    source = FakeSource()
+    image = Image.new("RGB", (2400, 3000), (10, 10, 10))
+
+    for context in (
+        PageContext(image, source=source, dpi=300),
+        PageContext(image, source=source, dpi=600),
+        PageContext(image),
+    ):
+        assert context.zone_ref(ZONE, 300) is None
+        assert context.zone_image(ZONE, 300).size == context.gray_image(ZONE).size
+
+    assert source.regions == []
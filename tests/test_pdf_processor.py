@@ -0,0 +1,330 @@
+import os
+import pickle
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import pytest
+
+import pdf_processor
+from page_context import PageContext
+from pdf_processor import split_by_barcode
+from utils.cancellation import CancelToken
+
+from tests.fakes import OFFSET, FakeDetectors, Spec, layout, make_pages, page_index
+from tests.test_page_context import FakeSource
+
+A, B, C = "9900000001", "9900000002", "9900000003"
+
+ORIGINAL = {
+    "image": pdf_processor.extract_page_number_from_image,
+    "crop": pdf_processor.extract_page_number_from_crop,
+}
+
+# A (2 págs.), B (3 págs., la última sin código ni número),
+# C (1 pág.) y una página tardía de A
+SPECS = [
+    Spec(A, 1),
+    Spec(None, 2),
+    Spec(B, 1),
+    Spec(B, 2),
+    Spec(None, None),
+    Spec(C, 1),
+    Spec(A, 3),
+]
+
+
+@pytest.fixture
+def eager(monkeypatch):
+    monkeypatch.setattr(
+        pdf_processor, "detect_page", partial(pdf_processor.detect_page, page_numbers="eager")
+    )
+
+
+def test_eager_grouping(monkeypatch, eager):
+    fakes = FakeDetectors(monkeypatch, SPECS)
+
+    documents, report, _ = split_by_barcode(make_pages(SPECS), workers=1)
+
+    assert layout(documents) == {
+        A: [(1, 1), (2, 2), (7, 3)],
+        B: [(3, 1), (4, 2), (5, 3)],   # la 5 sigue por continuidad
+        C: [(6, 1)],
+    }
+    assert fakes.footer_reads == [1, 2, 3, 4, 5, 6, 7]
+    assert report["total_pages"] == 7
+    assert report["documents_with_code"] == 5
+    assert report["documents_without_code"] == 2
+    assert [page["document"] for page in report["pages"]] == [A, A, B, B, B, C, A]
+
+
+def test_pages_before_first_code_go_to_sin_codigo(monkeypatch, eager):
+    specs = [Spec(None, 1), Spec(A, 1)]
+    FakeDetectors(monkeypatch, specs)
+
+    documents, _, _ = split_by_barcode(make_pages(specs), workers=1)
+
+    assert layout(documents) == {"SIN_CODIGO": [(1, 1)], A: [(2, 1)]}
+
+
+def test_errors_are_kept_apart(monkeypatch, eager):
+    specs = [Spec(A, 1), Spec(A, 2)]
+    fakes = FakeDetectors(monkeypatch, specs)
+
+    def _decode(image, *args, **kwargs):
+        if fakes._spec(image) is specs[1]:
+            raise RuntimeError("falla de prueba")
+        return fakes._decode(image)
+
+    monkeypatch.setattr(pdf_processor, "extract_qr_and_barcode", _decode)
+
+    documents, report, _ = split_by_barcode(make_pages(specs), workers=1)
+
+    assert [record.index for record in documents["ERROR"]] == [2]
+    assert layout(documents)[A] == [(1, 1)]
+    assert report["errors"] == ["falla de prueba"]
+
+
+@pytest.mark.parametrize("mode", ["eager", "lazy"])
+def test_parallel_detection_matches_serial(monkeypatch, mode):
+    monkeypatch.setattr(
+        pdf_processor, "detect_page", partial(pdf_processor.detect_page, page_numbers=mode)
+    )
+    specs = SPECS * 3
+    FakeDetectors(monkeypatch, specs)
+
+    serial, serial_report, _ = split_by_barcode(make_pages(specs), workers=1)
+    # Un pool de hilos ejercita la ventana y el orden de _detect_parallel
+    # sin tener que enviar los detectores falsos a otros procesos
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        parallel, parallel_report, _ = split_by_barcode(
+            make_pages(specs), workers=3, executor=pool
+        )
+
+    assert layout(parallel) == layout(serial)
+    assert parallel_report["pages"] == [
+        {**page, "seconds": parallel_page["seconds"]}
+        for page, parallel_page in zip(serial_report["pages"], parallel_report["pages"])
+    ]
+
+
+def test_pages_travel_to_the_pool_as_grayscale(monkeypatch):
+    FakeDetectors(monkeypatch, SPECS)
+    sent = []
+
+    class PicklingPool(ThreadPoolExecutor):
+        def submit(self, fn, *args):
+            if fn is pdf_processor.detect_page:
+                sent.append(args[1])
+            return super().submit(fn, *pickle.loads(pickle.dumps(args)))
+
+    pages = [image.convert("RGB") for image in make_pages(SPECS)]
+    with PicklingPool(max_workers=2) as pool:
+        documents, _, _ = split_by_barcode(pages, workers=2, executor=pool)
+
+    assert layout(documents)[A] == [(1, 1), (2, 2), (7, 3)]
+    assert all(isinstance(page, PageContext) for page in sent)
+    # Se serializa la escala de grises, no la imagen RGB
+    assert all(pickle.loads(pickle.dumps(page)).image is None for page in sent)
+
+
+def test_broken_pool_stops_the_pdf_instead_of_failing_pages(monkeypatch):
+    FakeDetectors(monkeypatch, SPECS)
+
+    class BrokenPool(ThreadPoolExecutor):
+        def submit(self, fn, *args, **kwargs):
+            future = Future()
+            future.set_exception(BrokenProcessPool("un proceso murió"))
+            return future
+
+    with BrokenPool(max_workers=1) as pool, pytest.raises(BrokenProcessPool):
+        split_by_barcode(make_pages(SPECS), workers=2, executor=pool)
+
+
+def test_lazy_reads_footers_only_for_multi_page_documents(monkeypatch):
+    fakes = FakeDetectors(monkeypatch, SPECS)
+
+    documents, report, _ = split_by_barcode(make_pages(SPECS), workers=1)
+
+    assert layout(documents) == {
+        A: [(1, 1), (2, 2), (7, 3)],
+        B: [(3, 1), (4, 2), (5, 3)],
+        C: [(6, None)],   # factura de una página: el pie no se lee
+    }
+    assert sorted(fakes.footer_reads) == [1, 2, 3, 4, 5, 7]
+    assert report["page_number_ocr"] == {"done": 6, "skipped": 1}
+
+
+@pytest.mark.parametrize("specs", [
+    # La cadena hacia atrás pasa por varias lecturas fallidas
+    [Spec(A, 1), Spec(None, 2), Spec(None, None), Spec(None, None)],
+    # Sin ningún número leído
+    [Spec(A, None), Spec(None, None), Spec(None, None)],
+    # Primera página de una factura sin número: sigue a la anterior
+    [Spec(A, 1), Spec(A, 2), Spec(B, None), Spec(B, None), Spec(None, 5)],
+    SPECS,
+])
+def test_lazy_page_numbers_match_eager(monkeypatch, specs):
+    FakeDetectors(monkeypatch, specs)
+    with monkeypatch.context() as patch:
+        patch.setattr(
+            pdf_processor, "detect_page", partial(pdf_processor.detect_page, page_numbers="eager")
+        )
+        eager, _, _ = split_by_barcode(make_pages(specs), workers=1)
+
+    fakes = FakeDetectors(monkeypatch, specs)
+    lazy, _, _ = split_by_barcode(make_pages(specs), workers=1)
+
+    multi_page = {code: pages for code, pages in layout(eager).items() if len(pages) > 1}
+    assert {code: layout(lazy)[code] for code in multi_page} == multi_page
+    # Cada pie se lee una sola vez aunque varias cadenas pasen por él
+    assert len(fakes.footer_reads) == len(set(fakes.footer_reads))
+
+
+def test_lazy_backward_chain_stops_at_a_read_number(monkeypatch):
+    specs = [Spec(A, 1), Spec(None, 2), Spec(None, None), Spec(None, None)]
+    fakes = FakeDetectors(monkeypatch, specs)
+
+    documents, _, _ = split_by_barcode(make_pages(specs), workers=1)
+
+    assert layout(documents) == {A: [(1, 1), (2, 2), (3, 3), (4, 4)]}
+    assert fakes.footer_reads == [1, 2, 3, 4]
+
+
+def test_lazy_footers_are_read_in_the_pool(monkeypatch):
+    specs = SPECS * 2
+    fakes = FakeDetectors(monkeypatch, specs)
+    main_thread = threading.get_ident()
+    readers = set()
+    read_page_number = fakes._page_number
+
+    def _page_number(image):
+        readers.add(threading.get_ident())
+        return read_page_number(image)
+
+    monkeypatch.setattr(pdf_processor, "extract_page_number_from_crop", _page_number)
+
+    serial, delivered = {}, {}
+    split_by_barcode(
+        make_pages(specs), workers=1,
+        on_document=lambda code, records: serial.update(layout({code: records})),
+    )
+    readers.clear()
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        documents, report, _ = split_by_barcode(
+            make_pages(specs), workers=3, executor=pool,
+            on_document=lambda code, records: delivered.update(layout({code: records})),
+        )
+
+    assert main_thread not in readers
+    # Última entrega de cada factura (una factura reabierta por una
+    # página tardía puede entregarse menos veces que en serie)
+    assert delivered == serial == layout(documents)
+    # El pie de la primera página de C se descartó al cerrarse C (una
+    # página): al reabrirse cuenta como una lectura fallida
+    assert report["page_number_ocr"] == {"done": 13, "skipped": 1}
+
+
+def test_lazy_keeps_footers_only_while_they_can_be_needed(monkeypatch):
+    specs = [Spec(f"99000000{n:02d}", 1) for n in range(10)]
+    FakeDetectors(monkeypatch, specs)
+    grouper = pdf_processor.PageGrouper()
+
+    held = []
+    for idx, image in enumerate(make_pages(specs), start=1):
+        grouper.add(pdf_processor.detect_page(idx, image), image)
+        held.append(len(grouper._footers))
+    documents, report = grouper.finish()
+
+    # Facturas de una página: solo el pie de la que sigue abierta
+    assert max(held) == 1
+    assert all(records[0].page_number is None for records in documents.values())
+    assert report["page_number_ocr"] == {"done": 0, "skipped": 10}
+
+
+@pytest.mark.parametrize("mode", ["eager", "lazy"])
+def test_error_pages_keep_their_order_and_footers(monkeypatch, mode):
+    monkeypatch.setattr(
+        pdf_processor, "detect_page", partial(pdf_processor.detect_page, page_numbers=mode)
+    )
+    # Los pies de las páginas con error dirían otro orden
+    specs = [Spec(A, 1), Spec(A, 9), Spec(None, 2), Spec(A, 1), Spec(None, 3)]
+    fakes = FakeDetectors(monkeypatch, specs)
+
+    def _decode(image, *args, **kwargs):
+        if page_index(image) in (2, 4):
+            raise RuntimeError("falla de prueba")
+        return fakes._decode(image)
+
+    monkeypatch.setattr(pdf_processor, "extract_qr_and_barcode", _decode)
+    documents, report, _ = split_by_barcode(make_pages(specs), workers=1)
+
+    assert layout(documents) == {
+        A: [(1, 1), (3, 2), (5, 3)],
+        "ERROR": [(2, None), (4, None)],
+    }
+    if mode == "lazy":
+        assert sorted(fakes.footer_reads) == [1, 3, 5]
+        assert report["page_number_ocr"] == {"done": 3, "skipped": 0}
+
+
+def test_failed_footer_read_uses_continuity(monkeypatch):
+    specs = [Spec(A, 1), Spec(None, 2), Spec(None, 9)]
+    fakes = FakeDetectors(monkeypatch, specs)
+
+    def _page_number(image):
+        if page_index(image) == 3:
+            raise RuntimeError("tesseract falló")
+        return fakes._page_number(image)
+
+    monkeypatch.setattr(pdf_processor, "extract_page_number_from_crop", _page_number)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        documents, _, _ = split_by_barcode(make_pages(specs), workers=2, executor=pool)
+
+    assert layout(documents) == {A: [(1, 1), (2, 2), (3, 3)]}
+
+
+@pytest.mark.parametrize("mode", ["eager", "lazy"])
+def test_adaptive_footers_are_read_at_render_dpi(monkeypatch, mode):
+    monkeypatch.setattr(
+        pdf_processor, "detect_page", partial(pdf_processor.detect_page, page_numbers=mode)
+    )
+    monkeypatch.setattr(pdf_processor, "RENDER_DPI", 300)
+    fakes = FakeDetectors(monkeypatch, SPECS)
+    # El OCR falso va debajo de la elección del recorte
+    monkeypatch.setattr(pdf_processor, "extract_page_number_from_image", ORIGINAL["image"])
+    monkeypatch.setattr(pdf_processor, "extract_page_number_from_crop", ORIGINAL["crop"])
+    monkeypatch.setattr(
+        pdf_processor, "_page_number_from_zone",
+        lambda context, zone: fakes._page_number(context.gray_image(zone)),
+    )
+    sources = [FakeSource(OFFSET + n) for n in range(1, len(SPECS) + 1)]
+    pages = [
+        PageContext(image, source=source, dpi=150, ladder=(150, 300))
+        for image, source in zip(make_pages(SPECS), sources)
+    ]
+
+    documents, _, _ = split_by_barcode(pages, workers=1)
+
+    assert layout(documents)[A] == [(1, 1), (2, 2), (7, 3)]
+    # Cada pie leído se volvió a rasterizar a 300 dpi
+    read = [n for n, source in enumerate(sources, start=1) if source.regions]
+    assert read == sorted(set(fakes.footer_reads))
+    assert all(dpi == 300 for source in sources for dpi, _ in source.regions)
+
+
+def test_cancel_only_kills_the_watched_pool():
+    with ProcessPoolExecutor(max_workers=1) as mine, ProcessPoolExecutor(max_workers=1) as other:
+        mine.submit(os.getpid).result()
+        pid = other.submit(os.getpid).result()
+        workers = list(mine._processes.values())
+
+        cancel = CancelToken()
+        cancel.watch(mine)
+        cancel.cancel()
+
+        for worker in workers:
+            worker.join(5)
+            assert not worker.is_alive()
+        assert other.submit(os.getpid).result() == pid
@@ -0,0 +1,61 @@
+import itertools
+import sqlite3
+import types
+
+import pytest
+
+from utils import result_cache
+from utils.result_cache import ResultCache
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # Reloj que siempre avanza: el orden LRU no depende de la resolución
+    ticks = itertools.count(1)
+    monkeypatch.setattr(result_cache, "time", types.SimpleNamespace(time=lambda: next(ticks)))
+
+
+def _keys(path):
+    with sqlite3.connect(str(path)) as conn:
+        return {key for (key,) in conn.execute("SELECT key FROM results")}
+
+
+def _last_used(path, key):
+    with sqlite3.connect(str(path)) as conn:
+        return conn.execute(
+            "SELECT last_used FROM results WHERE key = ?", (key,)
+        ).fetchone()[0]
+
+
+def test_eviction_keeps_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "_EVICT_EVERY", 5)
+    cache = ResultCache(tmp_path / "cache.sqlite3", max_entries=3)
+
+    for key in "abcd":
+        cache.put(key, key.upper())
+    # "a" es la más vieja pero se acaba de usar: expulsa "b" y "c"
+    assert cache.get("a") == "A"
+    cache.put("e", "E")
+
+    assert _keys(cache.path) == {"a", "d", "e"}
+    assert cache.get("b") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_hits_are_buffered_until_flush(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "_TOUCH_EVERY", 3)
+    cache = ResultCache(tmp_path / "cache.sqlite3", max_entries=100)
+    for key in "abc":
+        cache.put(key, key.upper())
+    stored = _last_used(cache.path, "a")
+
+    cache.get("a")
+    assert _last_used(cache.path, "a") == stored
+    cache.flush()
+    assert _last_used(cache.path, "a") > stored
+
+    # Al llegar a _TOUCH_EVERY aciertos pendientes se vuelcan solos
+    stored = {key: _last_used(cache.path, key) for key in "abc"}
+    for key in "abc":
+        cache.get(key)
+    assert all(_last_used(cache.path, key) > stored[key] for key in "abc")